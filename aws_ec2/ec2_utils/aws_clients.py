@@ -0,0 +1,144 @@
+# ec2_utils/aws_clients.py
+import os
+import threading
+from typing import Dict, Optional, Tuple
+import boto3
+from botocore.config import Config as BotoConfig
+from .config import config
+from .throttling import AWSThrottle
+
+def _thread_local() -> threading.local:
+    """
+    Returns storage local to the OS thread. Under gevent monkey-patching
+    ``threading.local`` is per greenlet, which would build a resource (and
+    a connection pool) for every request; greenlets of one thread take turns
+    cooperatively, so they can share one.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return threading.local()
+    if monkey.is_module_patched('threading'):
+        return monkey.get_original('threading', 'local')()
+    return threading.local()
+
+class AWSClientRegistry:
+    """
+    Process-wide registry of boto3 clients and resources.
+
+    Building a session or client costs tens of milliseconds plus a
+    credential lookup, so clients are created once per (service, region) and
+    shared. Clients are thread-safe and shared by all threads; resources are
+    not, so each OS thread gets its own (shared by its greenlets under
+    gevent). Everything is rebuilt after a fork
+    (Celery prefork, gunicorn) because connection pools must not be shared
+    between processes. Every client is metered by ``AWSThrottle``.
+    """
+
+    _lock = threading.RLock()
+    _pid: Optional[int] = None
+    _session: Optional[boto3.session.Session] = None
+    _clients: Dict[Tuple[str, str], object] = {}
+    _local = _thread_local()
+    _account_id: Optional[str] = None
+
+    @classmethod
+    def _botocore_config(cls) -> BotoConfig:
+        return BotoConfig(
+            max_pool_connections=config.aws.MAX_POOL_CONNECTIONS,
+            connect_timeout=config.aws.CONNECT_TIMEOUT,
+            read_timeout=config.aws.READ_TIMEOUT,
+            retries={'mode': 'standard', 'max_attempts': config.aws.MAX_ATTEMPTS},
+        )
+
+    @classmethod
+    def _ensure_process(cls) -> None:
+        """Drops state inherited from a parent process. Caller holds the lock."""
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._pid = pid
+            cls._session = boto3.session.Session()
+            cls._clients = {}
+            cls._local = _thread_local()
+
+    @classmethod
+    def get_client(cls, service: str, region: Optional[str] = None):
+        """
+        Returns the shared client for a service and region.
+
+        Args:
+            service: AWS service name (e.g. 'ec2', 'events')
+            region: AWS region, defaults to ``config.aws.REGION``
+        """
+        region = region or config.aws.REGION
+        key = (service, region)
+        client = cls._clients.get(key) if cls._pid == os.getpid() else None
+        if client is not None:
+            return client
+
+        # Sessions are not thread-safe, so clients are created under the lock
+        with cls._lock:
+            cls._ensure_process()
+            if key not in cls._clients:
+                client = cls._session.client(
+                    service,
+                    region_name=region,
+                    config=cls._botocore_config()
+                )
+                AWSThrottle.attach(client)
+                cls._clients[key] = client
+            return cls._clients[key]
+
+    @classmethod
+    def get_resource(cls, service: str, region: Optional[str] = None):
+        """
+        Returns this OS thread's resource for a service and region.
+
+        Args:
+            service: AWS service name (e.g. 'ec2')
+            region: AWS region, defaults to ``config.aws.REGION``
+        """
+        region = region or config.aws.REGION
+        key = (service, region)
+        with cls._lock:
+            cls._ensure_process()
+            resources = cls._local.__dict__.setdefault('resources', {})
+            if key not in resources:
+                resource = cls._session.resource(
+                    service,
+                    region_name=region,
+                    config=cls._botocore_config()
+                )
+                AWSThrottle.attach(resource.meta.client)
+                resources[key] = resource
+            return resources[key]
+
+    @classmethod
+    def get_account_id(cls) -> str:
+        """Returns the AWS account ID, calling STS only once per process lifetime."""
+        if cls._account_id is None:
+            with cls._lock:
+                if cls._account_id is None:
+                    cls._account_id = cls.get_client('sts').get_caller_identity()['Account']
+        return cls._account_id
+
+    @classmethod
+    def _after_fork(cls) -> None:
+        # The parent's lock may have been held by another thread at fork time.
+        # The account ID is kept, it doesn't change across a fork.
+        cls._lock = threading.RLock()
+        cls._pid = None
+
+    @classmethod
+    def reset(cls) -> None:
+        """Drops all cached sessions, clients and resources."""
+        with cls._lock:
+            cls._pid = None
+            cls._session = None
+            cls._clients = {}
+            cls._local = _thread_local()
+            cls._account_id = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=AWSClientRegistry._after_fork)
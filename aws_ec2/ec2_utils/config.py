@@ -1,6 +1,8 @@
 # ec2_utils/config.py
 from typing import Dict, List
 from dataclasses import dataclass
+import hashlib
+import json
 import os
 
 @dataclass
@@ -10,12 +12,32 @@ class AWSConfig:
     AMI_ID: str = 'ami-0892a9c01908fafd1'  # Ubuntu Server 20.04 LTS
     INSTANCE_TYPE: str = 't3.micro' #t2.large m5.large t2.micro t3.medium t3.micro 
     KEY_NAME: str = 'aws_00'
+    LAUNCH_CONCURRENCY: int = 8  # Maximum parallel RunInstances calls per booking
+    SHUTDOWN_DELAY_MINUTES: int = 10  # Instances of a booking are stopped this long after its start
+    RECONCILE_REGIONS: str = ''  # Comma-separated regions the reconciler sweeps (defaults to REGION)
+
+    # botocore client tuning (shared clients, see aws_clients.py)
+    MAX_POOL_CONNECTIONS: int = 32  # keep >= LAUNCH_CONCURRENCY
+    CONNECT_TIMEOUT: int = 5  # seconds
+    READ_TIMEOUT: int = 30  # seconds
+    MAX_ATTEMPTS: int = 5  # including the first attempt
+
+    def fingerprint(self) -> str:
+        """Hash of the settings that determine what a launched instance looks like."""
+        launch_settings = {
+            'region': self.REGION,
+            'ami_id': self.AMI_ID,
+            'instance_type': self.INSTANCE_TYPE,
+            'key_name': self.KEY_NAME,
+        }
+        return hashlib.sha256(json.dumps(launch_settings, sort_keys=True).encode()).hexdigest()
 
 @dataclass
 class SecurityGroupConfig:
     """Security group configuration settings"""
     NAME: str = 'TLJH-SG'
     DESCRIPTION: str = 'Security group for TLJH EC2 instances'
+    CACHE_TTL: int = 300  # seconds to trust the cached group ID and rules
     
     # Default security group rules
     INGRESS_RULES: List[Dict] = None
@@ -50,8 +72,11 @@ class JupyterConfig:
     """JupyterHub-specific configuration"""
     REQUIREMENTS_URL: str = "https://raw.githubusercontent.com/PawseySC/quantum-computing-hackathon/main/python/requirements.txt"
     ADMIN_USERNAME: str = "pawsey"
-    DEFAULT_USERS_PER_INSTANCE: int = 2
+    DEFAULT_USERS_PER_INSTANCE: int = 2  # warm pool and fallback when no PlacementConfig candidate fits
     INSTALLATION_WAIT_TIME: int = 180  # seconds
+    RUNNING_TIMEOUT: int = 600  # seconds for all instances to run and pass their status checks
+    PROVISIONING_POLL_INTERVAL: int = 15  # seconds between provisioning checks
+    READY_CALLBACK_TIMEOUT: int = 1200  # seconds to wait for instances to phone home
     
     # JupyterHub server settings
     HUB_PORT: int = 8000
@@ -61,6 +86,106 @@ class JupyterConfig:
     USER_ENV_TYPE: str = "python3"
     INSTALL_EXTENSIONS: bool = True
 
+    # Launch from a golden AMI baked by `manage.py bake_ami` when one matches
+    USE_BAKED_AMI: bool = True
+
+    # Create all users with one newusers call and one TLJH config write
+    BULK_USER_SETUP: bool = True
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the settings that end up baked into a golden AMI. An image
+        is only reused while this fingerprint (and the source AMI) match.
+        """
+        baked_settings = {
+            'requirements_url': self.REQUIREMENTS_URL,
+            'admin_username': self.ADMIN_USERNAME,
+            'user_env_type': self.USER_ENV_TYPE,
+            'install_extensions': self.INSTALL_EXTENSIONS,
+        }
+        return hashlib.sha256(json.dumps(baked_settings, sort_keys=True).encode()).hexdigest()
+
+@dataclass
+class CapacityConfig:
+    """Booking admission control against the account's EC2 vCPU quota"""
+    SLOT_MINUTES: int = 15  # matches the 15-minute step of the booking form
+    SLOTS_PER_BOOKING: int = 1  # slots a booking's instances run for, from its start
+    VCPU_QUOTA_CODE: str = 'L-1216C47A'  # Running On-Demand Standard (A, C, D, H, I, M, R, T, Z) instances
+    DEFAULT_VCPU_QUOTA: int = 32  # used while the quota can't be read
+    QUOTA_HEADROOM: float = 0.8  # share of the quota bookings may reserve
+    QUOTA_CACHE_TTL: int = 3600  # seconds to trust the cached quota
+    SUGGESTION_SLOTS: int = 96  # how far ahead to look for a free slot
+
+@dataclass
+class PlacementConfig:
+    """Per-user limits and candidate instance types for the placement planner (see placement.py)"""
+    USER_VCPUS: float = 0.5  # vCPUs guaranteed to each user
+    USER_MEMORY_GIB: float = 0.4  # memory guaranteed to each user
+    SYSTEM_VCPUS: float = 0.0  # kept free on every instance for the hub and the OS
+    SYSTEM_MEMORY_GIB: float = 0.2
+    MAX_USERS_PER_INSTANCE: int = 16  # bounds the users affected by one failed instance
+    INSTANCE_OVERHEAD: float = 0.05  # hourly price equivalent of one more instance (boot, API calls, shutdown target)
+    INSTANCE_TYPES: str = 't3.micro,t3.small,t3.medium,t3.large,t3.xlarge'  # candidates, comma-separated
+
+    # On-demand Linux prices in ap-southeast-2 (USD per hour)
+    CATALOG: Dict = None
+
+    def __post_init__(self):
+        self.CATALOG = {
+            't3.micro': {'vcpus': 2, 'memory_gib': 1, 'hourly_price': 0.0132},
+            't3.small': {'vcpus': 2, 'memory_gib': 2, 'hourly_price': 0.0264},
+            't3.medium': {'vcpus': 2, 'memory_gib': 4, 'hourly_price': 0.0528},
+            't3.large': {'vcpus': 2, 'memory_gib': 8, 'hourly_price': 0.1056},
+            't3.xlarge': {'vcpus': 4, 'memory_gib': 16, 'hourly_price': 0.2112},
+            't3.2xlarge': {'vcpus': 8, 'memory_gib': 32, 'hourly_price': 0.4224},
+            't2.micro': {'vcpus': 1, 'memory_gib': 1, 'hourly_price': 0.0146},
+            't2.large': {'vcpus': 2, 'memory_gib': 8, 'hourly_price': 0.1168},
+            'm5.large': {'vcpus': 2, 'memory_gib': 8, 'hourly_price': 0.12},
+            'm5.xlarge': {'vcpus': 4, 'memory_gib': 16, 'hourly_price': 0.24},
+            'm5.2xlarge': {'vcpus': 8, 'memory_gib': 32, 'hourly_price': 0.48},
+            'c5.xlarge': {'vcpus': 4, 'memory_gib': 8, 'hourly_price': 0.222},
+        }
+
+@dataclass
+class ThrottlingConfig:
+    """Shared AWS API rate limits and circuit breaker, kept in Redis (see throttling.py)"""
+    ENABLED: bool = True
+    REDIS_URL: str = 'redis://localhost:6379/0'
+    KEY_PREFIX: str = 'aws_throttle'
+    REDIS_TIMEOUT: float = 1.0  # seconds per Redis operation
+    REDIS_RETRY_SECONDS: int = 30  # calls go unthrottled this long after a Redis error
+
+    # Requests per second per API family, across all workers (see api_family())
+    RATES: Dict = None
+    DEFAULT_RATE: float = 5.0  # families not listed in RATES
+    BURST_SECONDS: float = 2.5  # bucket capacity in seconds of the current rate
+    MIN_RATE: float = 0.2
+    DECREASE_FACTOR: float = 0.5  # rate multiplier on a throttling error
+    RECOVERY_SECONDS: int = 60  # time to climb back from 0 to the configured rate
+    MAX_WAIT: float = 60.0  # longest a call waits for a token before failing
+
+    BREAKER_FAILURE_THRESHOLD: int = 10  # failed calls within the window that open the breaker
+    BREAKER_FAILURE_WINDOW: int = 60  # seconds
+    BREAKER_COOLDOWN: int = 120  # seconds the breaker stays open before a probe
+
+    def __post_init__(self):
+        # EC2 request rate buckets refill at 2/s for RunInstances and 5/s for other
+        # mutating calls; Describe* calls are metered separately
+        self.RATES = {
+            'ec2-run': 2.0,
+            'ec2-mutating': 5.0,
+            'ec2-describe': 20.0,
+            'eventbridge': 10.0,
+            'lambda': 10.0,
+        }
+
+@dataclass
+class WarmPoolConfig:
+    """Pool of installed, stopped instances claimed by bookings (see services/warm_pool_service.py)"""
+    SIZE: int = 0  # instances kept per AWSConfig/JupyterConfig fingerprint, 0 disables the pool
+    INSTALL_TIMEOUT: int = 3600  # seconds for a pool instance to install and stop itself
+    MAX_AGE_HOURS: int = 168  # pooled instances are replaced after this long
+
 @dataclass
 class LoggingConfig:
     """Logging configuration settings"""
@@ -71,6 +196,8 @@ class LoggingConfig:
     FILE_LOG_ENABLED: bool = True
     LOG_FILE_PREFIX: str = "ec2"
     MAX_LOG_FILES: int = 30  # Number of log files to keep
+    MAX_LOG_BYTES: int = 50 * 1024 * 1024  # Rotate when a file reaches this size
+    ROTATE_INTERVAL: int = 86400  # ... or when it is this many seconds old
 
 @dataclass
 class TaggingConfig:
@@ -90,6 +217,10 @@ class Config:
         self.aws = AWSConfig()
         self.security_group = SecurityGroupConfig()
         self.jupyter = JupyterConfig()
+        self.capacity = CapacityConfig()
+        self.placement = PlacementConfig()
+        self.warm_pool = WarmPoolConfig()
+        self.throttling = ThrottlingConfig()
         self.logging = LoggingConfig()
         self.tagging = TaggingConfig()
         
@@ -103,16 +234,49 @@ class Config:
             'AWS_AMI_ID': (self.aws, 'AMI_ID'),
             'AWS_INSTANCE_TYPE': (self.aws, 'INSTANCE_TYPE'),
             'AWS_KEY_NAME': (self.aws, 'KEY_NAME'),
+            'AWS_LAUNCH_CONCURRENCY': (self.aws, 'LAUNCH_CONCURRENCY'),
+            'AWS_MAX_POOL_CONNECTIONS': (self.aws, 'MAX_POOL_CONNECTIONS'),
+            'AWS_SHUTDOWN_DELAY_MINUTES': (self.aws, 'SHUTDOWN_DELAY_MINUTES'),
+            'AWS_RECONCILE_REGIONS': (self.aws, 'RECONCILE_REGIONS'),
             'SECURITY_GROUP_NAME': (self.security_group, 'NAME'),
+            'SECURITY_GROUP_CACHE_TTL': (self.security_group, 'CACHE_TTL'),
             'JUPYTER_REQUIREMENTS_URL': (self.jupyter, 'REQUIREMENTS_URL'),
             'JUPYTER_ADMIN_USERNAME': (self.jupyter, 'ADMIN_USERNAME'),
             'JUPYTER_USERS_PER_INSTANCE': (self.jupyter, 'DEFAULT_USERS_PER_INSTANCE'),
+            'JUPYTER_USE_BAKED_AMI': (self.jupyter, 'USE_BAKED_AMI'),
+            'JUPYTER_BULK_USER_SETUP': (self.jupyter, 'BULK_USER_SETUP'),
+            'CAPACITY_SLOTS_PER_BOOKING': (self.capacity, 'SLOTS_PER_BOOKING'),
+            'CAPACITY_DEFAULT_VCPU_QUOTA': (self.capacity, 'DEFAULT_VCPU_QUOTA'),
+            'CAPACITY_QUOTA_HEADROOM': (self.capacity, 'QUOTA_HEADROOM'),
+            'PLACEMENT_USER_VCPUS': (self.placement, 'USER_VCPUS'),
+            'PLACEMENT_USER_MEMORY_GIB': (self.placement, 'USER_MEMORY_GIB'),
+            'PLACEMENT_MAX_USERS_PER_INSTANCE': (self.placement, 'MAX_USERS_PER_INSTANCE'),
+            'PLACEMENT_INSTANCE_OVERHEAD': (self.placement, 'INSTANCE_OVERHEAD'),
+            'PLACEMENT_INSTANCE_TYPES': (self.placement, 'INSTANCE_TYPES'),
+            'AWS_THROTTLE_ENABLED': (self.throttling, 'ENABLED'),
+            'AWS_THROTTLE_REDIS_URL': (self.throttling, 'REDIS_URL'),
+            'AWS_THROTTLE_MAX_WAIT': (self.throttling, 'MAX_WAIT'),
+            'AWS_BREAKER_FAILURE_THRESHOLD': (self.throttling, 'BREAKER_FAILURE_THRESHOLD'),
+            'AWS_BREAKER_COOLDOWN': (self.throttling, 'BREAKER_COOLDOWN'),
+            'WARM_POOL_SIZE': (self.warm_pool, 'SIZE'),
+            'WARM_POOL_MAX_AGE_HOURS': (self.warm_pool, 'MAX_AGE_HOURS'),
             'LOG_LEVEL': (self.logging, 'LOG_LEVEL'),
-            'LOG_DIR': (self.logging, 'LOG_DIR')
+            'LOG_DIR': (self.logging, 'LOG_DIR'),
+            'LOG_MAX_FILES': (self.logging, 'MAX_LOG_FILES'),
+            'LOG_MAX_BYTES': (self.logging, 'MAX_LOG_BYTES'),
+            'LOG_ROTATE_INTERVAL': (self.logging, 'ROTATE_INTERVAL')
         }
         
         for env_var, (config_obj, attr_name) in env_map.items():
             if env_value := os.getenv(env_var):
+                # Keep the declared type of numeric settings (e.g. users per instance)
+                current = getattr(config_obj, attr_name)
+                if isinstance(current, bool):
+                    env_value = env_value.lower() in ('1', 'true', 'yes', 'on')
+                elif isinstance(current, int):
+                    env_value = int(env_value)
+                elif isinstance(current, float):
+                    env_value = float(env_value)
                 setattr(config_obj, attr_name, env_value)
 
     @property
@@ -121,7 +285,7 @@ class Config:
         tags = self.tagging.DEFAULT_TAGS.copy()
         tags.update({
             'Service': 'JupyterHub',
-            'CreatedAt': '${timestamp}'  # This will be replaced at runtime
+            'CreatedAt': '${timestamp}'  # Replaced with the launch timestamp by EC2InstanceManager
         })
         return tags
 
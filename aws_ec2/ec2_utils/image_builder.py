@@ -0,0 +1,82 @@
+# ec2_utils/image_builder.py
+import logging
+from .config import config
+
+class GoldenImageBuilder:
+    """
+    Builds golden AMIs: launches a builder instance with a bake script,
+    waits for the script to shut the instance down, snapshots it into an
+    AMI and terminates the builder.
+    """
+
+    def __init__(self, ec2_resource, logger: logging.Logger):
+        self.ec2 = ec2_resource
+        self.client = ec2_resource.meta.client
+        self.logger = logger
+
+    def build(self,
+              bake_script: str,
+              source_ami_id: str,
+              instance_type: str,
+              key_name: str,
+              security_group_id: str,
+              image_name: str,
+              timeout_minutes: int = 60) -> str:
+        """
+        Bakes an AMI from a source AMI.
+
+        Args:
+            bake_script: User data that prepares the image and then shuts down
+            source_ami_id: AMI to start from
+            instance_type: Builder instance type
+            key_name: SSH key pair name
+            security_group_id: Security group ID
+            image_name: Name for the new AMI (and the builder instance)
+            timeout_minutes: Maximum time for the bake script to finish
+
+        Returns:
+            str: ID of the new AMI
+        """
+        response = self.client.run_instances(
+            ImageId=source_ami_id,
+            MinCount=1,
+            MaxCount=1,
+            InstanceType=instance_type,
+            KeyName=key_name,
+            UserData=bake_script,
+            SecurityGroupIds=[security_group_id],
+            # The bake script ends with a shutdown; stop rather than terminate
+            InstanceInitiatedShutdownBehavior='stop',
+            TagSpecifications=[{
+                'ResourceType': 'instance',
+                'Tags': [
+                    {'Key': 'Name', 'Value': image_name},
+                    {'Key': 'Purpose', 'Value': 'ami-bake'}
+                ] + [{'Key': key, 'Value': str(value)} for key, value in config.tagging.DEFAULT_TAGS.items()]
+            }]
+        )
+        instance_id = response['Instances'][0]['InstanceId']
+        self.logger.info(f"Launched builder instance {instance_id} from {source_ami_id}")
+
+        try:
+            self.client.get_waiter('instance_stopped').wait(
+                InstanceIds=[instance_id],
+                WaiterConfig={'Delay': 30, 'MaxAttempts': timeout_minutes * 2}
+            )
+            self.logger.info(f"Builder instance {instance_id} finished baking, creating image")
+
+            image_id = self.client.create_image(
+                InstanceId=instance_id,
+                Name=image_name,
+                Description=f"TLJH golden image baked from {source_ami_id}"
+            )['ImageId']
+            self.client.get_waiter('image_available').wait(
+                ImageIds=[image_id],
+                WaiterConfig={'Delay': 15, 'MaxAttempts': 240}
+            )
+            self.logger.info(f"Image {image_id} is available")
+            return image_id
+
+        finally:
+            self.client.terminate_instances(InstanceIds=[instance_id])
+            self.logger.info(f"Terminated builder instance {instance_id}")
@@ -1,36 +1,118 @@
 # ec2_utils/instance_manager.py
 from typing import List, Tuple, Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import time
 from datetime import datetime, timedelta
 import logging
-import boto3
 import json
 import pytz
+import re
+from botocore.exceptions import ClientError
+from .aws_clients import AWSClientRegistry
+from .config import config
+
+# DescribeInstances accepts up to 1000 instance IDs per request
+DESCRIBE_BATCH_SIZE = 1000
+# ... DescribeInstanceStatus up to 100
+STATUS_BATCH_SIZE = 100
+# ... and up to 200 values per filter
+FILTER_BATCH_SIZE = 200
+# Largest page of a filtered DescribeInstances call
+DESCRIBE_PAGE_SIZE = 1000
+# CreateTags and TerminateInstances take up to 1000 instance IDs per request
+MUTATE_BATCH_SIZE = 1000
+
+# Instance states that mean an instance is gone for good
+GONE_INSTANCE_STATES = ('shutting-down', 'terminated')
+
+# Scheduled shutdown via EventBridge -> Lambda
+SHUTDOWN_LAMBDA_NAME = 'stop-ec2-instance'
+SHUTDOWN_RULE_PREFIX = 'shutdown-'
+SHUTDOWN_PERMISSION_SID = 'EventBridgeShutdownRules'
+SHUTDOWN_TARGET_BATCH_SIZE = 250  # instance IDs per target Input (8 KB limit)
+MAX_TARGETS_PER_RULE = 5
+
+
+class InstanceLaunchError(Exception):
+    """
+    Raised when one or more instances of a batch failed to launch.
+
+    Instances that did launch are kept in ``instances`` (in request order) so
+    the caller can track or clean them up; ``failures`` maps the 1-based
+    position of each failed config to the exception it raised.
+    """
+
+    def __init__(self, instances: List[Tuple], failures: Dict[int, Exception]):
+        self.instances = instances
+        self.failures = failures
+        super().__init__(
+            f"{len(failures)} of {len(instances) + len(failures)} instances failed to launch: "
+            + ", ".join(f"#{i}: {e}" for i, e in sorted(failures.items()))
+        )
+
+
+class InstanceGoneError(Exception):
+    """
+    Raised for a client token whose instance was already terminated. EC2
+    would return that instance again for the token, so a new one is needed.
+    """
+
 
 class EC2InstanceManager:
+    # Set once the shared Lambda permission for shutdown rules is known to exist
+    _shutdown_permission_ready = False
+
     def __init__(self, ec2_resource, security_group_manager, logger: logging.Logger):
         self.ec2 = ec2_resource
         self.security_group_manager = security_group_manager
         self.logger = logger
         self.timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        self.events_client = boto3.client('events')
-        self.lambda_client = boto3.client('lambda')
+        region = self.ec2.meta.client.meta.region_name
+        self.events_client = AWSClientRegistry.get_client('events', region)
+        self.lambda_client = AWSClientRegistry.get_client('lambda', region)
         
         # Define the application timezone
         self.app_timezone = pytz.timezone('Australia/Perth')
 
     def schedule_instance_shutdown(self, instance_id: str, shutdown_delay_minutes: int = 10) -> bool:
         """
-        Schedules an instance to shut down after specified minutes using EventBridge.
-        Handles timezone conversion from local time (Australia/Perth) to UTC.
-        
+        Schedules a single instance to shut down after specified minutes.
+
         Args:
             instance_id: EC2 instance ID
             shutdown_delay_minutes: Minutes until shutdown
-            
+
         Returns:
             bool: True if scheduling successful
         """
+        return self.schedule_booking_shutdown(instance_id, [instance_id], shutdown_delay_minutes)
+
+    def schedule_booking_shutdown(self,
+                                  schedule_name: str,
+                                  instance_ids: List[str],
+                                  shutdown_delay_minutes: int = 10) -> bool:
+        """
+        Schedules a group of instances (normally one booking) to shut down
+        after specified minutes, with a single EventBridge rule.
+        Handles timezone conversion from local time (Australia/Perth) to UTC.
+
+        The Lambda permission is one shared statement covering every
+        ``shutdown-*`` rule, so the function's resource policy no longer
+        grows with each booking. Expired rules are removed by
+        ``cleanup_expired_shutdown_rules``.
+
+        Args:
+            schedule_name: Identifies the group in the rule name (e.g. "booking-42")
+            instance_ids: EC2 instance IDs to stop
+            shutdown_delay_minutes: Minutes until shutdown
+
+        Returns:
+            bool: True if scheduling successful
+        """
+        if not instance_ids:
+            return True
+
         try:
             # Get current time in application timezone
             local_now = datetime.now(self.app_timezone)
@@ -44,7 +126,7 @@ class EC2InstanceManager:
             # Create the cron expression using UTC time
             cron_expression = f"cron({utc_shutdown_time.minute} {utc_shutdown_time.hour} {utc_shutdown_time.day} {utc_shutdown_time.month} ? {utc_shutdown_time.year})"
             
-            rule_name = f"shutdown-{instance_id}-{self.timestamp}"
+            rule_name = f"{SHUTDOWN_RULE_PREFIX}{schedule_name}-{self.timestamp}"[:64]
             
             self.logger.info(f"Creating EventBridge rule for local time {local_shutdown_time} (UTC: {utc_shutdown_time})")
             self.logger.info(f"Using cron expression: {cron_expression}")
@@ -54,115 +136,428 @@ class EC2InstanceManager:
                 Name=rule_name,
                 ScheduleExpression=cron_expression,
                 State='ENABLED',
-                Description=f'Auto shutdown rule for instance {instance_id}'
+                Description=f'Auto shutdown rule for {schedule_name} ({len(instance_ids)} instances)'
             )
             
             rule_arn = response['RuleArn']
             self.logger.info(f"EventBridge rule created: {rule_arn}")
             
             # Get Lambda function ARN
-            lambda_function_name = 'stop-ec2-instance'
-            lambda_arn = f'arn:aws:lambda:{self.ec2.meta.client.meta.region_name}:{self.get_account_id()}:function:{lambda_function_name}'
+            region = self.ec2.meta.client.meta.region_name
+            lambda_arn = f'arn:aws:lambda:{region}:{self.get_account_id()}:function:{SHUTDOWN_LAMBDA_NAME}'
             
-            # Add permission for EventBridge to invoke Lambda
-            try:
-                self.lambda_client.add_permission(
-                    FunctionName=lambda_function_name,
-                    StatementId=f'EventBridge-{rule_name}',
-                    Action='lambda:InvokeFunction',
-                    Principal='events.amazonaws.com',
-                    SourceArn=rule_arn
-                )
-                self.logger.info(f"Added permission for EventBridge to invoke Lambda function")
-            except self.lambda_client.exceptions.ResourceConflictException:
-                # Permission might already exist, which is fine
-                self.logger.info("Lambda permission already exists or conflicts - continuing")
-            
-            # Create target for stopping the instance
-            target_response = self.events_client.put_targets(
-                Rule=rule_name,
-                Targets=[{
-                    'Id': f'ShutdownTarget-{instance_id}',
+            self.ensure_shutdown_permission()
+            
+            # One target per chunk of instances keeps each Input under the
+            # EventBridge size limit
+            targets = [
+                {
+                    'Id': f'ShutdownTarget-{i}',
                     'Arn': lambda_arn,
                     'Input': json.dumps({
-                        "instance_id": instance_id
+                        "instance_ids": instance_ids[start:start + SHUTDOWN_TARGET_BATCH_SIZE]
                     })
-                }]
-            )
+                }
+                for i, start in enumerate(range(0, len(instance_ids), SHUTDOWN_TARGET_BATCH_SIZE), 1)
+            ]
+            if len(targets) > MAX_TARGETS_PER_RULE:
+                raise ValueError(f"Too many instances for one shutdown rule: {len(instance_ids)}")
+
+            target_response = self.events_client.put_targets(Rule=rule_name, Targets=targets)
+            if target_response.get('FailedEntryCount'):
+                raise RuntimeError(f"Failed to create shutdown targets: {target_response['FailedEntries']}")
             
-            self.logger.info(f"EventBridge target created: {target_response}")
-            self.logger.info(f"Scheduled shutdown for instance {instance_id} at {local_shutdown_time} local time")
+            self.logger.info(
+                f"Scheduled shutdown for {len(instance_ids)} instances of {schedule_name} "
+                f"at {local_shutdown_time} local time"
+            )
             return True
             
         except Exception as e:
             self.logger.error(f"Error scheduling instance shutdown: {str(e)}", exc_info=True)
             return False
 
+    def ensure_shutdown_permission(self) -> None:
+        """
+        Allows EventBridge to invoke the shutdown Lambda from any ``shutdown-*``
+        rule. Done once per process; an existing statement is fine.
+        """
+        if EC2InstanceManager._shutdown_permission_ready:
+            return
+
+        region = self.ec2.meta.client.meta.region_name
+        try:
+            self.lambda_client.add_permission(
+                FunctionName=SHUTDOWN_LAMBDA_NAME,
+                StatementId=SHUTDOWN_PERMISSION_SID,
+                Action='lambda:InvokeFunction',
+                Principal='events.amazonaws.com',
+                SourceArn=f'arn:aws:events:{region}:{self.get_account_id()}:rule/{SHUTDOWN_RULE_PREFIX}*'
+            )
+            self.logger.info("Added permission for EventBridge to invoke Lambda function")
+        except self.lambda_client.exceptions.ResourceConflictException:
+            # Permission already exists, which is fine
+            self.logger.info("Lambda permission already exists - continuing")
+        EC2InstanceManager._shutdown_permission_ready = True
+
+    def cleanup_expired_shutdown_rules(self,
+                                       grace_minutes: int = 60,
+                                       max_rules: int = 100) -> int:
+        """
+        Deletes shutdown rules whose schedule has passed, together with their
+        targets, and removes the per-rule Lambda permission statements left
+        behind by older versions.
+
+        Args:
+            grace_minutes: How long after firing a rule is kept
+            max_rules: Upper bound of rules deleted per call
+
+        Returns:
+            int: Number of rules deleted
+        """
+        cutoff = datetime.now(pytz.UTC) - timedelta(minutes=grace_minutes)
+        live_rules = set()
+        expired_rules = []
+
+        paginator = self.events_client.get_paginator('list_rules')
+        for page in paginator.paginate(NamePrefix=SHUTDOWN_RULE_PREFIX):
+            for rule in page['Rules']:
+                fire_time = self._parse_cron_time(rule.get('ScheduleExpression', ''))
+                if fire_time and fire_time < cutoff and len(expired_rules) < max_rules:
+                    expired_rules.append(rule['Name'])
+                else:
+                    live_rules.add(rule['Name'])
+
+        deleted = 0
+        for rule_name in expired_rules:
+            try:
+                target_ids = [
+                    target['Id']
+                    for target in self.events_client.list_targets_by_rule(Rule=rule_name)['Targets']
+                ]
+                if target_ids:
+                    self.events_client.remove_targets(Rule=rule_name, Ids=target_ids)
+                self.events_client.delete_rule(Name=rule_name)
+                deleted += 1
+            except ClientError as e:
+                self.logger.warning(f"Error deleting shutdown rule {rule_name}: {e}")
+                live_rules.add(rule_name)
+
+        removed_statements = self._remove_stale_permissions(live_rules)
+        self.logger.info(
+            f"Deleted {deleted} expired shutdown rules and {removed_statements} stale Lambda permissions"
+        )
+        return deleted
+
+    def _remove_stale_permissions(self, live_rules: set, max_statements: int = 100) -> int:
+        """Removes legacy per-rule ``EventBridge-shutdown-*`` statements whose rule is gone."""
+        try:
+            policy = json.loads(
+                self.lambda_client.get_policy(FunctionName=SHUTDOWN_LAMBDA_NAME)['Policy']
+            )
+        except self.lambda_client.exceptions.ResourceNotFoundException:
+            return 0
+
+        legacy_prefix = f'EventBridge-{SHUTDOWN_RULE_PREFIX}'
+        stale = [
+            statement['Sid']
+            for statement in policy.get('Statement', [])
+            if statement.get('Sid', '').startswith(legacy_prefix)
+            and statement['Sid'][len('EventBridge-'):] not in live_rules
+        ][:max_statements]
+
+        removed = 0
+        for statement_id in stale:
+            try:
+                self.lambda_client.remove_permission(
+                    FunctionName=SHUTDOWN_LAMBDA_NAME,
+                    StatementId=statement_id
+                )
+                removed += 1
+            except ClientError as e:
+                self.logger.warning(f"Error removing Lambda permission {statement_id}: {e}")
+        return removed
+
+    @staticmethod
+    def _parse_cron_time(schedule_expression: str) -> Optional[datetime]:
+        """Returns the UTC fire time of a one-off ``cron(M H D Mo ? Y)`` expression."""
+        match = re.fullmatch(r'cron\((\d+) (\d+) (\d+) (\d+) \? (\d+)\)', schedule_expression)
+        if not match:
+            return None
+        minute, hour, day, month, year = (int(value) for value in match.groups())
+        return datetime(year, month, day, hour, minute, tzinfo=pytz.UTC)
+
     def get_account_id(self) -> str:
-        """Get the current AWS account ID"""
-        sts = boto3.client('sts')
-        return sts.get_caller_identity()['Account']
+        """Get the current AWS account ID (memoized per process)"""
+        return AWSClientRegistry.get_account_id()
 
-    def create_instances(self, 
+    def create_instances(self,
                         instance_configs: List[Dict],
                         ami_id: str,
                         instance_type: str,
                         key_name: str,
-                        security_group_id: str) -> List[Tuple]:
+                        security_group_id: str,
+                        max_workers: Optional[int] = None,
+                        schedule_name: Optional[str] = None,
+                        tags: Optional[Dict[str, str]] = None,
+                        shutdown_delay_minutes: Optional[int] = None) -> List[Tuple]:
         """
         Creates EC2 instances based on provided configurations.
-        
+
+        Launches run concurrently on a bounded thread pool; results keep the
+        order of ``instance_configs``. All launched instances (including
+        those of a partially failed batch) then share one shutdown schedule.
+
         Args:
             instance_configs: List of configurations for each instance
             ami_id: AMI ID to use
-            instance_type: EC2 instance type
+            instance_type: EC2 instance type for configs without an ``instance_type``
             key_name: SSH key pair name
             security_group_id: Security group ID
-            
+            max_workers: Maximum concurrent launches (defaults to config)
+            schedule_name: Name for the shared shutdown rule (e.g. "booking-42")
+            tags: Extra instance tags (e.g. ``{'BookingId': '42'}``)
+            shutdown_delay_minutes: Minutes from launch to the scheduled
+                shutdown (defaults to ``config.aws.SHUTDOWN_DELAY_MINUTES``)
+
         Returns:
             List[Tuple]: List of (instance, users, admin_credentials) tuples
+
+        Raises:
+            InstanceLaunchError: If any launch failed; carries the instances
+                that were launched successfully.
         """
+        if max_workers is None:
+            max_workers = config.aws.LAUNCH_CONCURRENCY
+        max_workers = max(1, min(max_workers, len(instance_configs) or 1))
+
+        self.logger.info(
+            f"Launching {len(instance_configs)} instances with concurrency {max_workers}"
+        )
+
+        instance_tags = {**config.instance_tags, 'CreatedAt': self.timestamp, **(tags or {})}
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ec2-launch') as executor:
+            # Each launch runs in a copy of the caller's context so its log
+            # records keep the booking/task correlation ids
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._launch_instance, i, instance_config,
+                    ami_id, instance_type, key_name, security_group_id, instance_tags
+                )
+                for i, instance_config in enumerate(instance_configs, 1)
+            ]
+
         instances = []
-        
-        for i, config in enumerate(instance_configs, 1):
+        failures = {}
+        for i, (future, instance_config) in enumerate(zip(futures, instance_configs), 1):
             try:
-                self.logger.info(f"Creating EC2 instance {i}")
-                
-                instance = self.ec2.create_instances(
-                    ImageId=ami_id,
-                    MinCount=1,
-                    MaxCount=1,
-                    InstanceType=instance_type,
-                    KeyName=key_name,
-                    UserData=config['user_data'],
-                    SecurityGroupIds=[security_group_id],
-                    TagSpecifications=[{
-                        'ResourceType': 'instance',
-                        'Tags': [{
-                            'Key': 'Name',
-                            'Value': f'TLJH-Instance-{i}-{self.timestamp}'
-                        }]
-                    }]
-                )[0]
-
-                # Schedule instance shutdown
-                if not self.schedule_instance_shutdown(instance.id):
-                    self.logger.warning(f"Failed to schedule shutdown for instance {instance.id}")
-                
-                instances.append((
-                    instance,
-                    config['users'],
-                    config['admin_credentials']
-                ))
-                
-                self.logger.info(f"Created instance {i} with ID: {instance.id}")
-                
+                description = future.result()
             except Exception as e:
                 self.logger.error(f"Error creating instance {i}: {e}")
-                raise
-                
+                failures[i] = e
+                continue
+
+            # Seed the resource with the RunInstances description so reading
+            # its state or launch time doesn't cost a DescribeInstances call
+            instance = self.ec2.Instance(description['InstanceId'])
+            instance.meta.data = description
+            instances.append((
+                instance,
+                instance_config['users'],
+                instance_config['admin_credentials']
+            ))
+
+        launched_ids = [instance.id for instance, _, _ in instances]
+        if shutdown_delay_minutes is None:
+            shutdown_delay_minutes = config.aws.SHUTDOWN_DELAY_MINUTES
+        if not self.schedule_booking_shutdown(schedule_name or 'batch', launched_ids, shutdown_delay_minutes):
+            self.logger.warning(f"Failed to schedule shutdown for instances {launched_ids}")
+
+        if failures:
+            raise InstanceLaunchError(instances, failures)
+
+        return instances
+
+    def _launch_instance(self,
+                         index: int,
+                         instance_config: Dict,
+                         ami_id: str,
+                         instance_type: str,
+                         key_name: str,
+                         security_group_id: str,
+                         tags: Dict[str, str]) -> Dict:
+        """
+        Launches a single instance.
+
+        Runs on a worker thread, so it only uses the (thread-safe) low-level
+        clients and returns the instance description from the RunInstances
+        response rather than a resource object.
+        """
+        self.logger.info(f"Creating EC2 instance {index}")
+
+        # With a client token a repeated request returns the instance it already launched
+        idempotency = {'ClientToken': instance_config['client_token']} if instance_config.get('client_token') else {}
+
+        response = self.ec2.meta.client.run_instances(
+            **idempotency,
+            ImageId=ami_id,
+            MinCount=1,
+            MaxCount=1,
+            InstanceType=instance_config.get('instance_type', instance_type),
+            KeyName=key_name,
+            UserData=instance_config['user_data'],
+            SecurityGroupIds=[security_group_id],
+            TagSpecifications=[{
+                'ResourceType': 'instance',
+                'Tags': [{
+                    'Key': 'Name',
+                    'Value': f'TLJH-Instance-{index}-{self.timestamp}'
+                }] + [{'Key': key, 'Value': str(value)} for key, value in tags.items()]
+            }]
+        )
+        description = response['Instances'][0]
+
+        self.logger.info(f"Created instance {index} with ID: {description['InstanceId']}")
+        return description
+
+    def find_instances_by_client_token(self, client_tokens: List[str]) -> Dict[str, Dict]:
+        """
+        Looks up instances launched with the given RunInstances client
+        tokens, e.g. by an attempt that died before recording them.
+
+        Args:
+            client_tokens: Client tokens passed to RunInstances
+
+        Returns:
+            Dict[str, Dict]: Mapping of client token to instance description
+        """
+        found = {}
+        paginator = self.ec2.meta.client.get_paginator('describe_instances')
+        for start in range(0, len(client_tokens), FILTER_BATCH_SIZE):
+            chunk = client_tokens[start:start + FILTER_BATCH_SIZE]
+            for page in paginator.paginate(Filters=[{'Name': 'client-token', 'Values': chunk}]):
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        found[instance['ClientToken']] = instance
+        return found
+
+    def describe_tagged_instances(self, tags: Dict[str, str], region: Optional[str] = None) -> List[Dict]:
+        """
+        Lists every instance carrying all of ``tags`` in one paginated sweep.
+        EC2 applies the tag filter and returns ``DESCRIBE_PAGE_SIZE``
+        instances per page, so the number of requests stays flat whether
+        there are 10 or 10,000 instances.
+
+        Args:
+            tags: Tags an instance must carry (e.g. ``config.tagging.DEFAULT_TAGS``)
+            region: Region to sweep (defaults to the client's region)
+
+        Returns:
+            List[Dict]: ``{'instance_id', 'state', 'public_dns', 'instance_type',
+            'launch_time', 'client_token', 'tags'}`` per instance
+        """
+        client = AWSClientRegistry.get_client('ec2', region) if region else self.ec2.meta.client
+        filters = [{'Name': f'tag:{key}', 'Values': [str(value)]} for key, value in tags.items()]
+
+        instances = []
+        paginator = client.get_paginator('describe_instances')
+        for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': DESCRIBE_PAGE_SIZE}):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    instances.append({
+                        'instance_id': instance['InstanceId'],
+                        'state': instance['State']['Name'],
+                        'public_dns': instance.get('PublicDnsName', ''),
+                        'instance_type': instance.get('InstanceType', ''),
+                        'launch_time': instance.get('LaunchTime'),
+                        'client_token': instance.get('ClientToken', ''),
+                        'tags': {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+                    })
         return instances
 
+    def tag_instances(self, instance_ids: List[str], tags: Dict[str, str], region: Optional[str] = None) -> None:
+        """Adds the same tags to many instances, ``MUTATE_BATCH_SIZE`` per request."""
+        client = AWSClientRegistry.get_client('ec2', region) if region else self.ec2.meta.client
+        for start in range(0, len(instance_ids), MUTATE_BATCH_SIZE):
+            client.create_tags(
+                Resources=instance_ids[start:start + MUTATE_BATCH_SIZE],
+                Tags=[{'Key': key, 'Value': str(value)} for key, value in tags.items()]
+            )
+
+    def terminate_instances(self, instance_ids: List[str], region: Optional[str] = None) -> None:
+        """Terminates many instances, ``MUTATE_BATCH_SIZE`` per request."""
+        client = AWSClientRegistry.get_client('ec2', region) if region else self.ec2.meta.client
+        for start in range(0, len(instance_ids), MUTATE_BATCH_SIZE):
+            client.terminate_instances(InstanceIds=instance_ids[start:start + MUTATE_BATCH_SIZE])
+        self.logger.info(f"Terminated {len(instance_ids)} instances: {instance_ids}")
+
+    def describe_instance_states(self, instance_ids: List[str], include_status: bool = False) -> Dict[str, Dict]:
+        """
+        Fetches the current state of many instances with as few requests as
+        possible: IDs are sent in chunks of ``DESCRIBE_BATCH_SIZE`` and each
+        chunk is paginated.
+
+        IDs that EC2 does not know about (yet, or any more) are left out of
+        the result rather than failing the whole chunk.
+
+        Args:
+            instance_ids: EC2 instance IDs
+            include_status: Also fetch the status checks of running instances
+                with DescribeInstanceStatus (``STATUS_BATCH_SIZE`` IDs per call)
+
+        Returns:
+            Dict[str, Dict]: Mapping of instance ID to ``{'state', 'public_dns'}``,
+            plus ``status_ok`` (instance and system checks both passed) if
+            ``include_status`` is set
+        """
+        states = {}
+        instance_ids = list(dict.fromkeys(instance_ids))
+
+        for start in range(0, len(instance_ids), DESCRIBE_BATCH_SIZE):
+            for page in self._describe_pages('describe_instances', instance_ids[start:start + DESCRIBE_BATCH_SIZE]):
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        states[instance['InstanceId']] = {
+                            'state': instance['State']['Name'],
+                            'public_dns': instance.get('PublicDnsName', '')
+                        }
+
+        if include_status:
+            running = [instance_id for instance_id, info in states.items() if info['state'] == 'running']
+            for info in states.values():
+                info['status_ok'] = False
+            for start in range(0, len(running), STATUS_BATCH_SIZE):
+                for page in self._describe_pages('describe_instance_status', running[start:start + STATUS_BATCH_SIZE]):
+                    for status in page['InstanceStatuses']:
+                        states[status['InstanceId']]['status_ok'] = (
+                            status['InstanceStatus']['Status'] == 'ok'
+                            and status['SystemStatus']['Status'] == 'ok'
+                        )
+
+        return states
+
+    def _describe_pages(self, operation: str, chunk: List[str]) -> List[Dict]:
+        """
+        Returns all pages of a paginated describe call for a chunk of IDs.
+        IDs that EC2 reports as not found are dropped and the call retried
+        with the rest.
+        """
+        paginator = self.ec2.meta.client.get_paginator(operation)
+        while chunk:
+            try:
+                return list(paginator.paginate(InstanceIds=chunk))
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+                    raise
+                missing = set(re.findall(r'i-[0-9a-f]+', e.response['Error']['Message']))
+                if not missing & set(chunk):
+                    raise
+                self.logger.warning(f"Instances not found, skipping: {sorted(missing)}")
+                chunk = [instance_id for instance_id in chunk if instance_id not in missing]
+        return []
+
     def wait_for_instances(self, instances: List[Tuple], timeout: int = 300) -> bool:
         """
         Waits for instances to be in running state and ready for use.
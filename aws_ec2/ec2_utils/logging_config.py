@@ -1,65 +1,323 @@
- 
+import atexit
+import glob
+import gzip
+import json
 import logging
 import os
-from datetime import datetime
-from typing import Optional
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+from .config import config
+
+# Correlation ids stamped on every record, see ``log_context``
+booking_id_var: ContextVar[Optional[str]] = ContextVar('booking_id', default=None)
+task_id_var: ContextVar[Optional[str]] = ContextVar('task_id', default=None)
+
+_CONTEXT_VARS = {'booking_id': booking_id_var, 'task_id': task_id_var}
+
+def bind_log_context(**ids) -> Dict:
+    """
+    Sets correlation ids (``booking_id``, ``task_id``) for the current
+    context. Returns the tokens to pass to ``reset_log_context``.
+    """
+    return {
+        name: _CONTEXT_VARS[name].set(str(value))
+        for name, value in ids.items() if value is not None
+    }
+
+def reset_log_context(tokens: Dict) -> None:
+    """Restores the correlation ids replaced by ``bind_log_context``."""
+    for name, token in tokens.items():
+        _CONTEXT_VARS[name].reset(token)
+
+@contextmanager
+def log_context(**ids):
+    """
+    Tags every record logged inside the block with the given ids.
+
+    Example:
+        with log_context(booking_id=booking.id):
+            BookingService.create_instances(...)
+    """
+    tokens = bind_log_context(**ids)
+    try:
+        yield
+    finally:
+        reset_log_context(tokens)
+
+class _ContextFilter(logging.Filter):
+    """Copies the correlation ids onto the record in the calling thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.booking_id = booking_id_var.get()
+        record.task_id = task_id_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'booking_id': getattr(record, 'booking_id', None),
+            'task_id': getattr(record, 'task_id', None),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotates the log file by size or age, gzips rotated files in a background
+    thread and keeps at most ``max_files`` compressed files per prefix.
+
+    Each process writes its own ``{prefix}_{pid}.jsonl`` so that processes
+    never rename a file another one is still writing to. Files left behind
+    by processes that have exited (recycled gunicorn workers, Celery
+    children) are compressed on startup and on every rollover, so they
+    count toward ``max_files`` too. This assumes the processes sharing the
+    log directory share a PID namespace.
+    """
+
+    def __init__(self, log_dir: str, prefix: str, max_bytes: int,
+                 rotate_interval: int, max_files: int):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.rotate_interval = rotate_interval
+        self.max_files = max_files
+        self._pid = os.getpid()
+        super().__init__(self._path_for_pid(), maxBytes=max_bytes, delay=True)
+        self.rollover_at = time.time() + rotate_interval
+        self._start_archiving()
+
+    def _path_for_pid(self) -> str:
+        return os.path.abspath(os.path.join(self.log_dir, f"{self.prefix}_{os.getpid()}.jsonl"))
+
+    def _rotated_path(self, pid: int) -> str:
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        return os.path.abspath(os.path.join(self.log_dir, f"{self.prefix}_{pid}_{timestamp}.jsonl"))
+
+    def _start_archiving(self, rotated: Optional[str] = None) -> None:
+        threading.Thread(
+            target=self._compress_and_prune,
+            args=(rotated,),
+            name='log-compress',
+            daemon=True
+        ).start()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        rotated = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            rotated = self._rotated_path(self._pid)
+            os.rename(self.baseFilename, rotated)
+        self._start_archiving(rotated)
+
+        self.rollover_at = time.time() + self.rotate_interval
+
+    def _claim_exited(self) -> List[str]:
+        """
+        Renames the uncompressed files of exited processes, current or
+        rotated, to fresh rotated names. Only one process wins each rename,
+        so concurrent sweeps never compress the same file.
+        """
+        claimed = []
+        for path in glob.glob(os.path.join(self.log_dir, f"{self.prefix}_*.jsonl")):
+            pid = os.path.basename(path)[len(self.prefix) + 1:-len('.jsonl')].split('_')[0]
+            if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+                continue
+            target = self._rotated_path(int(pid))
+            try:
+                os.rename(path, target)
+            except OSError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    def _compress_and_prune(self, rotated: Optional[str] = None) -> None:
+        try:
+            for path in ([rotated] if rotated else []) + self._claim_exited():
+                if os.path.getsize(path) == 0:
+                    os.remove(path)
+                    continue
+                with open(path, 'rb') as source, gzip.open(f"{path}.gz.tmp", 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(f"{path}.gz.tmp", f"{path}.gz")
+                os.remove(path)
+
+            archives = sorted(
+                glob.glob(os.path.join(self.log_dir, f"{self.prefix}_*.jsonl.gz")),
+                key=os.path.getmtime
+            )
+            for old in archives[:max(len(archives) - self.max_files, 0)]:
+                os.remove(old)
+        except OSError:
+            # Another process may be pruning the same directory
+            pass
+
+    def after_fork(self) -> None:
+        """Switches a forked child to its own file."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.stream = None  # the parent's stream, left for the parent to close
+            self.baseFilename = self._path_for_pid()
+            self.rollover_at = time.time() + self.rotate_interval
+            # A fork usually replaces a worker that exited
+            self._start_archiving()
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class _LocalQueueHandler(QueueHandler):
+    """
+    Queue handler for an in-process queue.
+
+    The stock ``QueueHandler.prepare`` formats every record in the calling
+    thread so it can be pickled. Records here never leave the process, so
+    they are queued as-is and formatted by the listener thread.
+    """
+
+    def __init__(self, handler_queue):
+        super().__init__(handler_queue)
+        self.addFilter(_ContextFilter())
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        LoggerSetup._ensure_listener()
+        self.queue.put_nowait(record)
 
 class LoggerSetup:
+    """
+    One logging pipeline per process: every logger gets the same
+    ``QueueHandler``, and a ``QueueListener`` thread does the formatting and
+    the file/console writes, so logging never blocks the request path on
+    disk I/O. The listener is started lazily and again after a fork, since
+    threads don't survive one (Celery prefork, gunicorn).
+    """
+
+    _lock = threading.Lock()
+    _queue_handler: Optional[_LocalQueueHandler] = None
+    _listener: Optional[QueueListener] = None
+    _handlers: List[logging.Handler] = []
+
     @staticmethod
-    def setup_logger(
-        name: str,
-        log_level: int = logging.DEBUG,
-        log_dir: str = 'logs',
-        file_prefix: str = 'ec2',
-        console_output: bool = True
-    ) -> logging.Logger:
+    def setup_logger(name: str, log_level: Optional[str] = None) -> logging.Logger:
         """
-        Sets up a logger with both file and console handlers.
-        
+        Returns a logger attached to the process-wide pipeline.
+
         Args:
             name: Logger name
-            log_level: Logging level
-            log_dir: Directory for log files
-            file_prefix: Prefix for log file names
-            console_output: Whether to output logs to console
-            
+            log_level: Level name, defaults to ``config.logging.LOG_LEVEL``
+
         Returns:
             logging.Logger: Configured logger instance
         """
-        # Create logs directory if it doesn't exist
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-        # Create logger
         logger = logging.getLogger(name)
-        logger.setLevel(log_level)
-
-        # Clear any existing handlers
-        logger.handlers = []
-
-        # Create formatters
-        file_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        console_formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s'
-        )
-
-        # File handler
-        file_path = os.path.join(
-            log_dir,
-            f"{file_prefix}_{datetime.now().strftime('%Y%m%d')}.log"
-        )
-        file_handler = logging.FileHandler(file_path)
-        file_handler.setLevel(log_level)
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
-
-        # Console handler
-        if console_output:
+        logger.setLevel(log_level or config.logging.LOG_LEVEL)
+
+        handler = LoggerSetup._get_queue_handler()
+        if handler not in logger.handlers:
+            logger.addHandler(handler)
+
+        return logger
+
+    @classmethod
+    def _get_queue_handler(cls) -> _LocalQueueHandler:
+        if cls._queue_handler is None:
+            with cls._lock:
+                if cls._queue_handler is None:
+                    cls._handlers = cls._build_handlers()
+                    cls._queue_handler = _LocalQueueHandler(queue.SimpleQueue())
+                    atexit.register(cls.stop)
+        return cls._queue_handler
+
+    @staticmethod
+    def _build_handlers() -> List[logging.Handler]:
+        """Creates the handlers the listener thread writes to, as set in ``LoggingConfig``."""
+        handlers = []
+
+        if config.logging.FILE_LOG_ENABLED:
+            os.makedirs(config.logging.LOG_DIR, exist_ok=True)
+            file_handler = CompressingRotatingFileHandler(
+                config.logging.LOG_DIR,
+                config.logging.LOG_FILE_PREFIX,
+                max_bytes=config.logging.MAX_LOG_BYTES,
+                rotate_interval=config.logging.ROTATE_INTERVAL,
+                max_files=config.logging.MAX_LOG_FILES
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+
+        if config.logging.CONSOLE_LOG_ENABLED:
             console_handler = logging.StreamHandler()
-            console_handler.setLevel(log_level)
-            console_handler.setFormatter(console_formatter)
-            logger.addHandler(console_handler)
+            console_handler.setFormatter(logging.Formatter(
+                '%(asctime)s - %(levelname)s - [booking=%(booking_id)s] %(message)s'
+            ))
+            handlers.append(console_handler)
+
+        return handlers
+
+    @classmethod
+    def _ensure_listener(cls) -> None:
+        if cls._listener is None:
+            with cls._lock:
+                if cls._listener is None:
+                    listener = QueueListener(
+                        cls._queue_handler.queue,
+                        *cls._handlers,
+                        respect_handler_level=True
+                    )
+                    listener.start()
+                    cls._listener = listener
+
+    @classmethod
+    def stop(cls) -> None:
+        """Stops the listener thread after it has written all queued records."""
+        with cls._lock:
+            if cls._listener is not None:
+                cls._listener.stop()
+                cls._listener = None
+
+    @classmethod
+    def _after_fork(cls) -> None:
+        # The listener thread didn't survive the fork and the queue may hold
+        # the parent's records; start over with an empty queue. The handlers
+        # are reused, the file handler moves to the child's own file.
+        cls._lock = threading.Lock()
+        cls._listener = None
+        if cls._queue_handler is not None:
+            cls._queue_handler.queue = queue.SimpleQueue()
+        for handler in cls._handlers:
+            if isinstance(handler, CompressingRotatingFileHandler):
+                handler.after_fork()
+
 
-        return logger
\ No newline at end of file
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=LoggerSetup._after_fork)
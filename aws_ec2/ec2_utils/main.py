@@ -1,81 +1,99 @@
 # ec2_utils/main.py
-import boto3
 from typing import List, Optional, Dict, Tuple
 import secrets
-from .instance_manager import EC2InstanceManager
+from botocore.exceptions import ClientError
+from .aws_clients import AWSClientRegistry
+from .instance_manager import EC2InstanceManager, InstanceLaunchError, InstanceGoneError, GONE_INSTANCE_STATES
 from .security import SecurityGroupManager
 from .config import config 
+from .image_builder import GoldenImageBuilder
 from .user_data import UserDataGenerator
+from .warm_pool import WarmPoolManager
+from .placement import InstancePlanner, PlacementPlan
 
 class EC2ServiceManager:
     def __init__(self, logger):
         self.logger = logger
-        self.ec2 = boto3.resource('ec2', region_name=config.aws.REGION)
+        self.ec2 = AWSClientRegistry.get_resource('ec2', config.aws.REGION)
         self.security_group_manager = SecurityGroupManager(self.ec2, self.logger)
         self.instance_manager = EC2InstanceManager(
             self.ec2,
             self.security_group_manager,
             self.logger
         )
-        self.user_data_generator = UserDataGenerator()
+        self.user_data_generator = UserDataGenerator(self.logger)
+        self.warm_pool_manager = WarmPoolManager(self.ec2, self.logger)
 
     def create_ec2_instances(self, 
                            credentials: List[Dict],
-                           users_per_instance: int = 2) -> Optional[List[Tuple]]:
+                           plan: Optional[PlacementPlan] = None,
+                           wait_until_ready: bool = True,
+                           callback_url: Optional[str] = None,
+                           schedule_name: Optional[str] = None,
+                           tags: Optional[Dict[str, str]] = None,
+                           ami_id: Optional[str] = None,
+                           prebaked: bool = False,
+                           shutdown_delay_minutes: Optional[int] = None) -> Optional[Tuple[List[Tuple], Dict[int, Exception]]]:
         """
         Orchestrates the creation of EC2 instances with JupyterHub.
         
         Args:
             credentials: List of user credentials
-            users_per_instance: Number of users per instance
+            plan: Instance types and users per instance (defaults to
+                ``InstancePlanner.plan(len(credentials))``)
+            wait_until_ready: Block until the instances are ready. Pass False
+                to return right after launch and track readiness separately.
+            callback_url: Signed URL each instance calls once JupyterHub is ready
+            schedule_name: Name for the shared shutdown schedule (e.g. "booking-42")
+            tags: Extra instance tags (e.g. ``{'BookingId': '42'}``)
+            ami_id: AMI to launch (defaults to ``config.aws.AMI_ID``)
+            prebaked: The AMI is a golden image with TLJH pre-installed, so
+                the slim user data script is used
+            shutdown_delay_minutes: Minutes from launch to the scheduled
+                shutdown (defaults to ``config.aws.SHUTDOWN_DELAY_MINUTES``)
             
         Returns:
-            Optional[List[Tuple]]: List of (instance, users, admin_credentials) or None
+            Optional[Tuple[List[Tuple], Dict[int, Exception]]]: (instance,
+            users, admin_credentials) per launched instance, in plan order,
+            and the error per 1-based plan position that failed to launch;
+            None if the attempt failed before or after launching
         """
         try:
             self.logger.info("Starting EC2 instance creation process")
-            print(f"DEBUG: Received credentials in create_ec2_instances: {credentials}")
+            self.logger.debug("Received %d credentials", len(credentials))
             
             # Set up security group
-            security_group_id = self.security_group_manager.create_or_get_security_group(
-                config.security_group.NAME,
-                config.security_group.DESCRIPTION
-            )
-            print(f"DEBUG: Created/got security group ID: {security_group_id}")
-            if not security_group_id:
-                raise Exception("Failed to create/get security group")
-            
-            security_group = self.ec2.SecurityGroup(security_group_id)
-            if not self.security_group_manager.setup_jupyter_security_rules(security_group):
-                raise Exception("Failed to set up security rules")
+            security_group_id = self._jupyter_security_group()
+
+            plan = plan or InstancePlanner.plan(len(credentials))
+            self.logger.info(f"Placement plan for {plan.users} users: {plan.summary()}, ${plan.hourly_cost:.4f}/h")
 
             # Prepare instance configurations
             instance_configs = []
-            for i in range(0, len(credentials), users_per_instance):
-                instance_users = credentials[i:i + users_per_instance]
-                print(f"DEBUG: Processing instance users: {instance_users}")
-                self.logger.info(f"Creating instance {len(instance_configs) + 1} with {len(instance_users)} users:")
-                for user in instance_users:
-                    self.logger.info(f"- Username: {user['username']}")
-            
+            for instance_type, instance_users in plan.assign(credentials):
+                self.logger.info(
+                    f"Creating instance {len(instance_configs) + 1} ({instance_type}) with {len(instance_users)} users"
+                )
+                self.logger.debug(
+                    "Instance %d users: %s",
+                    len(instance_configs) + 1,
+                    ', '.join(user['username'] for user in instance_users)
+                )
+
                 admin_password = secrets.token_hex(16)
                 
-                try:
-                    user_data = self.user_data_generator.generate_full_script(
-                        admin_password=admin_password,
-                        users=instance_users,
-                        requirements_url=config.jupyter.REQUIREMENTS_URL
-                    )
-                    print("DEBUG: Successfully generated user data script")
-                except Exception as e:
-                    print(f"DEBUG: Error generating user data script: {str(e)}")
-                    print(f"DEBUG: admin_password: {admin_password}")
-                    print(f"DEBUG: instance_users: {instance_users}")
-                    print(f"DEBUG: requirements_url: {config.jupyter.REQUIREMENTS_URL}")
-                    raise
+                user_data = self.user_data_generator.generate_user_data(
+                    admin_password=admin_password,
+                    users=instance_users,
+                    requirements_url=config.jupyter.REQUIREMENTS_URL,
+                    callback_url=callback_url,
+                    prebaked=prebaked,
+                    bulk=config.jupyter.BULK_USER_SETUP
+                )
                 
                 instance_configs.append({
                     'user_data': user_data,
+                    'instance_type': instance_type,
                     'users': instance_users,
                     'admin_credentials': {
                         'username': 'pawsey',
@@ -84,21 +102,355 @@ class EC2ServiceManager:
                 })
 
             # Create instances
-            instances = self.instance_manager.create_instances(
-                instance_configs,
-                config.aws.AMI_ID,
-                config.aws.INSTANCE_TYPE,
-                config.aws.KEY_NAME,
-                security_group_id
-            )
+            try:
+                instances = self.instance_manager.create_instances(
+                    instance_configs,
+                    ami_id or config.aws.AMI_ID,
+                    config.aws.INSTANCE_TYPE,
+                    config.aws.KEY_NAME,
+                    security_group_id,
+                    schedule_name=schedule_name,
+                    tags=tags,
+                    shutdown_delay_minutes=shutdown_delay_minutes
+                )
+                failures = {}
+            except InstanceLaunchError as e:
+                # Keep the instances that did launch; the caller tracks or cleans them up
+                instances, failures = e.instances, e.failures
+                launched_ids = [instance.id for instance, _, _ in instances]
+                self.logger.error(f"Error in create_ec2_instances: {e}; launched instances: {launched_ids}")
 
             # Wait for instances to be ready
-            if not self.instance_manager.wait_for_instances(instances):
+            if wait_until_ready and instances and not self.instance_manager.wait_for_instances(instances):
                 raise Exception("Failed waiting for instances")
 
-            self.logger.info("EC2 instance creation completed successfully")
-            return instances
+            self.logger.info(
+                f"EC2 instance creation completed: {len(instances)} instances, {len(failures)} failed"
+            )
+            return instances, failures
 
         except Exception as e:
             self.logger.error(f"Error in create_ec2_instances: {e}", exc_info=True)
-            return None
\ No newline at end of file
+            return None
+
+    def launch_planned_instances(self,
+                                 launches: List[Dict],
+                                 adopt_tokens: Optional[List[str]] = None,
+                                 wait_until_ready: bool = True,
+                                 callback_url: Optional[str] = None,
+                                 schedule_name: Optional[str] = None,
+                                 tags: Optional[Dict[str, str]] = None,
+                                 ami_id: Optional[str] = None,
+                                 prebaked: bool = False,
+                                 shutdown_delay_minutes: Optional[int] = None) -> Tuple[Dict[str, Tuple], Dict[str, Exception]]:
+        """
+        Launches instances that were planned (and recorded) ahead, each under
+        its own RunInstances client token, so a retry never launches an
+        instance twice. Unlike ``create_ec2_instances`` a failed launch
+        doesn't fail the batch: results and failures are reported per token.
+
+        Args:
+            launches: One dict per instance with ``client_token``,
+                ``instance_type``, ``users`` and ``admin_password``
+            adopt_tokens: Tokens of earlier attempts; an instance already
+                launched under one of them is adopted instead of launched
+            wait_until_ready: Block until the instances are ready
+            callback_url: Signed URL each instance calls once JupyterHub is ready
+            schedule_name: Name for the shared shutdown schedule (e.g. "booking-42")
+            tags: Extra instance tags (e.g. ``{'BookingId': '42'}``)
+            ami_id: AMI to launch (defaults to ``config.aws.AMI_ID``)
+            prebaked: The AMI is a golden image with TLJH pre-installed
+            shutdown_delay_minutes: Minutes from launch to the scheduled
+                shutdown (defaults to ``config.aws.SHUTDOWN_DELAY_MINUTES``)
+
+        Returns:
+            Tuple[Dict[str, Tuple], Dict[str, Exception]]: (instance, users,
+            admin_credentials) per launched or adopted token, and the error
+            per failed token. ``InstanceGoneError`` means the token's
+            instance was terminated and the token can't be used again.
+        """
+        launches_by_token = {launch['client_token']: launch for launch in launches}
+        results = {}
+        failures = {}
+        adopted = []
+
+        def as_result(description: Dict) -> Tuple:
+            launch = launches_by_token[description['ClientToken']]
+            instance = self.ec2.Instance(description['InstanceId'])
+            instance.meta.data = description
+            return (
+                instance,
+                launch['users'],
+                {'username': 'pawsey', 'password': launch['admin_password']}
+            )
+
+        def adopt(tokens: List[str]) -> None:
+            for token, description in self.instance_manager.find_instances_by_client_token(tokens).items():
+                if token not in launches_by_token:
+                    continue
+                if description['State']['Name'] in GONE_INSTANCE_STATES:
+                    failures[token] = InstanceGoneError(
+                        f"Instance {description['InstanceId']} launched with client token {token} "
+                        f"is {description['State']['Name']}"
+                    )
+                else:
+                    self.logger.info(f"Adopting instance {description['InstanceId']} (client token {token})")
+                    results[token] = as_result(description)
+                    failures.pop(token, None)
+                    adopted.append(description['InstanceId'])
+
+        try:
+            security_group_id = self._jupyter_security_group()
+
+            if adopt_tokens:
+                adopt(adopt_tokens)
+
+            instance_configs = []
+            for token, launch in launches_by_token.items():
+                if token in results or token in failures:
+                    continue
+                user_data = self.user_data_generator.generate_user_data(
+                    admin_password=launch['admin_password'],
+                    users=launch['users'],
+                    requirements_url=config.jupyter.REQUIREMENTS_URL,
+                    callback_url=callback_url,
+                    prebaked=prebaked,
+                    bulk=config.jupyter.BULK_USER_SETUP
+                )
+                instance_configs.append({
+                    'user_data': user_data,
+                    'instance_type': launch['instance_type'],
+                    'client_token': token,
+                    'users': launch['users'],
+                    'admin_credentials': {'username': 'pawsey', 'password': launch['admin_password']}
+                })
+
+            if instance_configs:
+                self.logger.info(
+                    f"Launching {len(instance_configs)} planned instances"
+                    + (f", adopted {len(adopted)}" if adopted else "")
+                )
+                try:
+                    launched = self.instance_manager.create_instances(
+                        instance_configs,
+                        ami_id or config.aws.AMI_ID,
+                        config.aws.INSTANCE_TYPE,
+                        config.aws.KEY_NAME,
+                        security_group_id,
+                        schedule_name=schedule_name,
+                        tags=tags,
+                        shutdown_delay_minutes=shutdown_delay_minutes
+                    )
+                    launch_failures = {}
+                except InstanceLaunchError as e:
+                    launched, launch_failures = e.instances, e.failures
+
+                for instance, _, _ in launched:
+                    results[instance.meta.data['ClientToken']] = as_result(instance.meta.data)
+                for position, error in launch_failures.items():
+                    failures[instance_configs[position - 1]['client_token']] = error
+
+                # The same token with different parameters (e.g. user data built
+                # from changed settings) means an earlier attempt did launch it: adopt that one
+                mismatched = [
+                    token for token, error in failures.items()
+                    if isinstance(error, ClientError)
+                    and error.response.get('Error', {}).get('Code') == 'IdempotentParameterMismatch'
+                ]
+                if mismatched:
+                    adopt(mismatched)
+
+            # Launched instances got their shutdown rule in create_instances
+            if adopted:
+                if shutdown_delay_minutes is None:
+                    shutdown_delay_minutes = config.aws.SHUTDOWN_DELAY_MINUTES
+                if not self.instance_manager.schedule_booking_shutdown(
+                    schedule_name or 'batch', adopted, shutdown_delay_minutes
+                ):
+                    self.logger.warning(f"Failed to schedule shutdown for instances {adopted}")
+
+            if wait_until_ready and results and not self.instance_manager.wait_for_instances(list(results.values())):
+                raise Exception("Failed waiting for instances")
+
+        except Exception as e:
+            self.logger.error(f"Error in launch_planned_instances: {e}", exc_info=True)
+            for token in launches_by_token:
+                if token not in results:
+                    failures.setdefault(token, e)
+
+        self.logger.info(f"Planned launch finished: {len(results)} instances, {len(failures)} failed")
+        return results, failures
+
+    def _jupyter_security_group(self) -> str:
+        """Returns the JupyterHub security group ID, creating it and its rules if needed."""
+        security_group_id = self.security_group_manager.create_or_get_security_group(
+            config.security_group.NAME,
+            config.security_group.DESCRIPTION
+        )
+        self.logger.debug("Using security group %s", security_group_id)
+        if not security_group_id:
+            raise Exception("Failed to create/get security group")
+
+        security_group = self.ec2.SecurityGroup(security_group_id)
+        if not self.security_group_manager.setup_jupyter_security_rules(security_group):
+            raise Exception("Failed to set up security rules")
+        return security_group_id
+
+    def launch_warm_pool_instances(self,
+                                   count: int,
+                                   tags: Dict[str, str],
+                                   ami_id: Optional[str] = None,
+                                   prebaked: bool = False) -> Optional[List[Dict]]:
+        """
+        Launches instances for the warm pool. They install TLJH (or only
+        warm their volume when ``prebaked``) and stop themselves.
+
+        Args:
+            count: Number of instances
+            tags: Instance tags identifying the pool
+            ami_id: AMI to launch (defaults to ``config.aws.AMI_ID``)
+            prebaked: The AMI is a golden image with TLJH pre-installed
+
+        Returns:
+            Optional[List[Dict]]: Instance descriptions or None
+        """
+        try:
+            security_group_id = self.security_group_manager.create_or_get_security_group(
+                config.security_group.NAME,
+                config.security_group.DESCRIPTION
+            )
+            if not security_group_id:
+                raise Exception("Failed to create/get security group")
+
+            script = self.user_data_generator.generate_warm_pool_script(
+                requirements_url=config.jupyter.REQUIREMENTS_URL,
+                admin_username=config.jupyter.ADMIN_USERNAME,
+                prebaked=prebaked
+            )
+            return self.warm_pool_manager.launch(
+                count,
+                script,
+                ami_id or config.aws.AMI_ID,
+                config.aws.INSTANCE_TYPE,
+                config.aws.KEY_NAME,
+                security_group_id,
+                {**config.tagging.DEFAULT_TAGS, **tags}
+            )
+
+        except Exception as e:
+            self.logger.error(f"Error in launch_warm_pool_instances: {e}", exc_info=True)
+            return None
+
+    def start_warm_instances(self,
+                             instance_ids: List[str],
+                             credentials: List[Dict],
+                             users_per_instance: int = 2,
+                             callback_url: Optional[str] = None,
+                             schedule_name: Optional[str] = None,
+                             tags: Optional[Dict[str, str]] = None,
+                             shutdown_delay_minutes: Optional[int] = None,
+                             admin_passwords: Optional[Dict[str, str]] = None) -> Optional[List[Tuple]]:
+        """
+        Starts claimed warm pool instances for a booking's users. Each
+        instance gets the slim user data for its users, so it is ready as
+        soon as the users are created and the hub reloaded.
+
+        Args:
+            instance_ids: Stopped pool instances, one per ``users_per_instance`` users
+            credentials: List of user credentials
+            users_per_instance: Number of users per instance
+            callback_url: Signed URL each instance calls once JupyterHub is ready
+            schedule_name: Name for the shared shutdown schedule
+            tags: Extra instance tags (e.g. ``{'BookingId': '42'}``)
+            shutdown_delay_minutes: Minutes from start to the scheduled
+                shutdown (defaults to ``config.aws.SHUTDOWN_DELAY_MINUTES``)
+            admin_passwords: Admin password per instance ID (random if not given)
+
+        Returns:
+            Optional[List[Tuple]]: List of (instance, users, admin_credentials) or None
+        """
+        try:
+            admin_passwords = admin_passwords or {}
+            assignments = {}
+            for i, instance_id in enumerate(instance_ids):
+                instance_users = credentials[i * users_per_instance:(i + 1) * users_per_instance]
+                admin_password = admin_passwords.get(instance_id) or secrets.token_hex(16)
+                user_data = self.user_data_generator.generate_user_data(
+                    admin_password=admin_password,
+                    users=instance_users,
+                    requirements_url=config.jupyter.REQUIREMENTS_URL,
+                    callback_url=callback_url,
+                    prebaked=True,
+                    bulk=config.jupyter.BULK_USER_SETUP
+                )
+                assignments[instance_id] = (user_data, instance_users, admin_password)
+
+            started = self.warm_pool_manager.start(
+                {instance_id: user_data for instance_id, (user_data, _, _) in assignments.items()},
+                tags or {}
+            )
+
+            if shutdown_delay_minutes is None:
+                shutdown_delay_minutes = config.aws.SHUTDOWN_DELAY_MINUTES
+            if not self.instance_manager.schedule_booking_shutdown(
+                schedule_name or 'warm', instance_ids, shutdown_delay_minutes
+            ):
+                self.logger.warning(f"Failed to schedule shutdown for instances {instance_ids}")
+
+            instances_by_id = {instance.id: instance for instance in started}
+            return [
+                (
+                    instances_by_id[instance_id],
+                    instance_users,
+                    {'username': 'pawsey', 'password': admin_password}
+                )
+                for instance_id, (_, instance_users, admin_password) in assignments.items()
+            ]
+
+        except Exception as e:
+            self.logger.error(f"Error in start_warm_instances: {e}", exc_info=True)
+            return None
+
+    def build_golden_image(self,
+                           image_name: str,
+                           instance_type: Optional[str] = None,
+                           timeout_minutes: int = 60) -> Optional[str]:
+        """
+        Bakes a golden AMI with TLJH and the configured requirements
+        pre-installed on top of ``config.aws.AMI_ID``.
+
+        Args:
+            image_name: Name for the new AMI
+            instance_type: Builder instance type (defaults to config)
+            timeout_minutes: Maximum time for the bake script to finish
+
+        Returns:
+            Optional[str]: New AMI ID or None
+        """
+        try:
+            security_group_id = self.security_group_manager.create_or_get_security_group(
+                config.security_group.NAME,
+                config.security_group.DESCRIPTION
+            )
+            if not security_group_id:
+                raise Exception("Failed to create/get security group")
+
+            bake_script = self.user_data_generator.generate_bake_script(
+                requirements_url=config.jupyter.REQUIREMENTS_URL,
+                admin_username=config.jupyter.ADMIN_USERNAME
+            )
+
+            builder = GoldenImageBuilder(self.ec2, self.logger)
+            return builder.build(
+                bake_script,
+                config.aws.AMI_ID,
+                instance_type or config.aws.INSTANCE_TYPE,
+                config.aws.KEY_NAME,
+                security_group_id,
+                image_name,
+                timeout_minutes=timeout_minutes
+            )
+
+        except Exception as e:
+            self.logger.error(f"Error in build_golden_image: {e}", exc_info=True)
+            return None
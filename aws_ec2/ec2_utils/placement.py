@@ -0,0 +1,225 @@
+# ec2_utils/placement.py
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from .config import config
+
+# Guards against rounding when dividing e.g. 0.8 GiB by 0.4 GiB
+EPSILON = 1e-9
+
+@dataclass(frozen=True)
+class InstanceSpec:
+    """A candidate instance type and how many users fit on it within the per-user limits"""
+    instance_type: str
+    vcpus: Optional[int]
+    memory_gib: Optional[float]
+    hourly_price: float
+    capacity: int
+
+@dataclass
+class PlacementPlan:
+    """Instances to launch for a booking, largest first, with the number of users on each"""
+    instances: List[Tuple[InstanceSpec, int]]
+    user_vcpus: float
+    user_memory_gib: float
+    fallback: bool = False  # no candidate fits the per-user limits; fixed chunking on INSTANCE_TYPE
+
+    @property
+    def instance_count(self) -> int:
+        return len(self.instances)
+
+    @property
+    def users(self) -> int:
+        return sum(users for _, users in self.instances)
+
+    @property
+    def hourly_cost(self) -> float:
+        return sum(spec.hourly_price for spec, _ in self.instances)
+
+    @property
+    def vcpus(self) -> Optional[int]:
+        """Total vCPUs, or None if an instance type is missing from the catalog."""
+        if any(spec.vcpus is None for spec, _ in self.instances):
+            return None
+        return sum(spec.vcpus for spec, _ in self.instances)
+
+    def assign(self, credentials: List[Dict]) -> List[Tuple[str, List[Dict]]]:
+        """
+        Splits credentials over the planned instances in order.
+
+        Returns:
+            List[Tuple[str, List[Dict]]]: (instance type, users) per instance
+        """
+        assignments = []
+        start = 0
+        for spec, users in self.instances:
+            assignments.append((spec.instance_type, credentials[start:start + users]))
+            start += users
+        return assignments
+
+    def summary(self) -> str:
+        """Instance types and fill, e.g. ``12 x t3.small (4 users), 1 x t3.micro (2 users)``."""
+        counts = {}
+        for spec, users in self.instances:
+            counts[(spec.instance_type, users)] = counts.get((spec.instance_type, users), 0) + 1
+        return ", ".join(
+            f"{count} x {instance_type} ({users} user{'' if users == 1 else 's'})"
+            for (instance_type, users), count in counts.items()
+        )
+
+
+class InstancePlanner:
+    """
+    Chooses the instance types for a booking and how many users go on each.
+
+    Every user is guaranteed ``USER_VCPUS`` and ``USER_MEMORY_GIB`` on top
+    of what the hub itself needs (``SYSTEM_VCPUS``/``SYSTEM_MEMORY_GIB``),
+    which gives each candidate type in ``INSTANCE_TYPES`` a capacity in
+    users, capped at ``MAX_USERS_PER_INSTANCE``. The plan minimises the
+    hourly price from ``CATALOG`` plus ``INSTANCE_OVERHEAD`` per instance,
+    which stands for the boot, API and shutdown-rule cost of every extra
+    instance. Users are then spread evenly over the chosen instances.
+
+    The optimum for n users is an unbounded covering knapsack over the
+    candidates, solved exactly by dynamic programming. Tables are kept per
+    set of candidates, so planning many bookings only extends them.
+    """
+
+    _tables: Dict[Tuple, Tuple[List[float], List[int]]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def capacity(instance_type: str,
+                 user_vcpus: Optional[float] = None,
+                 user_memory_gib: Optional[float] = None) -> int:
+        """Users that fit on an instance type, 0 if it isn't in the catalog or too small."""
+        placement = config.placement
+        entry = placement.CATALOG.get(instance_type)
+        if not entry:
+            return 0
+        user_vcpus = placement.USER_VCPUS if user_vcpus is None else user_vcpus
+        user_memory_gib = placement.USER_MEMORY_GIB if user_memory_gib is None else user_memory_gib
+
+        limits = [placement.MAX_USERS_PER_INSTANCE]
+        if user_vcpus > 0:
+            limits.append(math.floor((entry['vcpus'] - placement.SYSTEM_VCPUS) / user_vcpus + EPSILON))
+        if user_memory_gib > 0:
+            limits.append(math.floor((entry['memory_gib'] - placement.SYSTEM_MEMORY_GIB) / user_memory_gib + EPSILON))
+        return max(0, min(limits))
+
+    @staticmethod
+    def candidates(user_vcpus: Optional[float] = None,
+                   user_memory_gib: Optional[float] = None,
+                   instance_types: Optional[Sequence[str]] = None) -> List[InstanceSpec]:
+        """Catalog entries of the candidate types that fit at least one user."""
+        if instance_types is None:
+            instance_types = [name.strip() for name in config.placement.INSTANCE_TYPES.split(',') if name.strip()]
+
+        specs = []
+        for instance_type in dict.fromkeys(instance_types):
+            capacity = InstancePlanner.capacity(instance_type, user_vcpus, user_memory_gib)
+            if capacity > 0:
+                entry = config.placement.CATALOG[instance_type]
+                specs.append(InstanceSpec(
+                    instance_type=instance_type,
+                    vcpus=entry['vcpus'],
+                    memory_gib=entry['memory_gib'],
+                    hourly_price=entry['hourly_price'],
+                    capacity=capacity
+                ))
+        return specs
+
+    @staticmethod
+    def plan(number_of_users: int,
+             user_vcpus: Optional[float] = None,
+             user_memory_gib: Optional[float] = None,
+             instance_types: Optional[Sequence[str]] = None) -> PlacementPlan:
+        """
+        Plans the cheapest mix of instances for a number of users.
+
+        Args:
+            number_of_users: Users to place
+            user_vcpus: vCPUs per user (defaults to ``USER_VCPUS``)
+            user_memory_gib: Memory per user (defaults to ``USER_MEMORY_GIB``)
+            instance_types: Candidate types (defaults to ``INSTANCE_TYPES``)
+
+        Returns:
+            PlacementPlan: Instances largest first; falls back to
+            ``DEFAULT_USERS_PER_INSTANCE`` users per ``INSTANCE_TYPE`` when
+            no candidate fits a single user
+        """
+        user_vcpus = config.placement.USER_VCPUS if user_vcpus is None else user_vcpus
+        user_memory_gib = config.placement.USER_MEMORY_GIB if user_memory_gib is None else user_memory_gib
+        specs = InstancePlanner.candidates(user_vcpus, user_memory_gib, instance_types)
+
+        if not specs:
+            return InstancePlanner.fixed_plan(number_of_users, user_vcpus, user_memory_gib)
+
+        chosen = []
+        if number_of_users > 0:
+            _, choices = InstancePlanner._table(specs, number_of_users)
+            remaining = number_of_users
+            while remaining > 0:
+                spec = specs[choices[remaining]]
+                chosen.append(spec)
+                remaining -= spec.capacity
+        chosen.sort(key=lambda spec: (-spec.capacity, spec.instance_type))
+
+        return PlacementPlan(
+            instances=list(zip(chosen, InstancePlanner._spread(number_of_users, [spec.capacity for spec in chosen]))),
+            user_vcpus=user_vcpus,
+            user_memory_gib=user_memory_gib
+        )
+
+    @staticmethod
+    def _table(specs: List[InstanceSpec], number_of_users: int) -> Tuple[List[float], List[int]]:
+        """
+        Minimum cost of placing 0..n users and the candidate picked last
+        for each, extended as needed. Ties go to the larger instance.
+        """
+        key = tuple(
+            (spec.instance_type, spec.capacity, spec.hourly_price) for spec in specs
+        ) + (config.placement.INSTANCE_OVERHEAD,)
+        weights = [spec.hourly_price + config.placement.INSTANCE_OVERHEAD for spec in specs]
+
+        with InstancePlanner._lock:
+            costs, choices = InstancePlanner._tables.setdefault(key, ([0.0], [-1]))
+            for users in range(len(costs), number_of_users + 1):
+                best = None
+                for index, spec in enumerate(specs):
+                    # Cost first, then the larger instance (fewer instances overall)
+                    option = (round(costs[max(0, users - spec.capacity)] + weights[index], 9), -spec.capacity)
+                    if best is None or option < best[0]:
+                        best = (option, index)
+                costs.append(best[0][0])
+                choices.append(best[1])
+            return costs, choices
+
+    @staticmethod
+    def _spread(number_of_users: int, capacities: List[int]) -> List[int]:
+        """Evens out the users over instances: the fullest instance gives up users first."""
+        counts = list(capacities)
+        for _ in range(sum(counts) - number_of_users):
+            fullest = max(range(len(counts)), key=lambda index: (counts[index], index))
+            counts[fullest] -= 1
+        return counts
+
+    @staticmethod
+    def fixed_plan(number_of_users: int, user_vcpus: float, user_memory_gib: float) -> PlacementPlan:
+        """``DEFAULT_USERS_PER_INSTANCE`` users per ``INSTANCE_TYPE``, regardless of the per-user limits."""
+        instance_type = config.aws.INSTANCE_TYPE
+        entry = config.placement.CATALOG.get(instance_type, {})
+        spec = InstanceSpec(
+            instance_type=instance_type,
+            vcpus=entry.get('vcpus'),
+            memory_gib=entry.get('memory_gib'),
+            hourly_price=entry.get('hourly_price', 0.0),
+            capacity=config.jupyter.DEFAULT_USERS_PER_INSTANCE
+        )
+        users_per_instance = config.jupyter.DEFAULT_USERS_PER_INSTANCE
+        instances = [
+            (spec, min(users_per_instance, number_of_users - start))
+            for start in range(0, number_of_users, users_per_instance)
+        ]
+        return PlacementPlan(instances, user_vcpus, user_memory_gib, fallback=True)
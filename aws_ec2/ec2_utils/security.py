@@ -1,13 +1,45 @@
 # ec2_utils/security.py
 from botocore.exceptions import ClientError
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
 import logging
+import threading
+import time
+from .config import config
+
+# Process-level cache of resolved security groups, keyed by (region, group name).
+# Each entry holds the group ID, a fingerprint of the rules known to be
+# authorized on it and an expiry time.
+_security_group_cache: Dict[Tuple[str, str], Dict] = {}
+_cache_lock = threading.Lock()
 
 class SecurityGroupManager:
     def __init__(self, ec2_resource, logger: logging.Logger):
         self.ec2 = ec2_resource
         self.logger = logger
 
+    def _cache_key(self, group_name: str) -> Tuple[str, str]:
+        return (self.ec2.meta.client.meta.region_name, group_name)
+
+    def _get_cached(self, group_name: str) -> Optional[Dict]:
+        with _cache_lock:
+            entry = _security_group_cache.get(self._cache_key(group_name))
+            if entry and entry['expires_at'] > time.monotonic():
+                return dict(entry)
+            return None
+
+    def _update_cache(self, group_name: str, **values) -> None:
+        with _cache_lock:
+            entry = _security_group_cache.setdefault(self._cache_key(group_name), {})
+            entry.update(values)
+            entry['expires_at'] = time.monotonic() + config.security_group.CACHE_TTL
+
+    def invalidate_cache(self, group_name: str) -> None:
+        """Drops the cached entry for a group, e.g. after it was deleted outside this process."""
+        with _cache_lock:
+            _security_group_cache.pop(self._cache_key(group_name), None)
+
     def create_or_get_security_group(self, group_name: str, description: str) -> Optional[str]:
         """
         Creates a new security group or retrieves an existing one.
@@ -19,23 +51,30 @@ class SecurityGroupManager:
         Returns:
             str: Security group ID if successful, None otherwise
         """
+        if cached := self._get_cached(group_name):
+            return cached['group_id']
+
         try:
             self.logger.info(f"Attempting to create or get security group: {group_name}")
             
-            # Check for existing security group
-            existing_groups = self.ec2.security_groups.all()
-            for group in existing_groups:
-                if group.group_name == group_name:
-                    self.logger.info(f"Found existing security group: {group_name}")
-                    return group.id
-
-            # Create new security group if not found
-            security_group = self.ec2.create_security_group(
-                GroupName=group_name,
-                Description=description
-            )
-            self.logger.info(f"Created new security group: {group_name} with ID: {security_group.id}")
-            return security_group.id
+            # Look the group up by name on the server side
+            existing_groups = list(self.ec2.security_groups.filter(
+                Filters=[{'Name': 'group-name', 'Values': [group_name]}]
+            ))
+            if existing_groups:
+                group_id = existing_groups[0].id
+                self.logger.info(f"Found existing security group: {group_name}")
+            else:
+                # Create new security group if not found
+                security_group = self.ec2.create_security_group(
+                    GroupName=group_name,
+                    Description=description
+                )
+                group_id = security_group.id
+                self.logger.info(f"Created new security group: {group_name} with ID: {group_id}")
+
+            self._update_cache(group_name, group_id=group_id)
+            return group_id
 
         except ClientError as e:
             self.logger.error(f"Error creating/getting security group: {e}")
@@ -72,7 +111,42 @@ class SecurityGroupManager:
 
         except ClientError as e:
             if 'InvalidPermission.Duplicate' in str(e):
-                self.logger.info(f"Ingress rule already exists")
+                self.logger.info("Ingress rule already exists")
+                return True
+            self.logger.error(f"Error authorizing ingress: {e}")
+            return False
+
+    def authorize_ingress_rules(self, security_group, rules: List[Dict]) -> bool:
+        """
+        Authorizes several ingress rules with a single API call.
+
+        Args:
+            security_group: The security group object
+            rules: Rules in ``SecurityGroupConfig.INGRESS_RULES`` format
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            self.logger.info(f"Authorizing {len(rules)} ingress rules on {security_group.id}")
+
+            security_group.authorize_ingress(IpPermissions=[
+                {
+                    'IpProtocol': rule['protocol'],
+                    'FromPort': rule['from_port'],
+                    'ToPort': rule['to_port'],
+                    'IpRanges': [{
+                        'CidrIp': rule['cidr_ip'],
+                        'Description': rule.get('description', '')
+                    }]
+                }
+                for rule in rules
+            ])
+            return True
+
+        except ClientError as e:
+            if 'InvalidPermission.Duplicate' in str(e):
+                self.logger.info("Ingress rules already exist")
                 return True
             self.logger.error(f"Error authorizing ingress: {e}")
             return False
@@ -80,6 +154,11 @@ class SecurityGroupManager:
     def setup_jupyter_security_rules(self, security_group) -> bool:
         """
         Sets up all required security rules for JupyterHub.
+
+        Rules come from ``SecurityGroupConfig.INGRESS_RULES``. Once they have
+        been applied, a fingerprint is cached so later calls within the cache
+        TTL make no API calls; otherwise only the missing rules are sent, in
+        one batch.
         
         Args:
             security_group: The security group object
@@ -87,13 +166,43 @@ class SecurityGroupManager:
         Returns:
             bool: True if all rules were set up successfully
         """
-        rules = [
-            ('tcp', 22, 22, '0.0.0.0/0'),    # SSH
-            ('tcp', 80, 80, '0.0.0.0/0'),    # HTTP
-            ('tcp', 443, 443, '0.0.0.0/0'),  # HTTPS
-        ]
-        
-        return all(
-            self.authorize_ingress_rule(security_group, *rule)
+        rules = config.security_group.INGRESS_RULES
+        fingerprint = self._rules_fingerprint(rules)
+        group_name = config.security_group.NAME
+
+        cached = self._get_cached(group_name)
+        if cached and cached.get('group_id') == security_group.id and cached.get('rules_fingerprint') == fingerprint:
+            return True
+
+        try:
+            existing = security_group.ip_permissions
+        except ClientError as e:
+            self.logger.error(f"Error reading rules of security group {security_group.id}: {e}")
+            return False
+
+        missing = [rule for rule in rules if not self._rule_exists(rule, existing)]
+        if missing and not self.authorize_ingress_rules(security_group, missing):
+            return False
+
+        self._update_cache(group_name, group_id=security_group.id, rules_fingerprint=fingerprint)
+        return True
+
+    @staticmethod
+    def _rules_fingerprint(rules: List[Dict]) -> str:
+        """Stable hash of a rule set, used to detect rule changes."""
+        canonical = sorted(
+            (rule['protocol'], rule['from_port'], rule['to_port'], rule['cidr_ip'])
             for rule in rules
-        )
\ No newline at end of file
+        )
+        return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+    @staticmethod
+    def _rule_exists(rule: Dict, ip_permissions: List[Dict]) -> bool:
+        """Checks whether a rule is already covered by a group's ``IpPermissions``."""
+        return any(
+            permission.get('IpProtocol') == rule['protocol']
+            and permission.get('FromPort') == rule['from_port']
+            and permission.get('ToPort') == rule['to_port']
+            and any(ip_range.get('CidrIp') == rule['cidr_ip'] for ip_range in permission.get('IpRanges', []))
+            for permission in ip_permissions
+        )
@@ -0,0 +1,376 @@
+# ec2_utils/throttling.py
+import contextvars
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+import redis
+from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+from .config import config
+from .logging_config import LoggerSetup
+
+logger = LoggerSetup.setup_logger('aws_throttle')
+
+# Error codes AWS services use for request rate limiting
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'TooManyRequestsException',
+    'EC2ThrottledException',
+    'SlowDown',
+}
+
+# Bucket keys expire once a family has been idle this long
+BUCKET_KEY_TTL = 3600  # seconds
+
+# Throttling errors within this interval of the last one don't cut the rate again
+PENALTY_INTERVAL = 1.0  # seconds
+
+
+def api_family(service_id: str, operation_name: str) -> str:
+    """
+    Maps an API call to the rate bucket it shares. EC2 meters RunInstances/
+    StartInstances, other mutating calls and Describe* calls separately;
+    other services get one bucket each.
+    """
+    if service_id == 'ec2':
+        if operation_name in ('RunInstances', 'StartInstances'):
+            return 'ec2-run'
+        if operation_name.startswith('Describe'):
+            return 'ec2-describe'
+        return 'ec2-mutating'
+    return service_id
+
+
+def is_throttling_error(parsed: Optional[Dict]) -> bool:
+    return bool(parsed) and parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+class ThrottleTimeout(Exception):
+    """Raised when no token became available within ``MAX_WAIT`` seconds."""
+
+
+class TokenBucket:
+    """
+    Token bucket for one API family, kept in a Redis hash so every worker
+    process draws from the same budget.
+
+    The refill rate starts at the family's configured rate. A throttling
+    error cuts it by ``DECREASE_FACTOR`` (down to ``MIN_RATE``) and empties
+    the bucket; it then recovers linearly to the configured rate over
+    ``RECOVERY_SECONDS``. Updates use WATCH/MULTI rather than a Lua script,
+    so fakeredis works for tests.
+    """
+
+    def __init__(self, client: redis.Redis, family: str, max_rate: float):
+        self.redis = client
+        self.family = family
+        self.max_rate = max_rate
+        self.key = f"{config.throttling.KEY_PREFIX}:bucket:{family}"
+
+    def _rate(self, state: Dict, now: float) -> float:
+        if 'rate' not in state:
+            return self.max_rate
+        recovered = self.max_rate * (now - float(state['throttled_at'])) / config.throttling.RECOVERY_SECONDS
+        return min(self.max_rate, float(state['rate']) + recovered)
+
+    def _tokens(self, state: Dict, rate: float, now: float) -> float:
+        capacity = max(1.0, rate * config.throttling.BURST_SECONDS)
+        if 'tokens' not in state:
+            return capacity
+        return min(capacity, float(state['tokens']) + (now - float(state['updated_at'])) * rate)
+
+    def rate(self) -> float:
+        """Current refill rate in requests per second."""
+        return self._rate(self.redis.hgetall(self.key), time.time())
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """
+        Takes one token, sleeping until one is available.
+
+        Args:
+            max_wait: Longest time to wait, defaults to ``MAX_WAIT``
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            ThrottleTimeout: If no token became available in time
+        """
+        max_wait = config.throttling.MAX_WAIT if max_wait is None else max_wait
+        started = time.monotonic()
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key)
+                    state = pipe.hgetall(self.key)
+                    now = time.time()
+                    rate = self._rate(state, now)
+                    tokens = self._tokens(state, rate, now)
+                    if tokens >= 1:
+                        pipe.multi()
+                        pipe.hset(self.key, mapping={'tokens': tokens - 1, 'updated_at': now})
+                        pipe.expire(self.key, BUCKET_KEY_TTL)
+                        pipe.execute()
+                        return time.monotonic() - started
+                    pipe.unwatch()
+                except redis.WatchError:
+                    continue
+
+                # Jitter keeps waiting workers from retrying in lockstep
+                wait = (1 - tokens) / rate * (1 + random.random() / 10)
+                if time.monotonic() - started + wait > max_wait:
+                    raise ThrottleTimeout(f"No {self.family} token within {max_wait:g}s (rate {rate:.2f}/s)")
+                time.sleep(wait)
+
+    def penalize(self) -> float:
+        """
+        Cuts the refill rate after a throttling error and empties the bucket.
+
+        Returns:
+            float: New refill rate
+        """
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key)
+                    state = pipe.hgetall(self.key)
+                    now = time.time()
+                    rate = self._rate(state, now)
+                    if 'throttled_at' in state and now - float(state['throttled_at']) < PENALTY_INTERVAL:
+                        pipe.unwatch()
+                        return rate
+                    new_rate = max(config.throttling.MIN_RATE, rate * config.throttling.DECREASE_FACTOR)
+                    pipe.multi()
+                    pipe.hset(self.key, mapping={
+                        'rate': new_rate,
+                        'throttled_at': now,
+                        'tokens': 0,
+                        'updated_at': now,
+                    })
+                    pipe.expire(self.key, BUCKET_KEY_TTL)
+                    pipe.execute()
+                    return new_rate
+                except redis.WatchError:
+                    continue
+
+
+# Probe granted to the current task by CircuitBreaker.allow_request; launch
+# threads run in a copy of the task's context, so their calls carry it too
+_probe_token: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('aws_breaker_probe', default=None)
+
+
+class CircuitBreaker:
+    """
+    Shared circuit breaker over all AWS calls, kept in Redis.
+
+    ``FAILURE_THRESHOLD`` failed calls (5xx responses, throttling that
+    outlasted botocore's retries, connection errors) within the last
+    ``FAILURE_WINDOW`` seconds open it for ``COOLDOWN`` seconds. Failures
+    are kept in a sorted set by time, so successful calls in between don't
+    reset the count. After the cooldown it is half-open: ``allow_request``
+    lets one caller through as a probe. Only a successful call made by
+    that probe closes the breaker; any failure reopens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, client: redis.Redis):
+        self.redis = client
+        prefix = f"{config.throttling.KEY_PREFIX}:breaker"
+        self.failures_key = f"{prefix}:failures"
+        self.open_until_key = f"{prefix}:open_until"
+        self.probe_key = f"{prefix}:probe"
+
+    def state(self) -> str:
+        open_until = self.redis.get(self.open_until_key)
+        if open_until is None:
+            return self.CLOSED
+        return self.OPEN if time.time() < float(open_until) else self.HALF_OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker turns half-open, 0 unless it is open."""
+        open_until = self.redis.get(self.open_until_key)
+        return max(0.0, float(open_until) - time.time()) if open_until else 0.0
+
+    def allow_request(self) -> bool:
+        """Whether new work may start: always when closed, for a single probe when half-open."""
+        state = self.state()
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        # The probe flag expires, so a probe that dies lets another one through
+        token = uuid.uuid4().hex
+        if self.redis.set(self.probe_key, token, nx=True, ex=config.throttling.BREAKER_COOLDOWN):
+            _probe_token.set(token)
+            return True
+        return False
+
+    def close(self) -> None:
+        self.redis.delete(self.failures_key, self.open_until_key, self.probe_key)
+
+    def record_success(self) -> None:
+        """Closes a half-open breaker if the call was made by its probe; otherwise a no-op."""
+        token = _probe_token.get()
+        if token is None or self.state() != self.HALF_OPEN or self.redis.get(self.probe_key) != token:
+            return
+        self.close()
+        logger.info("AWS circuit breaker closed after a successful probe")
+
+    def record_failure(self) -> None:
+        now = time.time()
+        cooldown = config.throttling.BREAKER_COOLDOWN
+        if self.state() == self.HALF_OPEN:
+            # Still failing: stay open for another cooldown
+            self.redis.set(self.open_until_key, now + cooldown)
+            self.redis.delete(self.probe_key)
+            logger.warning(f"AWS circuit breaker reopened for {cooldown}s")
+            return
+
+        window = config.throttling.BREAKER_FAILURE_WINDOW
+        with self.redis.pipeline() as pipe:
+            pipe.zadd(self.failures_key, {uuid.uuid4().hex: now})
+            pipe.zremrangebyscore(self.failures_key, 0, now - window)
+            pipe.zcard(self.failures_key)
+            pipe.expire(self.failures_key, window)
+            _, _, failures, _ = pipe.execute()
+        if failures >= config.throttling.BREAKER_FAILURE_THRESHOLD:
+            if self.redis.set(self.open_until_key, now + cooldown, nx=True):
+                logger.warning(f"AWS circuit breaker opened for {cooldown}s after {failures} failed calls")
+
+
+class AWSThrottle:
+    """
+    Attaches the shared token buckets and the circuit breaker to boto3
+    clients through botocore events:
+
+    - ``before-send``: takes a token from the call's API family bucket
+      (once per attempt, so botocore's retries are metered too)
+    - ``needs-retry``: cuts the bucket rate when an attempt was throttled
+    - ``after-call`` / ``after-call-error``: records the final outcome of
+      the call with the circuit breaker
+
+    If Redis is unreachable, calls go through unthrottled for
+    ``REDIS_RETRY_SECONDS`` instead of failing.
+    """
+
+    _lock = threading.Lock()
+    _pid: Optional[int] = None
+    _redis: Optional[redis.Redis] = None
+    _buckets: Dict[str, TokenBucket] = {}
+    _unavailable_until = 0.0
+
+    @classmethod
+    def redis_client(cls) -> redis.Redis:
+        """Returns this process's Redis client."""
+        with cls._lock:
+            if cls._pid != os.getpid() or cls._redis is None:
+                cls._pid = os.getpid()
+                cls._redis = redis.Redis.from_url(
+                    config.throttling.REDIS_URL,
+                    decode_responses=True,
+                    socket_timeout=config.throttling.REDIS_TIMEOUT,
+                    socket_connect_timeout=config.throttling.REDIS_TIMEOUT
+                )
+                cls._buckets = {}
+            return cls._redis
+
+    @classmethod
+    def use_redis(cls, client: redis.Redis) -> None:
+        """Uses the given client (e.g. ``fakeredis.FakeRedis(decode_responses=True)``) in this process."""
+        with cls._lock:
+            cls._pid = os.getpid()
+            cls._redis = client
+            cls._buckets = {}
+            cls._unavailable_until = 0.0
+
+    @classmethod
+    def bucket(cls, family: str) -> TokenBucket:
+        client = cls.redis_client()
+        bucket = cls._buckets.get(family)
+        if bucket is None:
+            rate = config.throttling.RATES.get(family, config.throttling.DEFAULT_RATE)
+            bucket = cls._buckets.setdefault(family, TokenBucket(client, family, rate))
+        return bucket
+
+    @classmethod
+    def breaker(cls) -> CircuitBreaker:
+        return CircuitBreaker(cls.redis_client())
+
+    @classmethod
+    def provisioning_allowed(cls) -> bool:
+        """Whether new provisioning work may start; true while Redis is unreachable."""
+        return cls._guard(lambda: cls.breaker().allow_request(), default=True)
+
+    @classmethod
+    def breaker_open(cls) -> bool:
+        """Whether the breaker is open (not half-open); false while Redis is unreachable."""
+        return cls._guard(lambda: cls.breaker().state() == CircuitBreaker.OPEN, default=False)
+
+    @classmethod
+    def attach(cls, client) -> None:
+        """Registers the throttling and breaker handlers on a boto3 client."""
+        if not config.throttling.ENABLED:
+            return
+        events = client.meta.events
+        events.register('before-send', cls._before_send, unique_id='aws-throttle-before-send')
+        events.register('needs-retry', cls._needs_retry, unique_id='aws-throttle-needs-retry')
+        events.register('after-call', cls._after_call, unique_id='aws-throttle-after-call')
+        events.register('after-call-error', cls._after_call_error, unique_id='aws-throttle-after-call-error')
+
+    @classmethod
+    def _guard(cls, action, default=None):
+        """Runs a Redis action, failing open while Redis is unreachable."""
+        if time.monotonic() < cls._unavailable_until:
+            return default
+        try:
+            return action()
+        except redis.RedisError as e:
+            cls._unavailable_until = time.monotonic() + config.throttling.REDIS_RETRY_SECONDS
+            logger.warning(
+                f"Redis unavailable for AWS throttling ({e}); "
+                f"calls are unthrottled for {config.throttling.REDIS_RETRY_SECONDS}s"
+            )
+            return default
+
+    @staticmethod
+    def _family(event_name: str) -> str:
+        # e.g. "before-send.ec2.RunInstances"
+        _, service_id, operation_name = event_name.split('.', 2)
+        return api_family(service_id, operation_name)
+
+    @classmethod
+    def _before_send(cls, event_name: str = '', **kwargs) -> None:
+        family = cls._family(event_name)
+        waited = cls._guard(lambda: cls.bucket(family).acquire())
+        if waited and waited > 1:
+            logger.info(f"Waited {waited:.1f}s for a {family} token")
+
+    @classmethod
+    def _needs_retry(cls, response=None, event_name: str = '', **kwargs) -> None:
+        if response is not None and is_throttling_error(response[1]):
+            family = cls._family(event_name)
+            rate = cls._guard(lambda: cls.bucket(family).penalize())
+            if rate is not None:
+                logger.warning(f"{family} calls throttled by AWS; shared rate now {rate:.2f}/s")
+
+    @classmethod
+    def _after_call(cls, http_response=None, parsed=None, **kwargs) -> None:
+        if is_throttling_error(parsed) or (http_response is not None and http_response.status_code >= 500):
+            cls._guard(lambda: cls.breaker().record_failure())
+        else:
+            cls._guard(lambda: cls.breaker().record_success())
+
+    @classmethod
+    def _after_call_error(cls, exception=None, **kwargs) -> None:
+        if isinstance(exception, (BotoConnectionError, HTTPClientError)):
+            cls._guard(lambda: cls.breaker().record_failure())
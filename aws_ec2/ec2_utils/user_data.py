@@ -1,10 +1,34 @@
 # ec2_utils/user_data.py
-from typing import List, Dict
+import gzip
+import hashlib
+import json
+import logging
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List, Dict, Optional
 from string import Template
 
+# EC2 rejects user data larger than 16 KB (before base64 encoding)
+USER_DATA_LIMIT = 16384
+
+# Where cloud-init writes the booking's user list in bulk mode
+BOOKING_USERS_FILE = '/var/lib/tljh-booking/users'
+
+class UserDataTooLargeError(Exception):
+    """Raised when the encoded user data exceeds the EC2 size limit."""
+
+    def __init__(self, size: int, limit: int = USER_DATA_LIMIT):
+        self.size = size
+        self.limit = limit
+        super().__init__(f"User data is {size} bytes after compression, EC2 allows {limit}")
+
 class UserDataGenerator:
-    def __init__(self):
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger(__name__)
         self._base_script_template = self._get_base_script_template()
+        self._slim_script_template = self._get_slim_script_template()
+        self._bake_script_template = self._get_bake_script_template()
+        self._warm_script_template = self._get_warm_script_template()
         
     def _get_base_script_template(self) -> Template:
         """Returns the base script template for user data."""
@@ -56,6 +80,102 @@ echo "Verifying installation..."
 $verification_commands
 
 echo "Installation completed successfully!"
+$ready_callback
+''')
+
+    def _get_slim_script_template(self) -> Template:
+        """
+        Returns the script template for instances launched from a pre-baked
+        AMI (see ``generate_bake_script``): TLJH is already installed, so only
+        users are created and the hub is reloaded.
+        """
+        return Template('''#!/bin/bash
+set -e
+
+# Set up Pawsey admin user
+$pawsey_setup
+
+# Create and configure users
+$user_setup
+
+# Remove sudo access from regular users
+for username in $usernames; do
+    sudo deluser $$username sudo 2>/dev/null || true
+done
+
+# Reload JupyterHub configuration
+sudo tljh-config reload
+
+# Verify installation
+echo "Verifying installation..."
+$verification_commands
+
+echo "Installation completed successfully!"
+$ready_callback
+''')
+
+    def _get_bake_script_template(self) -> Template:
+        """
+        Returns the script template that prepares a golden AMI: everything
+        that does not depend on the booking's users, ending with a shutdown
+        so the builder can snapshot the stopped instance.
+        """
+        return Template('''#!/bin/bash
+set -e
+
+# Update system
+sudo apt-get update
+sudo apt-get install -y python3-pip
+
+# Create and configure the getlesson script
+sudo echo "#!/bin/bash\n 
+git clone https://github.com/PawseySC/quantum-computing-hackathon" >> /usr/bin/getlesson
+sudo chmod a+rx /usr/bin/getlesson
+
+# Install TLJH
+curl -L https://tljh.jupyter.org/bootstrap.py | sudo python3 - --admin $admin_username --user-requirements-txt-url $requirements_url
+
+# Wait for TLJH installation
+echo "Waiting for TLJH installation to complete..."
+while [ ! -f /opt/tljh/installer.log ] || ! grep -q "Done!" /opt/tljh/installer.log; do
+    sleep 30
+    echo "Still waiting for TLJH installation..."
+done
+
+# Configure JupyterHub
+sudo tljh-config set auth.type jupyterhub.auth.PAMAuthenticator
+sudo tljh-config set auth.PAMAuthenticator.open_sessions False
+sudo tljh-config reload
+
+# Create jupyter group
+sudo groupadd -f jupyter
+
+# Let cloud-init run user data again on instances launched from the image
+sudo apt-get clean
+sudo cloud-init clean --logs
+
+echo "Bake completed successfully!"
+sudo shutdown -h now
+''')
+
+    def _get_warm_script_template(self) -> Template:
+        """
+        Returns the script template for warm pool instances launched from a
+        golden AMI: TLJH is already installed, so it only reads the install
+        once (EBS volumes restored from a snapshot are slow until every block
+        has been read) and stops the instance.
+        """
+        return Template('''#!/bin/bash
+set -e
+
+# Pull the TLJH install and user environment into the EBS volume
+sudo find /opt/tljh /usr/lib/python3* -type f -exec cat {} + > /dev/null
+
+# Run the user data set when the instance is claimed on its next start
+sudo cloud-init clean --logs
+
+echo "Warm pool instance ready"
+sudo shutdown -h now
 ''')
 
     def generate_pawsey_admin_setup(self, password: str) -> str:
@@ -79,36 +199,130 @@ echo 'pawsey ALL=(ALL) NOPASSWD:ALL' | sudo tee /etc/sudoers.d/pawsey
 sudo chmod 0440 /etc/sudoers.d/pawsey
 '''
 
-    def generate_user_setup(self, users: List[Dict]) -> str:
+    def generate_user_setup(self, users: List[Dict], bulk: bool = False,
+                            users_file: Optional[str] = None) -> str:
         """
         Generates user setup commands for regular users.
         
         Args:
-            users: List of user credentials
+            users: List of user credentials (``username`` and ``password_hash``,
+                a crypt hash in /etc/shadow format)
+            bulk: Create all users with one ``newusers`` call, set the
+                ``jupyter`` group members with one ``gpasswd`` call and
+                write the allowed users into the TLJH config in one pass,
+                instead of four commands per user
+            users_file: In bulk mode, file already holding the user list
             
         Returns:
             str: Setup commands for regular users
         """
+        if bulk:
+            return self.generate_bulk_user_setup(users, users_file)
+
         commands = []
         for user in users:
             commands.extend([
                 f"sudo useradd -m -s /bin/bash {user['username']}",
-                f"echo '{user['username']}:{user['password']}' | sudo chpasswd",
+                f"echo '{user['username']}:{user['password_hash']}' | sudo chpasswd -e",
                 f"sudo usermod -aG jupyter {user['username']}",
                 f"sudo tljh-config add-item auth.PAMAuthenticator.whitelist {user['username']}"
             ])
         return '\n'.join(commands)
 
-    def generate_verification_commands(self, users: List[Dict]) -> str:
+    def generate_bulk_user_setup(self, users: List[Dict], users_file: Optional[str] = None) -> str:
+        """
+        Generates batched user setup commands: the number of processes
+        started no longer grows with the number of users.
+
+        Args:
+            users: List of user credentials
+            users_file: File already holding the ``newusers`` lines (written
+                by cloud-init, see ``generate_user_data``). If None the lines
+                are written from a heredoc in the script itself.
+
+        Returns:
+            str: Setup commands for regular users. They leave the usernames
+            in ``$BOOKING_USERS`` for the later steps of the script.
+        """
+        if not users:
+            return 'BOOKING_USERS=""'
+
+        write_users = ''
+        if users_file is None:
+            users_file = BOOKING_USERS_FILE
+            write_users = f'''
+sudo install -D -m 600 /dev/stdin {users_file} <<'NEWUSERS_EOF'
+{self.generate_newusers_lines(users)}
+NEWUSERS_EOF
+'''
+
+        return f'''{write_users}
+# Create all users in one pass, then set their pre-hashed passwords
+sudo newusers {users_file}
+sudo cut -d: -f1,2 {users_file} | sudo chpasswd -e
+BOOKING_USERS=$(sudo cut -d: -f1 {users_file} | tr '\\n' ' ')
+sudo shred -u {users_file}
+
+# Add them to the jupyter group
+sudo gpasswd -M "$(echo $BOOKING_USERS | tr ' ' ',')" jupyter
+
+# Allow them in JupyterHub with a single config write
+sudo /opt/tljh/hub/bin/python3 - $BOOKING_USERS <<'TLJH_EOF'
+import os
+import sys
+from ruamel.yaml import YAML
+from tljh.config import CONFIG_FILE, add_item_to_config
+
+yaml = YAML(typ='rt')
+tljh_config = {{}}
+if os.path.exists(CONFIG_FILE):
+    with open(CONFIG_FILE) as f:
+        tljh_config = yaml.load(f) or {{}}
+
+allowed = tljh_config.get('auth', {{}}).get('PAMAuthenticator', {{}}).get('whitelist', [])
+for username in sys.argv[1:]:
+    if username not in allowed:
+        tljh_config = add_item_to_config(tljh_config, 'auth.PAMAuthenticator.whitelist', username)
+
+with open(CONFIG_FILE, 'w') as f:
+    yaml.dump(tljh_config, f)
+TLJH_EOF
+'''
+
+    def generate_newusers_lines(self, users: List[Dict]) -> str:
+        """
+        Formats users for ``newusers`` (name:password:uid:gid:gecos:home:shell).
+        Empty uid/gid allocate the next free ID and a group named after the user.
+        ``newusers`` can only take plaintext, so the password field holds the
+        crypt hash and the real hash is set with ``chpasswd -e`` right after.
+        """
+        return '\n'.join(
+            f"{user['username']}:{user['password_hash']}::::/home/{user['username']}:/bin/bash"
+            for user in users
+        )
+
+    def generate_verification_commands(self, users: List[Dict], bulk: bool = False) -> str:
         """
         Generates verification commands for user setup.
         
         Args:
             users: List of user credentials
+            bulk: Check all users (``$BOOKING_USERS``, set by the bulk setup)
+                against one ``getent passwd`` listing instead of one ``id``
+                call per user
             
         Returns:
             str: Commands to verify user setup
         """
+        if bulk:
+            return f'''echo "Verifying users..."
+MISSING_USERS=$(comm -13 <(getent passwd | cut -d: -f1 | sort) <(printf '%s\\n' pawsey $BOOKING_USERS | sort))
+if [ -n "$MISSING_USERS" ]; then
+    echo "Failed to create users: $MISSING_USERS"
+    exit 1
+fi
+echo "All {len(users) + 1} users created successfully"'''
+
         commands = ['echo "Verifying Pawsey admin user..."']
         commands.append('if id "pawsey" >/dev/null 2>&1; then')
         commands.append('    echo "Pawsey admin user created successfully"')
@@ -130,11 +344,83 @@ sudo chmod 0440 /etc/sudoers.d/pawsey
         
         return '\n'.join(commands)
 
+    def generate_ready_callback(self, callback_url: Optional[str]) -> str:
+        """
+        Generates the commands that report readiness back to the booking service.
+
+        The instance POSTs its ID and public hostname (read from the instance
+        metadata service) to the signed callback URL, retrying for a few
+        minutes in case the service is briefly unreachable.
+
+        Args:
+            callback_url: Signed readiness URL, or None to skip the callback
+
+        Returns:
+            str: Callback commands (empty if no URL is given)
+        """
+        if not callback_url:
+            return ''
+
+        return f'''
+# Report readiness to the booking service
+IMDS_TOKEN=$(curl -sf -X PUT "http://169.254.169.254/latest/api/token" -H "X-aws-ec2-metadata-token-ttl-seconds: 300" || true)
+INSTANCE_ID=$(curl -sf -H "X-aws-ec2-metadata-token: $IMDS_TOKEN" http://169.254.169.254/latest/meta-data/instance-id || true)
+PUBLIC_DNS=$(curl -sf -H "X-aws-ec2-metadata-token: $IMDS_TOKEN" http://169.254.169.254/latest/meta-data/public-hostname || true)
+for attempt in $(seq 1 12); do
+    if curl -sf -X POST --data-urlencode "instance_id=$INSTANCE_ID" --data-urlencode "public_dns=$PUBLIC_DNS" '{callback_url}'; then
+        echo "Reported readiness for $INSTANCE_ID"
+        break
+    fi
+    echo "Readiness callback failed (attempt $attempt), retrying..."
+    sleep 15
+done
+'''
+
+    def generate_bake_script(self, requirements_url: str, admin_username: str = 'pawsey') -> str:
+        """
+        Generates the user data script that bakes a golden AMI.
+
+        Args:
+            requirements_url: URL for requirements.txt
+            admin_username: JupyterHub admin user
+
+        Returns:
+            str: Bake script; the instance shuts itself down when done
+        """
+        return self._bake_script_template.substitute(
+            requirements_url=requirements_url,
+            admin_username=admin_username
+        )
+
+    def generate_warm_pool_script(self, requirements_url: str, admin_username: str = 'pawsey',
+                                  prebaked: bool = False) -> str:
+        """
+        Generates the user data of a warm pool instance. It leaves the
+        instance in the same state as a golden AMI launch, then stops it.
+        Claiming the instance replaces the user data with the slim script
+        for the booking's users before starting it.
+
+        Args:
+            requirements_url: URL for requirements.txt
+            admin_username: JupyterHub admin user
+            prebaked: The instance is launched from a golden AMI
+
+        Returns:
+            str: Warm pool script; the instance shuts itself down when done
+        """
+        if prebaked:
+            return self._warm_script_template.substitute()
+        return self.generate_bake_script(requirements_url, admin_username)
+
     def generate_full_script(
         self,
         admin_password: str,
         users: List[Dict],
-        requirements_url: str
+        requirements_url: str,
+        callback_url: Optional[str] = None,
+        prebaked: bool = False,
+        bulk: bool = False,
+        users_file: Optional[str] = None
     ) -> str:
         """
         Generates the complete user data script.
@@ -143,30 +429,106 @@ sudo chmod 0440 /etc/sudoers.d/pawsey
             admin_password: Password for Pawsey admin user
             users: List of user credentials
             requirements_url: URL for requirements.txt
+            callback_url: Signed URL the instance calls once JupyterHub is ready
+            prebaked: The AMI already has TLJH installed (see
+                ``generate_bake_script``); only set up users and reload
+            bulk: Use the batched user setup and verification commands
+            users_file: In bulk mode, read the users from this file instead
+                of embedding them in the script
             
         Returns:
             str: Complete user data script
         """
-        print(f"DEBUG: generate_full_script received:")
-        print(f"- admin_password: {admin_password}")
-        print(f"- users: {users}")
-        print(f"- requirements_url: {requirements_url}")
-        
+        self.logger.debug(
+            "Generating user data for %d users (prebaked=%s, bulk=%s)",
+            len(users), prebaked, bulk
+        )
+
+        template = self._slim_script_template if prebaked else self._base_script_template
         try:
-            script = self._base_script_template.substitute(
+            return template.substitute(
                 pawsey_setup=self.generate_pawsey_admin_setup(admin_password),
                 requirements_url=requirements_url,
-                user_setup=self.generate_user_setup(users),
-                usernames=' '.join(user['username'] for user in users),
-                verification_commands=self.generate_verification_commands(users)
+                user_setup=self.generate_user_setup(users, bulk=bulk, users_file=users_file),
+                usernames='$BOOKING_USERS' if bulk else ' '.join(user['username'] for user in users),
+                verification_commands=self.generate_verification_commands(users, bulk=bulk),
+                ready_callback=self.generate_ready_callback(callback_url)
+            )
+        except Exception:
+            self.logger.error(
+                "Error generating user data for users %s",
+                [user.get('username') for user in users],
+                exc_info=True
             )
-            print("DEBUG: Successfully generated script")
-            return script
-        except Exception as e:
-            print(f"DEBUG: Error in generate_full_script: {str(e)}")
-            print(f"DEBUG: Template variables:")
-            print(f"- pawsey_setup: {self.generate_pawsey_admin_setup(admin_password)}")
-            print(f"- user_setup: {self.generate_user_setup(users)}")
-            print(f"- usernames: {' '.join(user['username'] for user in users)}")
-            print(f"- verification_commands: {self.generate_verification_commands(users)}")
-            raise
\ No newline at end of file
+            raise
+
+    def generate_user_data(
+        self,
+        admin_password: str,
+        users: List[Dict],
+        requirements_url: str,
+        callback_url: Optional[str] = None,
+        prebaked: bool = False,
+        bulk: bool = False
+    ) -> bytes:
+        """
+        Generates gzip-compressed cloud-init multipart user data.
+
+        In bulk mode the user list goes into a ``#cloud-config`` part that
+        writes it to ``BOOKING_USERS_FILE`` (readable by root only), and the
+        shell script part reads it from there, so the script no longer grows
+        with every user. cloud-init decompresses gzip user data itself.
+
+        Args:
+            admin_password: Password for Pawsey admin user
+            users: List of user credentials
+            requirements_url: URL for requirements.txt
+            callback_url: Signed URL the instance calls once JupyterHub is ready
+            prebaked: The AMI already has TLJH installed
+            bulk: Use the batched user setup and verification commands
+
+        Returns:
+            bytes: Compressed user data, ready to pass as ``UserData``
+
+        Raises:
+            UserDataTooLargeError: If the compressed user data exceeds the
+                EC2 limit
+        """
+        parts = []
+        users_file = None
+        if bulk and users:
+            users_file = BOOKING_USERS_FILE
+            # JSON is valid YAML and needs no extra dependency
+            cloud_config = {
+                'write_files': [{
+                    'path': users_file,
+                    'permissions': '0600',
+                    'owner': 'root:root',
+                    'content': self.generate_newusers_lines(users) + '\n'
+                }]
+            }
+            parts.append(MIMEText('#cloud-config\n' + json.dumps(cloud_config), 'cloud-config'))
+
+        script = self.generate_full_script(
+            admin_password=admin_password,
+            users=users,
+            requirements_url=requirements_url,
+            callback_url=callback_url,
+            prebaked=prebaked,
+            bulk=bulk,
+            users_file=users_file
+        )
+        parts.append(MIMEText(script, 'x-shellscript'))
+
+        # A boundary derived from the parts (rather than a random one) and
+        # mtime=0 keep the output identical for identical input, so retries
+        # under the same RunInstances client token pass the same UserData
+        digest = hashlib.sha256(b''.join(part.as_bytes() for part in parts)).hexdigest()
+        message = MIMEMultipart(boundary=f"==============={digest[:32]}==")
+        for part in parts:
+            message.attach(part)
+
+        user_data = gzip.compress(message.as_bytes(), compresslevel=9, mtime=0)
+        if len(user_data) > USER_DATA_LIMIT:
+            raise UserDataTooLargeError(len(user_data))
+        return user_data
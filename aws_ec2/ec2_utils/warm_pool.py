@@ -0,0 +1,97 @@
+# ec2_utils/warm_pool.py
+import logging
+from typing import Dict, List
+
+class WarmPoolManager:
+    """
+    EC2 side of the warm pool: launches pool instances that install TLJH
+    and stop themselves, and starts claimed ones with new user data.
+    """
+
+    def __init__(self, ec2_resource, logger: logging.Logger):
+        self.ec2 = ec2_resource
+        self.client = ec2_resource.meta.client
+        self.logger = logger
+
+    def launch(self,
+               count: int,
+               user_data: str,
+               ami_id: str,
+               instance_type: str,
+               key_name: str,
+               security_group_id: str,
+               tags: Dict[str, str]) -> List[Dict]:
+        """
+        Launches pool instances with one RunInstances call.
+
+        Args:
+            count: Number of instances
+            user_data: Install script that ends with a shutdown
+            ami_id: AMI ID to use
+            instance_type: EC2 instance type
+            key_name: SSH key pair name
+            security_group_id: Security group ID
+            tags: Instance tags (e.g. the pool fingerprint)
+
+        Returns:
+            List[Dict]: Instance descriptions from the RunInstances response
+        """
+        response = self.client.run_instances(
+            ImageId=ami_id,
+            MinCount=count,
+            MaxCount=count,
+            InstanceType=instance_type,
+            KeyName=key_name,
+            UserData=user_data,
+            SecurityGroupIds=[security_group_id],
+            # The install script ends with a shutdown; stop rather than terminate
+            InstanceInitiatedShutdownBehavior='stop',
+            TagSpecifications=[{
+                'ResourceType': 'instance',
+                'Tags': [{'Key': key, 'Value': str(value)} for key, value in tags.items()]
+            }]
+        )
+        descriptions = response['Instances']
+        self.logger.info(
+            f"Launched {len(descriptions)} warm pool instances: "
+            f"{[description['InstanceId'] for description in descriptions]}"
+        )
+        return descriptions
+
+    def start(self, user_data: Dict[str, bytes], tags: Dict[str, str]) -> List:
+        """
+        Starts stopped pool instances with new user data.
+
+        The user data of a stopped instance can be replaced, and the pool
+        install script ran ``cloud-init clean``, so the new script runs on
+        this start. Tags are set in one call and all instances are started
+        with a single StartInstances call.
+
+        Args:
+            user_data: Mapping of instance ID to the user data it should run
+            tags: Tags to add (e.g. ``{'BookingId': '42'}``)
+
+        Returns:
+            List: ec2.Instance resources, loaded after the start
+        """
+        instance_ids = list(user_data)
+        for instance_id, data in user_data.items():
+            self.client.modify_instance_attribute(InstanceId=instance_id, UserData={'Value': data})
+
+        if tags:
+            self.client.create_tags(
+                Resources=instance_ids,
+                Tags=[{'Key': key, 'Value': str(value)} for key, value in tags.items()]
+            )
+
+        self.client.start_instances(InstanceIds=instance_ids)
+        self.logger.info(f"Started {len(instance_ids)} warm pool instances: {instance_ids}")
+
+        # One DescribeInstances call for all of them; LaunchTime is the start time
+        return list(self.ec2.instances.filter(InstanceIds=instance_ids))
+
+    def terminate(self, instance_ids: List[str]) -> None:
+        """Terminates pool instances that are unhealthy, stale or no longer needed."""
+        if instance_ids:
+            self.client.terminate_instances(InstanceIds=instance_ids)
+            self.logger.info(f"Terminated warm pool instances: {instance_ids}")
@@ -3,6 +3,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 from datetime import datetime
 from django.utils import timezone
+from .services.capacity_service import CapacityService
 
 class BookingForm(forms.Form):
     email = forms.EmailField(label='Email', required=True)
@@ -25,3 +26,14 @@ class BookingForm(forms.Form):
             raise ValidationError("Booking time must be in the future.")
         
         return booking_time
+
+    def clean(self):
+        cleaned_data = super().clean()
+        booking_time = cleaned_data.get('booking_time')
+        number_of_users = cleaned_data.get('number_of_users')
+
+        # Turn away bookings that would exceed the EC2 vCPU quota in their slot
+        if booking_time and number_of_users and not CapacityService.has_capacity(booking_time, number_of_users):
+            raise ValidationError(CapacityService.rejection_message(booking_time, number_of_users))
+
+        return cleaned_data
@@ -0,0 +1,74 @@
+# aws_ec2/hashers.py
+from django.contrib.auth.hashers import BasePasswordHasher, mask_hash
+from django.utils.crypto import get_random_string
+from passlib.hash import sha512_crypt
+
+# crypt(3) salt alphabet
+SALT_CHARS = './0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+class SHA512CryptPasswordHasher(BasePasswordHasher):
+    """
+    SHA-512 crypt ("$6$") hasher for booking credentials.
+
+    Unlike PBKDF2 the hash is in /etc/shadow format, so instances can set
+    user passwords with ``chpasswd -e`` and the plaintext never has to be
+    stored: it only lives in memory while the registration is processed.
+
+    Encoded form: ``sha512_crypt$6$rounds=<rounds>$<salt>$<hash>``
+    """
+
+    algorithm = 'sha512_crypt'
+    rounds = 200000
+
+    def salt(self) -> str:
+        # sha512-crypt uses at most 16 salt characters from the crypt alphabet
+        return get_random_string(16, SALT_CHARS)
+
+    def encode(self, password: str, salt: str) -> str:
+        crypt_hash = sha512_crypt.using(rounds=self.rounds, salt=salt).hash(password)
+        return f"{self.algorithm}{crypt_hash}"
+
+    def decode(self, encoded: str) -> dict:
+        _, _, rounds, salt, crypt_hash = encoded.split('$', 4)
+        return {
+            'algorithm': self.algorithm,
+            'hash': crypt_hash,
+            'iterations': int(rounds.split('=')[1]),
+            'salt': salt,
+        }
+
+    def verify(self, password: str, encoded: str) -> bool:
+        return sha512_crypt.verify(password, self.to_shadow(encoded))
+
+    def safe_summary(self, encoded: str) -> dict:
+        decoded = self.decode(encoded)
+        return {
+            'algorithm': decoded['algorithm'],
+            'iterations': decoded['iterations'],
+            'salt': mask_hash(decoded['salt'], show=2),
+            'hash': mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded: str) -> bool:
+        return self.decode(encoded)['iterations'] != self.rounds
+
+    def harden_runtime(self, password: str, encoded: str) -> None:
+        pass
+
+    @classmethod
+    def to_shadow(cls, encoded: str) -> str:
+        """Strips the Django algorithm prefix, leaving the /etc/shadow hash."""
+        return encoded[len(cls.algorithm):]
+
+    @classmethod
+    def is_encoded(cls, value: str) -> bool:
+        return value.startswith(f"{cls.algorithm}$6$")
+
+
+def hash_credential_password(password: str) -> str:
+    """
+    Hashes one credential password. Module-level and settings-free so it
+    can run in a process pool worker (see ``CredentialService``).
+    """
+    hasher = SHA512CryptPasswordHasher()
+    return hasher.encode(password, hasher.salt())
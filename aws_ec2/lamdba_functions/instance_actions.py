@@ -0,0 +1,114 @@
+import json
+import logging
+from collections import namedtuple
+
+# Shared by the stop and terminate handlers; package it alongside each of them.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Instance IDs per StopInstances/TerminateInstances call
+ACTION_BATCH_SIZE = 100
+
+# Values per instance-id filter in DescribeInstances
+DESCRIBE_BATCH_SIZE = 200
+
+# One EC2 verb applied to instances:
+#   verb: name used in log messages ('stop')
+#   method: EC2 client method taking InstanceIds ('stop_instances')
+#   response_key: list of state changes in its response ('StoppingInstances')
+#   result: action recorded for the instances it accepted ('stopping')
+#   acts_on: states in which the instance still needs the action
+InstanceAction = namedtuple('InstanceAction', ['verb', 'method', 'response_key', 'result', 'acts_on'])
+
+def handle(event, ec2, action):
+    """
+    Applies ``action`` to the instances selected by the event, which holds one of:
+        - ``instance_id``: a single instance ID
+        - ``instance_ids``: a list of instance IDs
+        - ``booking_id``: every instance tagged with that ``BookingId``
+        - ``tags``: a ``{key: value}`` mapping of tags the instances must carry
+
+    Matching instances are looked up with filtered DescribeInstances calls and
+    the ones in ``action.acts_on`` states are acted on in batches. The
+    response body maps each instance ID to its previous state and the action
+    taken.
+    """
+    try:
+        filters, instance_ids = build_filters(event)
+        logger.info(f"Received request to {action.verb} instances: filters={filters}, instance_ids={instance_ids}")
+
+        states = describe_states(ec2, filters, instance_ids)
+        results = {
+            instance_id: {'previous_state': None, 'action': 'not_found'}
+            for instance_id in instance_ids or []
+        }
+
+        pending = []
+        for instance_id, state in states.items():
+            results[instance_id] = {'previous_state': state, 'action': 'skipped'}
+            if state in action.acts_on:
+                pending.append(instance_id)
+            else:
+                logger.info(f"Not going to {action.verb} instance {instance_id} (current state: {state})")
+
+        for start in range(0, len(pending), ACTION_BATCH_SIZE):
+            apply_batch(ec2, action, pending[start:start + ACTION_BATCH_SIZE], results)
+
+        acted = sum(1 for result in results.values() if result['action'] == action.result)
+        logger.info(f"Initiated {action.verb} for {acted} of {len(results)} instances")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'results': results})
+        }
+
+    except Exception as e:
+        logger.error(f"Error trying to {action.verb} instances: {str(e)}", exc_info=True)
+        raise
+
+def build_filters(event):
+    """Turns the event into DescribeInstances filters and the explicitly requested IDs."""
+    if event.get('instance_ids') or event.get('instance_id'):
+        instance_ids = list(dict.fromkeys(event.get('instance_ids') or [event['instance_id']]))
+        return [], instance_ids
+
+    tags = dict(event.get('tags') or {})
+    if event.get('booking_id') is not None:
+        tags['BookingId'] = str(event['booking_id'])
+    if not tags:
+        raise ValueError("Event must contain instance_id, instance_ids, booking_id or tags")
+
+    return [{'Name': f'tag:{key}', 'Values': [str(value)]} for key, value in tags.items()], None
+
+def describe_states(ec2, filters, instance_ids):
+    """Returns ``{instance_id: state}`` for all matching instances."""
+    if instance_ids is None:
+        filter_sets = [filters]
+    else:
+        filter_sets = [
+            [{'Name': 'instance-id', 'Values': instance_ids[start:start + DESCRIBE_BATCH_SIZE]}]
+            for start in range(0, len(instance_ids), DESCRIBE_BATCH_SIZE)
+        ]
+
+    states = {}
+    paginator = ec2.get_paginator('describe_instances')
+    for filter_set in filter_sets:
+        for page in paginator.paginate(Filters=filter_set):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    states[instance['InstanceId']] = instance['State']['Name']
+    return states
+
+def apply_batch(ec2, action, instance_ids, results):
+    """Applies the action to a batch of instances, falling back to one call per instance if the batch is rejected."""
+    try:
+        response = getattr(ec2, action.method)(InstanceIds=instance_ids)
+        for change in response[action.response_key]:
+            results[change['InstanceId']]['action'] = action.result
+    except Exception as e:
+        if len(instance_ids) == 1:
+            logger.error(f"Error trying to {action.verb} instance {instance_ids[0]}: {str(e)}")
+            results[instance_ids[0]].update(action='error', error=str(e))
+            return
+        logger.warning(f"Batch {action.verb} failed ({str(e)}), retrying instances one by one")
+        for instance_id in instance_ids:
+            apply_batch(ec2, action, [instance_id], results)
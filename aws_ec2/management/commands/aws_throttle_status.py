@@ -0,0 +1,31 @@
+# aws_ec2/management/commands/aws_throttle_status.py
+from django.core.management.base import BaseCommand
+from aws_ec2.ec2_utils.config import config
+from aws_ec2.ec2_utils.throttling import AWSThrottle, CircuitBreaker
+
+class Command(BaseCommand):
+    help = 'Show the shared AWS API rates and the circuit breaker state'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--close', action='store_true',
+                            help='Close the circuit breaker, e.g. after fixing the cause by hand')
+
+    def handle(self, *args, **options):
+        breaker = AWSThrottle.breaker()
+        if options['close']:
+            breaker.close()
+            self.stdout.write("Circuit breaker closed")
+
+        if not config.throttling.ENABLED:
+            self.stdout.write(self.style.WARNING("Throttling is disabled (AWS_THROTTLE_ENABLED)"))
+
+        state = breaker.state()
+        line = f"Circuit breaker: {state}"
+        if state == CircuitBreaker.OPEN:
+            line += f" (probe in {breaker.retry_after():.0f}s)"
+        self.stdout.write(line)
+
+        self.stdout.write(f"{'family':>14} {'rate/s':>8} {'max/s':>8}")
+        for family in config.throttling.RATES:
+            bucket = AWSThrottle.bucket(family)
+            self.stdout.write(f"{family:>14} {bucket.rate():>8.2f} {bucket.max_rate:>8.2f}")
@@ -0,0 +1,48 @@
+# aws_ec2/management/commands/bake_ami.py
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from aws_ec2.models import BakedImage
+from aws_ec2.ec2_utils.config import config
+from aws_ec2.ec2_utils.main import EC2ServiceManager
+from aws_ec2.ec2_utils.user_data import UserDataGenerator
+from aws_ec2.services.logging_service import LoggingService
+
+class Command(BaseCommand):
+    help = 'Bake a golden AMI with TLJH pre-installed and record it for the current JupyterConfig'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--render-only', action='store_true',
+                            help='Print the bake script without launching anything')
+        parser.add_argument('--instance-type', default=None,
+                            help='Builder instance type (defaults to AWS_INSTANCE_TYPE)')
+        parser.add_argument('--timeout', type=int, default=60,
+                            help='Minutes to wait for the bake script to finish')
+
+    def handle(self, *args, **options):
+        if options['render_only']:
+            self.stdout.write(UserDataGenerator().generate_bake_script(
+                requirements_url=config.jupyter.REQUIREMENTS_URL,
+                admin_username=config.jupyter.ADMIN_USERNAME
+            ))
+            return
+
+        fingerprint = config.jupyter.fingerprint()
+        image_name = f"tljh-golden-{fingerprint[:12]}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        self.stdout.write(f"Baking {image_name} from {config.aws.AMI_ID} (this takes several minutes)...")
+
+        ec2_service = EC2ServiceManager(LoggingService.get_logger("bake_ami"))
+        ami_id = ec2_service.build_golden_image(
+            image_name,
+            instance_type=options['instance_type'],
+            timeout_minutes=options['timeout']
+        )
+        if not ami_id:
+            raise CommandError("Failed to bake golden AMI, see the bake_ami log for details")
+
+        BakedImage.objects.create(
+            fingerprint=fingerprint,
+            region=config.aws.REGION,
+            source_ami_id=config.aws.AMI_ID,
+            ami_id=ami_id
+        )
+        self.stdout.write(self.style.SUCCESS(f"Baked {ami_id} for JupyterConfig fingerprint {fingerprint[:12]}"))
@@ -0,0 +1,56 @@
+# aws_ec2/management/commands/benchmark_registration.py
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from aws_ec2.models import Booking
+from aws_ec2.services.booking_service import BookingService
+from aws_ec2.services.credential_service import CredentialService
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Measure registration latency (booking plus hashed credentials) against the number of users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+', default=[1, 10, 25, 50, 100],
+                            help='User counts to measure')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per user count; the best run is reported')
+
+    def handle(self, *args, **options):
+        # Start the pool up front so its start-up cost isn't charged to the first run
+        CredentialService.hash_passwords(['warm-up'] * 4)
+
+        self.stdout.write(f"{'users':>6} {'serial hash':>12} {'pooled hash':>12} {'registration':>13}")
+        for users in options['users']:
+            passwords = ['x' * 32] * users
+            serial = self._best(options['repeat'], lambda: CredentialService.hash_passwords(passwords, parallel=False))
+            pooled = self._best(options['repeat'], lambda: CredentialService.hash_passwords(passwords))
+            registration = self._best(options['repeat'], lambda: self._register(users))
+            self.stdout.write(f"{users:>6} {serial:>11.3f}s {pooled:>11.3f}s {registration:>12.3f}s")
+
+    @staticmethod
+    def _best(repeat, func) -> float:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    @staticmethod
+    def _register(users: int) -> None:
+        """Runs the registration writes in a transaction that is rolled back."""
+        try:
+            with transaction.atomic():
+                booking = Booking.objects.create(
+                    email='benchmark@example.com',
+                    booking_time=timezone.now(),
+                    number_of_users=users
+                )
+                BookingService.create_user_credentials(booking, users)
+                raise _Rollback()
+        except _Rollback:
+            pass
@@ -0,0 +1,61 @@
+# aws_ec2/management/commands/booking_backlog.py
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from aws_ec2.models import Booking
+from aws_ec2.services.booking_service import BookingService
+
+class Command(BaseCommand):
+    help = 'Report bookings waiting to be dispatched and provisioning that is in flight'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--list', type=int, default=0, metavar='N',
+                            help='Also list the next N bookings to be dispatched')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        waiting = Booking.objects.filter(
+            ec2_instances_created=False,
+            provisioning_status=Booking.ProvisioningStatus.PENDING
+        )
+        missed_before = now - timedelta(seconds=settings.BOOKING_DISPATCH_MAX_DELAY)
+        stats = waiting.aggregate(
+            upcoming=Count('id', filter=Q(booking_time__gt=now)),
+            next_hour=Count('id', filter=Q(booking_time__gt=now, booking_time__lte=now + timedelta(hours=1))),
+            next_day=Count('id', filter=Q(booking_time__gt=now, booking_time__lte=now + timedelta(days=1))),
+            next_booking=Min('booking_time', filter=Q(booking_time__gt=now)),
+            in_flight=Count('id', filter=Q(booking_time__lte=now, dispatched_at__isnull=False)),
+            oldest_dispatch=Min('dispatched_at', filter=Q(booking_time__lte=now)),
+            missed=Count('id', filter=Q(booking_time__lt=missed_before)),
+        )
+        due = BookingService.due_bookings(now).count()
+
+        self.stdout.write(
+            f"upcoming: {stats['upcoming']} "
+            f"(next hour: {stats['next_hour']}, next 24h: {stats['next_day']}, "
+            f"next at: {stats['next_booking'] and timezone.localtime(stats['next_booking'])})"
+        )
+        self.stdout.write(f"due, waiting for the dispatcher: {due}")
+        in_flight = f"dispatched, not launched yet: {stats['in_flight']}"
+        if stats['oldest_dispatch']:
+            in_flight += f" (oldest {(now - stats['oldest_dispatch']).total_seconds():.0f}s ago)"
+        self.stdout.write(in_flight)
+        if stats['missed']:
+            self.stdout.write(self.style.WARNING(
+                f"missed: {stats['missed']} bookings more than "
+                f"{settings.BOOKING_DISPATCH_MAX_DELAY}s past their time were never launched"
+            ))
+
+        if options['list']:
+            upcoming = (
+                waiting.filter(booking_time__gte=missed_before)
+                .order_by('booking_time')
+                .values_list('id', 'booking_time', 'number_of_users', 'dispatched_at')[:options['list']]
+            )
+            for booking_id, booking_time, users, dispatched_at in upcoming:
+                self.stdout.write(
+                    f"  #{booking_id} at {timezone.localtime(booking_time):%Y-%m-%d %H:%M} "
+                    f"for {users} users{' (dispatched)' if dispatched_at else ''}"
+                )
@@ -0,0 +1,39 @@
+# aws_ec2/management/commands/email_outbox_stats.py
+import statistics
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+from aws_ec2.models import EmailOutbox
+
+class Command(BaseCommand):
+    help = 'Report email outbox backlog and delivery latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Window for the latency figures')
+
+    def handle(self, *args, **options):
+        counts = dict(EmailOutbox.objects.values_list('status').annotate(total=Count('id')))
+        self.stdout.write(
+            f"pending: {counts.get(EmailOutbox.Status.PENDING, 0)}, "
+            f"sent: {counts.get(EmailOutbox.Status.SENT, 0)}, "
+            f"failed: {counts.get(EmailOutbox.Status.FAILED, 0)}"
+        )
+
+        since = timezone.now() - timedelta(hours=options['hours'])
+        latencies = sorted(
+            (sent_at - created_at).total_seconds()
+            for created_at, sent_at in EmailOutbox.objects
+            .filter(sent_at__gte=since)
+            .values_list('created_at', 'sent_at')
+        )
+        if not latencies:
+            self.stdout.write(f"No emails sent in the last {options['hours']}h")
+            return
+
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"Delivery latency over {len(latencies)} emails in the last {options['hours']}h: "
+            f"p50 {statistics.median(latencies):.1f}s, p95 {p95:.1f}s, max {latencies[-1]:.1f}s"
+        )
@@ -0,0 +1,60 @@
+# aws_ec2/management/commands/plan_instances.py
+from django.core.management.base import BaseCommand
+from aws_ec2.ec2_utils.config import config
+from aws_ec2.ec2_utils.placement import InstancePlanner
+
+class Command(BaseCommand):
+    help = 'Dry run of the placement planner: print the instances a booking would launch, without launching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', type=int, help='Number of users in the booking')
+        parser.add_argument('--user-vcpus', type=float,
+                            help='vCPUs per user (defaults to PLACEMENT_USER_VCPUS)')
+        parser.add_argument('--user-memory', type=float,
+                            help='Memory per user in GiB (defaults to PLACEMENT_USER_MEMORY_GIB)')
+        parser.add_argument('--instance-types',
+                            help='Comma-separated candidate types (defaults to PLACEMENT_INSTANCE_TYPES)')
+
+    def handle(self, *args, **options):
+        instance_types = None
+        if options['instance_types']:
+            instance_types = [name.strip() for name in options['instance_types'].split(',') if name.strip()]
+
+        candidates = InstancePlanner.candidates(options['user_vcpus'], options['user_memory'], instance_types)
+        plan = InstancePlanner.plan(options['users'], options['user_vcpus'], options['user_memory'], instance_types)
+
+        self.stdout.write(
+            f"{plan.users} users at {plan.user_vcpus:g} vCPUs / {plan.user_memory_gib:g} GiB each, "
+            f"{config.placement.INSTANCE_OVERHEAD:g} per extra instance"
+        )
+        self.stdout.write(f"{'type':>12} {'vCPUs':>6} {'GiB':>6} {'$/h':>8} {'users':>6}")
+        for spec in candidates:
+            self.stdout.write(
+                f"{spec.instance_type:>12} {spec.vcpus:>6} {spec.memory_gib:>6g} "
+                f"{spec.hourly_price:>8.4f} {spec.capacity:>6}"
+            )
+
+        if plan.fallback:
+            self.stdout.write(self.style.WARNING(
+                f"No candidate fits one user; falling back to {config.jupyter.DEFAULT_USERS_PER_INSTANCE} "
+                f"users per {config.aws.INSTANCE_TYPE}"
+            ))
+        self.stdout.write(
+            f"Plan: {plan.instance_count} instances, ${plan.hourly_cost:.4f}/h, "
+            f"{plan.vcpus if plan.vcpus is not None else '?'} vCPUs"
+        )
+        groups = {}
+        for spec, users in plan.instances:
+            groups.setdefault((spec, users), 0)
+            groups[(spec, users)] += 1
+        for (spec, users), count in groups.items():
+            line = f"  {count} x {spec.instance_type} with {users} users"
+            if spec.vcpus is not None:
+                line += f" ({spec.vcpus / users:.2f} vCPUs, {spec.memory_gib / users:.2f} GiB per user)"
+            self.stdout.write(line)
+
+        fixed = InstancePlanner.fixed_plan(options['users'], plan.user_vcpus, plan.user_memory_gib)
+        self.stdout.write(
+            f"Without the planner ({config.jupyter.DEFAULT_USERS_PER_INSTANCE} users per {config.aws.INSTANCE_TYPE}): "
+            f"{fixed.instance_count} instances, ${fixed.hourly_cost:.4f}/h"
+        )
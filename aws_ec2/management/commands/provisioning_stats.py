@@ -0,0 +1,40 @@
+# aws_ec2/management/commands/provisioning_stats.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from aws_ec2.models import ProvisioningDuration
+from aws_ec2.services.booking_service import BookingService
+from aws_ec2.services.lead_time_service import LeadTimeService
+
+class Command(BaseCommand):
+    help = 'Show measured launch-to-ready times and the provisioning lead times derived from them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ami', help='AMI ID (defaults to the image bookings currently launch from)')
+        parser.add_argument('--instance-type',
+                            help='Instance type (defaults to all types, as used for lead times)')
+
+    def handle(self, *args, **options):
+        ami_id = options['ami'] or BookingService.resolve_image()[0]
+        instance_type = options['instance_type']
+        self.stdout.write(
+            f"{ami_id} / {instance_type or 'all types'}: p{settings.LEAD_TIME_PERCENTILE:g} of the last "
+            f"{settings.LEAD_TIME_WINDOW} samples + {settings.LEAD_TIME_MARGIN}s margin "
+            f"(default {settings.LEAD_TIME_DEFAULT}s below {settings.LEAD_TIME_MIN_SAMPLES} samples, "
+            f"max {settings.LEAD_TIME_MAX}s)"
+        )
+
+        def seconds(value):
+            return '-' if value is None else f"{value:.0f}s"
+
+        self.stdout.write(f"{'instances':>10} {'samples':>8} {'p50':>7} {'pctl':>7} {'max':>7} {'lead':>7}  basis")
+        for stats in LeadTimeService.bucket_stats(ami_id, instance_type):
+            self.stdout.write(
+                f"{stats['instances']:>10} {stats['samples']:>8} {seconds(stats['p50']):>7} "
+                f"{seconds(stats['percentile']):>7} {seconds(stats['max']):>7} "
+                f"{seconds(stats['lead_time']):>7}  {stats['source']}"
+            )
+
+        recorded = ProvisioningDuration.objects.values_list('ami_id', 'instance_type').distinct()
+        for other_ami, other_type in recorded:
+            if other_ami != ami_id or instance_type not in (None, other_type):
+                self.stdout.write(f"Also recorded: --ami {other_ami} --instance-type {other_type}")
@@ -0,0 +1,10 @@
+# aws_ec2/management/commands/rebuild_slot_capacity.py
+from django.core.management.base import BaseCommand
+from aws_ec2.services.capacity_service import CapacityService
+
+class Command(BaseCommand):
+    help = 'Recompute the per-slot capacity reserved by upcoming bookings'
+
+    def handle(self, *args, **options):
+        count = CapacityService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt slot capacity from {count} upcoming bookings"))
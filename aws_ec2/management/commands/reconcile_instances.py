@@ -0,0 +1,38 @@
+# aws_ec2/management/commands/reconcile_instances.py
+from django.core.management.base import BaseCommand
+from aws_ec2.models import CleanupCandidate
+from aws_ec2.services.reconcile_service import ReconcileService
+
+class Command(BaseCommand):
+    help = 'Sync EC2Instance rows with EC2 now and list the orphan and zombie instances flagged for cleanup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-sweep', action='store_true',
+                            help='Only list the open cleanup candidates')
+        parser.add_argument('--terminate', action='store_true',
+                            help='Terminate the listed instances')
+        parser.add_argument('--reason', choices=CleanupCandidate.Reason.values,
+                            help='Only candidates flagged for this reason')
+
+    def handle(self, *args, **options):
+        if not options['no_sweep']:
+            stats = ReconcileService.reconcile()
+            self.stdout.write(
+                f"Swept {stats['swept']} instances: {stats['updated']} rows updated, {stats['gone']} gone, "
+                f"{stats['tagged']} tagged, {stats['resolved']} candidates resolved"
+            )
+
+        candidates = CleanupCandidate.objects.filter(resolved_at__isnull=True).order_by('reason', 'first_seen_at')
+        if options['reason']:
+            candidates = candidates.filter(reason=options['reason'])
+
+        self.stdout.write(f"{'reason':>7} {'instance':>20} {'region':>15} {'state':>9} {'booking':>8}  first seen")
+        for candidate in candidates:
+            self.stdout.write(
+                f"{candidate.reason:>7} {candidate.instance_id:>20} {candidate.region:>15} "
+                f"{candidate.state:>9} {candidate.booking_id or '-':>8}  {candidate.first_seen_at:%Y-%m-%d %H:%M}"
+            )
+
+        if options['terminate']:
+            terminated = ReconcileService.terminate_candidates(options['reason'])
+            self.stdout.write(self.style.WARNING(f"Terminated {terminated} instances"))
@@ -1,8 +1,9 @@
 # aws_ec2/management/commands/test_ec2_creation.py
 
 from django.core.management.base import BaseCommand
-from aws_ec2.ec2_utils import create_ec2_instances
-from aws_ec2.models import UserCredential
+from aws_ec2.ec2_utils.main import EC2ServiceManager
+from aws_ec2.services.credential_service import CredentialService
+from aws_ec2.services.logging_service import LoggingService
 
 class Command(BaseCommand):
     help = 'Test EC2 instance creation'
@@ -12,15 +13,21 @@ class Command(BaseCommand):
         
         # Create some dummy credentials
         dummy_credentials = [
-            UserCredential(username='testuser1', password='testpass1'),
-            UserCredential(username='testuser2', password='testpass2'),
+            {'username': 'testuser1', 'password_hash': CredentialService.shadow_hash('testpass1')},
+            {'username': 'testuser2', 'password_hash': CredentialService.shadow_hash('testpass2')},
         ]
         
-        instances = create_ec2_instances(dummy_credentials)
+        ec2_service = EC2ServiceManager(LoggingService.get_logger("test_ec2_creation"))
+        result = ec2_service.create_ec2_instances(dummy_credentials)
         
+        if result is None:
+            self.stdout.write(self.style.ERROR("Failed to create EC2 instances"))
+            return
+
+        instances, failures = result
         if instances:
             self.stdout.write(self.style.SUCCESS(f"Successfully created {len(instances)} EC2 instances"))
-            for instance, users in instances:
+            for instance, users, _ in instances:
                 self.stdout.write(f"Instance ID: {instance.id}, Public DNS: {instance.public_dns_name}")
-        else:
-            self.stdout.write(self.style.ERROR("Failed to create EC2 instances"))
+        for position, error in failures.items():
+            self.stdout.write(self.style.ERROR(f"Instance {position} failed to launch: {error}"))
@@ -0,0 +1,43 @@
+# aws_ec2/management/commands/warm_pool_status.py
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from aws_ec2.ec2_utils.config import config
+from aws_ec2.models import WarmPoolInstance
+from aws_ec2.services.booking_service import BookingService
+from aws_ec2.services.warm_pool_service import WarmPoolService
+
+class Command(BaseCommand):
+    help = 'Show the warm pool per fingerprint, optionally health-checking and refilling it first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refill', action='store_true',
+                            help='Run the health check and refill before reporting')
+
+    def handle(self, *args, **options):
+        if options['refill']:
+            ami_id, prebaked = BookingService.resolve_image()
+            stats = WarmPoolService.refill(ami_id, prebaked)
+            self.stdout.write(f"Launched {stats['launched']}, retired {stats['retired']}")
+
+        current = WarmPoolService.fingerprint()
+        self.stdout.write(f"Target size: {config.warm_pool.SIZE} (fingerprint {current[:12]})")
+
+        rows = (
+            WarmPoolInstance.objects
+            .exclude(state=WarmPoolInstance.State.RETIRED)
+            .values_list('fingerprint', 'state')
+            .annotate(total=Count('id'))
+            .order_by('fingerprint', 'state')
+        )
+        for fingerprint, state, total in rows:
+            marker = '' if fingerprint == current else ' (outdated)'
+            self.stdout.write(f"  {fingerprint[:12]}{marker} {state}: {total}")
+
+        retired = dict(
+            WarmPoolInstance.objects
+            .filter(state=WarmPoolInstance.State.RETIRED)
+            .values_list('retired_reason')
+            .annotate(total=Count('id'))
+        )
+        if retired:
+            self.stdout.write("Retired: " + ", ".join(f"{reason} {total}" for reason, total in sorted(retired.items())))
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='provisioning_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('launched', 'Launched'), ('running', 'Running'), ('ready', 'TLJH ready'), ('notified', 'Notified'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='status_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ec2instance',
+            name='admin_password',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ec2instance',
+            name='state',
+            field=models.CharField(default='pending', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='usercredential',
+            name='ec2_instance',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='user_credentials', to='aws_ec2.ec2instance'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0002_provisioning_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ec2instance',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0003_ec2instance_ready_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BakedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, max_length=64)),
+                ('region', models.CharField(max_length=32)),
+                ('source_ami_id', models.CharField(max_length=32)),
+                ('ami_id', models.CharField(max_length=32, unique=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'get_latest_by': 'created_at',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0004_bakedimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ec2instance',
+            name='launched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ec2instance',
+            name='instance_id',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0005_ec2instance_launched_at_unique_instance_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usercredential',
+            name='password',
+            field=models.CharField(max_length=255),
+        ),
+    ]
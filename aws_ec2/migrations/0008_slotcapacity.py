@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0007_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotCapacity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_start', models.DateTimeField(unique=True)),
+                ('instances', models.PositiveIntegerField(default=0)),
+                ('vcpus', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='reserved_instances',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='reserved_vcpus',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
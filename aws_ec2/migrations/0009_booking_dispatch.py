@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0008_slotcapacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booking_time', 'ec2_instances_created'], name='aws_ec2_boo_booking_5d88a3_idx'),
+        ),
+    ]
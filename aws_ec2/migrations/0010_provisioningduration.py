@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0009_booking_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ec2instance',
+            name='ami_id',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='ec2instance',
+            name='instance_type',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.CreateModel(
+            name='ProvisioningDuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ami_id', models.CharField(max_length=32)),
+                ('instance_type', models.CharField(max_length=32)),
+                ('number_of_users', models.PositiveIntegerField()),
+                ('instance_count', models.PositiveIntegerField()),
+                ('seconds', models.FloatField()),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('booking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='aws_ec2.booking')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ami_id', 'instance_type', 'instance_count', 'recorded_at'], name='aws_ec2_pro_ami_id_fe8936_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0010_provisioningduration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ec2instance',
+            name='from_warm_pool',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='WarmPoolInstance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instance_id', models.CharField(max_length=20, unique=True)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('ami_id', models.CharField(max_length=32)),
+                ('instance_type', models.CharField(max_length=32)),
+                ('state', models.CharField(choices=[('provisioning', 'Installing'), ('available', 'Available'), ('claimed', 'Claimed'), ('retired', 'Retired')], default='provisioning', max_length=16)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+                ('retired_reason', models.CharField(blank=True, max_length=64)),
+                ('booking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='aws_ec2.booking')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fingerprint', 'state', 'ready_at'], name='aws_ec2_war_fingerp_642ab1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0011_warmpoolinstance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('client_token', models.CharField(max_length=64, unique=True)),
+                ('instance_type', models.CharField(max_length=32)),
+                ('usernames', models.JSONField(default=list)),
+                ('admin_password', models.CharField(max_length=64)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('launched', 'Launched'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provisioning_records', to='aws_ec2.booking')),
+                ('instance', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='provisioning_record', to='aws_ec2.ec2instance')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['booking', 'state', 'next_attempt_at'], name='aws_ec2_pro_booking_f2c6ce_idx')],
+                'constraints': [models.UniqueConstraint(fields=('booking', 'position'), name='unique_provisioning_position')],
+            },
+        ),
+    ]
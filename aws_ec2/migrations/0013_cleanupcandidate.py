@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0012_provisioningrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleanupCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('instance_id', models.CharField(db_index=True, max_length=20)),
+                ('region', models.CharField(max_length=32)),
+                ('reason', models.CharField(choices=[('orphan', 'Orphan'), ('zombie', 'Zombie')], max_length=16)),
+                ('instance_type', models.CharField(blank=True, max_length=32)),
+                ('state', models.CharField(max_length=16)),
+                ('launched_at', models.DateTimeField(blank=True, null=True)),
+                ('first_seen_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('resolution', models.CharField(blank=True, max_length=16)),
+                ('booking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='aws_ec2.booking')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolved_at', 'reason'], name='aws_ec2_cle_resolve_ceed6f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:33
+
+import secrets
+
+from django.db import migrations, models
+
+
+def add_nonces(apps, schema_editor):
+    # Records still to be launched get a fresh admin password
+    ProvisioningRecord = apps.get_model('aws_ec2', 'ProvisioningRecord')
+    records = list(ProvisioningRecord.objects.filter(state='pending'))
+    for record in records:
+        record.admin_password_nonce = secrets.token_hex(16)
+    ProvisioningRecord.objects.bulk_update(records, ['admin_password_nonce'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0013_cleanupcandidate'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='provisioningrecord',
+            name='admin_password',
+        ),
+        migrations.AddField(
+            model_name='provisioningrecord',
+            name='admin_password_nonce',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.RunPython(add_nonces, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0014_provisioningrecord_admin_password_nonce'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='ec2instance',
+            name='admin_password',
+        ),
+        migrations.AddField(
+            model_name='ec2instance',
+            name='admin_password_nonce',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def clear_failed_bodies(apps, schema_editor):
+    # Failed messages are never sent; don't keep the credentials they may hold
+    EmailOutbox = apps.get_model('aws_ec2', 'EmailOutbox')
+    EmailOutbox.objects.filter(status='failed').exclude(body='').update(body='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_ec2', '0016_emailoutbox_claimed_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_failed_bodies, migrations.RunPython.noop),
+    ]
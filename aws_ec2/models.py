@@ -3,26 +3,69 @@ import datetime
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password
+from .hashers import SHA512CryptPasswordHasher
 
 
 
 class Booking(models.Model):
+    class ProvisioningStatus(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        LAUNCHED = 'launched', 'Launched'
+        RUNNING = 'running', 'Running'
+        READY = 'ready', 'TLJH ready'
+        NOTIFIED = 'notified', 'Notified'
+        FAILED = 'failed', 'Failed'
+
     email = models.EmailField(unique=True)
     booking_time = models.DateTimeField(default=timezone.now)
     number_of_users = models.IntegerField(default=1)
     ec2_instances_created = models.BooleanField(default=False)
+    provisioning_status = models.CharField(
+        max_length=16,
+        choices=ProvisioningStatus.choices,
+        default=ProvisioningStatus.PENDING
+    )
+    status_changed_at = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)  # when the dispatcher queued provisioning
+    # What the booking holds in SlotCapacity, so it can be released exactly
+    reserved_instances = models.PositiveIntegerField(default=0)
+    reserved_vcpus = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['booking_time', 'ec2_instances_created'])]
 
     def __str__(self):
         return f"Booking for {self.email} at {self.booking_time}"
 
+class SlotCapacity(models.Model):
+    """
+    Instances and vCPUs reserved per booking time slot, kept up to date by
+    CapacityService so admission checks read a few rows instead of scanning
+    bookings.
+    """
+    slot_start = models.DateTimeField(unique=True)
+    instances = models.PositiveIntegerField(default=0)
+    vcpus = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Slot {self.slot_start}: {self.instances} instances, {self.vcpus} vCPUs"
+
 class UserCredential(models.Model):
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='user_credentials')
     username = models.CharField(max_length=32, unique=True)
-    password = models.CharField(max_length=64)
+    password = models.CharField(max_length=255)  # SHA-512 crypt hash, see aws_ec2.hashers
+    ec2_instance = models.ForeignKey(
+        'EC2Instance',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='user_credentials'
+    )
 
     def save(self, *args, **kwargs):
-        if not self.pk:  # Only hash the password if it's a new instance
-            self.password = make_password(self.password)
+        # Only hash new instances, and not when the password was hashed in bulk already
+        if not self.pk and not SHA512CryptPasswordHasher.is_encoded(self.password):
+            self.password = make_password(self.password, hasher=SHA512CryptPasswordHasher.algorithm)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -30,8 +73,172 @@ class UserCredential(models.Model):
 
 class EC2Instance(models.Model):
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='ec2_instances')
-    instance_id = models.CharField(max_length=20)
+    instance_id = models.CharField(max_length=20, unique=True)
     public_dns = models.CharField(max_length=255)
+    state = models.CharField(max_length=16, default='pending')
+    # The admin password is derived from this (see CredentialService.admin_password); cleared once notified
+    admin_password_nonce = models.CharField(max_length=32, blank=True)
+    ami_id = models.CharField(max_length=32, blank=True)
+    instance_type = models.CharField(max_length=32, blank=True)
+    from_warm_pool = models.BooleanField(default=False)
+    launched_at = models.DateTimeField(null=True, blank=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"EC2 Instance {self.instance_id} for Booking ID: {self.booking.id}"
+
+class ProvisioningRecord(models.Model):
+    """
+    One planned instance of a booking, written before it is launched. The
+    client token makes RunInstances idempotent, so a retry adopts an
+    instance an earlier attempt launched instead of launching another.
+    """
+
+    class State(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        LAUNCHED = 'launched', 'Launched'
+        FAILED = 'failed', 'Failed'
+
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='provisioning_records')
+    position = models.PositiveSmallIntegerField()
+    client_token = models.CharField(max_length=64, unique=True)
+    instance_type = models.CharField(max_length=32)
+    usernames = models.JSONField(default=list)
+    # The admin password is derived from this (see CredentialService.admin_password); cleared once launched
+    admin_password_nonce = models.CharField(max_length=32, blank=True)
+    state = models.CharField(max_length=16, choices=State.choices, default=State.PENDING)
+    instance = models.OneToOneField(
+        EC2Instance,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='provisioning_record'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)  # also the lease of a running attempt
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['booking', 'position'], name='unique_provisioning_position')
+        ]
+        indexes = [models.Index(fields=['booking', 'state', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"Instance {self.position} of booking {self.booking_id} ({self.state})"
+
+class CleanupCandidate(models.Model):
+    """
+    Instance flagged by the reconciler: an orphan nothing in the database
+    accounts for, or a zombie still running after its booking ended.
+    Resolved once the instance is gone or accounted for again.
+    """
+
+    class Reason(models.TextChoices):
+        ORPHAN = 'orphan', 'Orphan'
+        ZOMBIE = 'zombie', 'Zombie'
+
+    instance_id = models.CharField(max_length=20, db_index=True)
+    region = models.CharField(max_length=32)
+    reason = models.CharField(max_length=16, choices=Reason.choices)
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    instance_type = models.CharField(max_length=32, blank=True)
+    state = models.CharField(max_length=16)
+    launched_at = models.DateTimeField(null=True, blank=True)
+    first_seen_at = models.DateTimeField(default=timezone.now)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    resolution = models.CharField(max_length=16, blank=True)  # gone, cleared or terminated
+
+    class Meta:
+        indexes = [models.Index(fields=['resolved_at', 'reason'])]
+
+    def __str__(self):
+        return f"{self.get_reason_display()} {self.instance_id} in {self.region} ({self.state})"
+
+class WarmPoolInstance(models.Model):
+    """Pre-installed, stopped instance waiting to be claimed by a booking."""
+
+    class State(models.TextChoices):
+        PROVISIONING = 'provisioning', 'Installing'
+        AVAILABLE = 'available', 'Available'
+        CLAIMED = 'claimed', 'Claimed'
+        RETIRED = 'retired', 'Retired'
+
+    instance_id = models.CharField(max_length=20, unique=True)
+    fingerprint = models.CharField(max_length=64)  # see WarmPoolService.fingerprint
+    ami_id = models.CharField(max_length=32)
+    instance_type = models.CharField(max_length=32)
+    state = models.CharField(max_length=16, choices=State.choices, default=State.PROVISIONING)
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    retired_reason = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['fingerprint', 'state', 'ready_at'])]
+
+    def __str__(self):
+        return f"Warm pool instance {self.instance_id} ({self.state})"
+
+class ProvisioningDuration(models.Model):
+    """
+    Measured launch-to-ready time of one booking, used to start provisioning
+    early enough for the hub to be ready at the booking time.
+    """
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    ami_id = models.CharField(max_length=32)
+    instance_type = models.CharField(max_length=32)
+    number_of_users = models.PositiveIntegerField()
+    instance_count = models.PositiveIntegerField()
+    seconds = models.FloatField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['ami_id', 'instance_type', 'instance_count', 'recorded_at'])]
+
+    def __str__(self):
+        return f"{self.seconds:.0f}s for {self.instance_count} x {self.instance_type} ({self.ami_id})"
+
+class BakedImage(models.Model):
+    """Golden AMI with TLJH pre-installed, built by the bake_ami command."""
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    region = models.CharField(max_length=32)
+    source_ami_id = models.CharField(max_length=32)
+    ami_id = models.CharField(max_length=32, unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        get_latest_by = 'created_at'
+
+    def __str__(self):
+        return f"Baked image {self.ami_id} from {self.source_ami_id} ({self.fingerprint[:12]})"
+
+class EmailOutbox(models.Model):
+    """Outgoing email, delivered in batches by the deliver_email_outbox task."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()  # Cleared once sent or failed, it may hold credentials
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # last claimed for sending; leased until next_attempt_at
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"Email '{self.subject}' to {self.to_email} ({self.status})"
@@ -1,97 +1,769 @@
 # aws_ec2/services/booking_service.py
+import math
 import secrets
+from collections import defaultdict
+from datetime import timedelta
 from typing import List, Tuple, Optional
-from ..models import Booking, UserCredential, EC2Instance
+from ..models import Booking, UserCredential, EC2Instance, BakedImage, ProvisioningRecord, WarmPoolInstance
+from ..ec2_utils.instance_manager import InstanceGoneError
 from ..ec2_utils.main import EC2ServiceManager
 from ..ec2_utils.config import config
+from ..ec2_utils.placement import InstancePlanner
+from ..ec2_utils.throttling import AWSThrottle
+from .capacity_service import CapacityService
+from .credential_service import CredentialService
+from .lead_time_service import LeadTimeService
+from .warm_pool_service import WarmPoolService
+from .email_service import EmailService
 from .logging_service import LoggingService
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import Min, Q
+from django.urls import reverse
 from django.utils import timezone
 
 logger = LoggingService.get_logger("booking_service")
 
+# Instance states that mean an instance will never become ready
+FAILED_INSTANCE_STATES = ('shutting-down', 'terminated', 'stopping', 'stopped')
+
+READY_CALLBACK_SALT = 'aws_ec2.instance_ready'
+BOOKING_STATUS_SALT = 'aws_ec2.booking_status'
+READY_TOKEN_MAX_AGE = 24 * 60 * 60  # seconds
+
 class BookingService:
     """Handles booking and EC2 instance creation"""
     
     @staticmethod
     def create_user_credentials(booking: Booking, number_of_users: int) -> List[UserCredential]:
+        """
+        Generates and stores credentials for a booking.
+
+        Only the hashes are persisted. The plaintext passwords, needed for
+        the confirmation email and page, are kept on the returned objects as
+        ``plaintext_password`` and never written anywhere.
+        """
+        passwords = [secrets.token_hex(16) for _ in range(number_of_users)]
+        hashes = CredentialService.hash_passwords(passwords)
+
         credentials = [
             UserCredential(
                 booking=booking,
                 username=secrets.token_hex(8),
-                password=secrets.token_hex(16)
+                password=password_hash
             )
-            for _ in range(number_of_users)
+            for password_hash in hashes
         ]
         UserCredential.objects.bulk_create(credentials)
+
+        for credential, password in zip(credentials, passwords):
+            credential.plaintext_password = password
         return credentials
 
     @staticmethod
-    def create_instances(booking: Booking, credentials: List[UserCredential]) -> Optional[List[Tuple]]:
-        try:
-            for cred in credentials:
-                logger.debug(f"Credential object: {cred}, Username: {cred.username}, Password: {cred.password}")
+    def create_instances(booking: Booking,
+                         credentials: List[UserCredential],
+                         wait_until_ready: bool = True) -> Optional[List[Tuple]]:
+        """
+        Launches the EC2 instances for a booking and records them.
+
+        With ``wait_until_ready=False`` this returns right after launch and
+        moves the booking to LAUNCHED; ``advance_provisioning`` then tracks it
+        the rest of the way.
+
+        Instances are taken from the warm pool first (see
+        ``WarmPoolService``). The users left over are planned into
+        ``ProvisioningRecord`` rows, committed before anything is launched.
+        Each record launches under its own client token and is retried on
+        its own, so calling this again for a booking resumes it: instances
+        an earlier attempt launched are adopted and only the missing ones
+        are launched. The booking goes ahead once no record is waiting for
+        a retry (see ``schedule_provisioning_retry``), without the users
+        whose instance failed ``PROVISIONING_MAX_ATTEMPTS`` times.
 
+        Returns:
+            Optional[List[Tuple]]: The booking's (instance, users,
+            admin_credentials), or None if no instance could be launched
+        """
+        try:
             ec2_service = EC2ServiceManager(logger)
-            
-            credential_dicts = [
-                {"username": cred.username, "password": cred.password}
-                for cred in credentials
-            ]
-            logger.debug(f"Credential dicts: {credential_dicts}")
+            ami_id, prebaked = BookingService.resolve_image()
+
+            # Bookings dispatched ahead of time (see LeadTimeService) keep their full session
+            early_minutes = max(0, math.ceil((booking.booking_time - timezone.now()).total_seconds() / 60))
+
+            launch_options = {
+                'callback_url': BookingService.get_ready_callback_url(booking),
+                'tags': {'BookingId': str(booking.id)},
+                'shutdown_delay_minutes': config.aws.SHUTDOWN_DELAY_MINUTES + early_minutes,
+            }
 
-            instance_results = ec2_service.create_ec2_instances(
-                credentials=credential_dicts,
-                users_per_instance=config.jupyter.DEFAULT_USERS_PER_INSTANCE
+            credentials_by_username = {cred.username: cred for cred in credentials}
+
+            def as_dicts(creds: List[UserCredential]) -> List[dict]:
+                return [
+                    {"username": cred.username, "password_hash": CredentialService.shadow_hash(cred.password)}
+                    for cred in creds
+                ]
+
+            # Pool instances are INSTANCE_TYPE; fill them as the planner would
+            users_per_instance = (
+                InstancePlanner.capacity(config.aws.INSTANCE_TYPE) or config.jupyter.DEFAULT_USERS_PER_INSTANCE
             )
 
-            if not instance_results:
-                raise Exception("Failed to create EC2 instances")
-            
-            instance_info = []
-            for ec2_instance, users, pawsey_credentials in instance_results:
-                instance = EC2Instance.objects.create(
+            instance_results = []
+            warm, warm_credentials = BookingService._plan_provisioning(booking, credentials, users_per_instance)
+            warm_nonces = {instance.instance_id: CredentialService.new_admin_nonce() for instance in warm}
+            if warm:
+                warm_results = ec2_service.start_warm_instances(
+                    [instance.instance_id for instance in warm],
+                    as_dicts(warm_credentials),
+                    users_per_instance=users_per_instance,
+                    schedule_name=f"booking-{booking.id}-warm",
+                    admin_passwords={
+                        instance_id: CredentialService.admin_password(nonce)
+                        for instance_id, nonce in warm_nonces.items()
+                    },
+                    **launch_options
+                )
+                if warm_results and (
+                    not wait_until_ready or ec2_service.instance_manager.wait_for_instances(warm_results)
+                ):
+                    instance_results.extend((None, result) for result in warm_results)
+                else:
+                    logger.warning(f"Warm pool instances failed to start for booking {booking.id}; launching cold")
+                    WarmPoolService.retire(warm, 'start failed', ec2_service)
+                    BookingService._plan_provisioning(booking, warm_credentials, users_per_instance, use_warm_pool=False)
+
+            now = timezone.now()
+            with transaction.atomic():
+                records = list(
+                    booking.provisioning_records
+                    .select_for_update(skip_locked=True)
+                    .filter(state=ProvisioningRecord.State.PENDING, next_attempt_at__lte=now)
+                    .order_by('position')
+                )
+                # Tokens tried before may already have an instance, e.g. if a worker died mid-launch
+                adopt_tokens = [record.client_token for record in records if record.attempts]
+                for record in records:
+                    record.attempts += 1
+                    # Leased until then; another attempt will only pick it up if this one dies
+                    record.next_attempt_at = now + timedelta(seconds=settings.PROVISIONING_LEASE)
+                ProvisioningRecord.objects.bulk_update(records, ['attempts', 'next_attempt_at'])
+
+            failures = {}
+            if records:
+                logger.debug(
+                    "Launching instances for users: %s",
+                    ', '.join(username for record in records for username in record.usernames)
+                )
+                results, failures = ec2_service.launch_planned_instances(
+                    [
+                        {
+                            'client_token': record.client_token,
+                            'instance_type': record.instance_type,
+                            'users': as_dicts([
+                                credentials_by_username[username]
+                                for username in record.usernames if username in credentials_by_username
+                            ]),
+                            'admin_password': CredentialService.admin_password(record.admin_password_nonce),
+                        }
+                        for record in records
+                    ],
+                    adopt_tokens=adopt_tokens,
+                    wait_until_ready=wait_until_ready,
+                    schedule_name=f"booking-{booking.id}",
+                    ami_id=ami_id,
+                    prebaked=prebaked,
+                    **launch_options
+                )
+                instance_results.extend(
+                    (record, results[record.client_token]) for record in records if record.client_token in results
+                )
+
+            warm_ids = {instance.instance_id for instance in warm}
+            instances = [
+                EC2Instance(
                     booking=booking,
                     instance_id=ec2_instance.id,
-                    public_dns=ec2_instance.public_dns_name
+                    # Not assigned yet right after launch; filled in once running
+                    public_dns=ec2_instance.public_dns_name if wait_until_ready else '',
+                    state=ec2_instance.state['Name'],
+                    launched_at=ec2_instance.launch_time,
+                    ami_id=ec2_instance.image_id,
+                    instance_type=ec2_instance.instance_type,
+                    from_warm_pool=ec2_instance.id in warm_ids,
+                    admin_password_nonce=record.admin_password_nonce if record else warm_nonces[ec2_instance.id]
                 )
-                instance_info.append((instance, users, pawsey_credentials))
-            
-            booking.ec2_instances_created = True
-            booking.save()
-            
-            return instance_info
+                for record, (ec2_instance, _, _) in instance_results
+            ]
+
+            with transaction.atomic():
+                EC2Instance.objects.bulk_create(instances)
+
+                assigned = []
+                for instance, (record, (_, users, _)) in zip(instances, instance_results):
+                    for user in users:
+                        cred = credentials_by_username[user['username']]
+                        cred.ec2_instance = instance
+                        assigned.append(cred)
+                    if record:
+                        record.state = ProvisioningRecord.State.LAUNCHED
+                        record.instance = instance
+                        record.last_error = ''
+                        record.admin_password_nonce = ''
+                UserCredential.objects.bulk_update(assigned, ['ec2_instance'])
+
+                for record in records:
+                    if record.client_token in failures:
+                        BookingService._record_launch_failure(record, failures[record.client_token])
+                ProvisioningRecord.objects.bulk_update(
+                    records, ['state', 'instance', 'client_token', 'next_attempt_at', 'last_error', 'admin_password_nonce']
+                )
+
+            pending = booking.provisioning_records.filter(state=ProvisioningRecord.State.PENDING).count()
+            if pending:
+                logger.warning(
+                    f"Launched {len(instances)} instances for booking {booking.id}; "
+                    f"{pending} waiting for a retry"
+                )
+                return BookingService.get_instance_info(booking)
+
+            if not booking.ec2_instances.exists():
+                raise Exception("Failed to create EC2 instances")
+
+            unplaced = booking.user_credentials.filter(ec2_instance__isnull=True).count()
+            if unplaced:
+                logger.error(
+                    f"Booking {booking.id} goes ahead without {unplaced} users: "
+                    f"their instances failed {settings.PROVISIONING_MAX_ATTEMPTS} times"
+                )
+
+            with transaction.atomic():
+                Booking.objects.filter(pk=booking.pk).update(ec2_instances_created=True)
+                booking.ec2_instances_created = True
+
+                if not wait_until_ready:
+                    BookingService._transition(
+                        booking,
+                        Booking.ProvisioningStatus.PENDING,
+                        Booking.ProvisioningStatus.LAUNCHED
+                    )
+
+            return BookingService.get_instance_info(booking)
             
         except Exception as e:
             logger.error(f"Error creating EC2 instances: {str(e)}", exc_info=True)
             return None
 
     @staticmethod
-    def schedule_instance_creation(booking: Booking):
+    def _plan_provisioning(booking: Booking,
+                           credentials: List[UserCredential],
+                           users_per_instance: int,
+                           use_warm_pool: bool = True) -> Tuple[List[WarmPoolInstance], List[UserCredential]]:
         """
-        Schedules the instance creation task for the booking time
+        Writes ``ProvisioningRecord`` rows for the users that have neither an
+        instance nor a record yet, under a lock on the booking so concurrent
+        attempts don't plan the same users twice. The warm pool is only used
+        when the booking has no records at all, i.e. on its first attempt.
+
+        Returns:
+            Tuple[List[WarmPoolInstance], List[UserCredential]]: Claimed warm
+            pool instances and the users to start them for
         """
-        try:
-            from ..tasks import create_scheduled_instances
-            
-            # Calculate delay in seconds from now until booking time
-            now = timezone.localtime(timezone.now(), booking.booking_time.tzinfo)
-            delay = (booking.booking_time - now).total_seconds()
-            
-            if delay > 0:
-                create_scheduled_instances.apply_async(
-                    args=[booking.id],
-                    eta=booking.booking_time
+        with transaction.atomic():
+            Booking.objects.select_for_update().filter(pk=booking.pk).first()
+
+            existing = list(booking.provisioning_records.values_list('position', 'usernames'))
+            planned = {username for _, usernames in existing for username in usernames}
+            unplanned = [
+                cred for cred in credentials
+                if cred.ec2_instance_id is None and cred.username not in planned
+            ]
+
+            warm, warm_credentials = [], []
+            if use_warm_pool and not existing and unplanned:
+                warm = WarmPoolService.claim(booking, math.ceil(len(unplanned) / users_per_instance))
+                warm_credentials = unplanned[:len(warm) * users_per_instance]
+                unplanned = unplanned[len(warm) * users_per_instance:]
+
+            if unplanned:
+                plan = InstancePlanner.plan(len(unplanned))
+                logger.info(
+                    f"Placement plan for {plan.users} users of booking {booking.id}: "
+                    f"{plan.summary()}, ${plan.hourly_cost:.4f}/h"
                 )
-                logger.info(f"Scheduled instance creation for booking {booking.id} at {booking.booking_time}")
-                logger.info(f"Booking time: {booking.booking_time}")
-                logger.info(f"Current time: {now}")
-                logger.info(f"Booking time timezone: {booking.booking_time.tzinfo}")
-                logger.info(f"Delay: {delay}")
-                return True
-            else:
-                logger.error(f"Invalid delay for booking {booking.id}: {delay} seconds")
+                first = max((position for position, _ in existing), default=0) + 1
+                ProvisioningRecord.objects.bulk_create([
+                    ProvisioningRecord(
+                        booking=booking,
+                        position=position,
+                        client_token=BookingService._client_token(booking.id, position),
+                        instance_type=instance_type,
+                        usernames=[cred.username for cred in instance_users],
+                        admin_password_nonce=CredentialService.new_admin_nonce()
+                    )
+                    for position, (instance_type, instance_users) in enumerate(plan.assign(unplanned), first)
+                ])
+
+        return warm, warm_credentials
+
+    @staticmethod
+    def _client_token(booking_id: int, position: int) -> str:
+        """A RunInstances client token (at most 64 ASCII characters), unique per launch."""
+        return f"booking-{booking_id}-{position}-{secrets.token_hex(8)}"
+
+    @staticmethod
+    def _record_launch_failure(record: ProvisioningRecord, error: Exception) -> None:
+        """Schedules the next attempt of a failed launch, or gives up after ``PROVISIONING_MAX_ATTEMPTS``."""
+        record.last_error = str(error)
+        if isinstance(error, InstanceGoneError):
+            # EC2 would keep returning the terminated instance for this token
+            record.client_token = BookingService._client_token(record.booking_id, record.position)
+
+        if record.attempts >= settings.PROVISIONING_MAX_ATTEMPTS:
+            record.state = ProvisioningRecord.State.FAILED
+            record.admin_password_nonce = ''
+            logger.error(
+                f"Giving up on instance {record.position} of booking {record.booking_id} "
+                f"after {record.attempts} attempts: {error}"
+            )
+        else:
+            backoff = settings.PROVISIONING_RETRY_BACKOFF * 2 ** (record.attempts - 1)
+            record.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+            logger.warning(
+                f"Instance {record.position} of booking {record.booking_id} failed "
+                f"(attempt {record.attempts}), retrying in {backoff}s: {error}"
+            )
+
+    @staticmethod
+    def schedule_provisioning_retry(booking: Booking) -> Optional[int]:
+        """
+        Queues ``create_scheduled_instances`` again for when the booking's
+        next instance retry is due. The dispatcher picks the booking up
+        after ``BOOKING_REDISPATCH_AFTER`` should the task be lost.
+
+        Returns:
+            Optional[int]: Seconds until the retry, None if no instance is waiting for one
+        """
+        from ..tasks import create_scheduled_instances
+
+        next_attempt_at = (
+            booking.provisioning_records
+            .filter(state=ProvisioningRecord.State.PENDING)
+            .aggregate(next_attempt_at=Min('next_attempt_at'))['next_attempt_at']
+        )
+        if next_attempt_at is None:
+            return None
+
+        now = timezone.now()
+        delay = max(0, math.ceil((next_attempt_at - now).total_seconds()))
+        Booking.objects.filter(pk=booking.pk).update(dispatched_at=now)
+        booking.dispatched_at = now
+        create_scheduled_instances.apply_async((booking.id,), countdown=delay)
+        return delay
+
+    @staticmethod
+    def resolve_image() -> Tuple[str, bool]:
+        """
+        Picks the AMI to launch from.
+
+        Returns:
+            Tuple[str, bool]: (AMI ID, whether it is a pre-baked golden image).
+            A golden image is used when the configured AMI is itself one, or
+            when one was baked from it for the current JupyterConfig.
+        """
+        ami_id = config.aws.AMI_ID
+        if not config.jupyter.USE_BAKED_AMI:
+            return ami_id, False
+
+        images = BakedImage.objects.filter(
+            region=config.aws.REGION,
+            fingerprint=config.jupyter.fingerprint()
+        )
+        if images.filter(ami_id=ami_id).exists():
+            return ami_id, True
+
+        baked = images.filter(source_ami_id=ami_id).order_by('-created_at').first()
+        if baked:
+            logger.info(f"Using golden image {baked.ami_id} baked from {ami_id}")
+            return baked.ami_id, True
+
+        return ami_id, False
+
+    @staticmethod
+    def advance_provisioning(booking: Booking) -> Optional[int]:
+        """
+        Runs one step of the provisioning state machine for a booking:
+        RUNNING -> READY -> NOTIFIED. LAUNCHED bookings are moved on by
+        ``refresh_launched_instances``.
+
+        Returns:
+            Optional[int]: Seconds until the next step should run, or None
+            once the booking has been notified or has failed
+        """
+        Status = Booking.ProvisioningStatus
+        poll_interval = config.jupyter.PROVISIONING_POLL_INTERVAL
+        elapsed = 0
+        if booking.status_changed_at:
+            elapsed = (timezone.now() - booking.status_changed_at).total_seconds()
+
+        try:
+            if booking.provisioning_status == Status.RUNNING:
+                remaining = BookingService.ready_wait_time() - elapsed
+                if remaining > 0:
+                    return math.ceil(remaining)
+                if settings.PUBLIC_BASE_URL:
+                    pending = booking.ec2_instances.filter(ready_at__isnull=True).count()
+                    logger.warning(
+                        f"{pending} instances of booking {booking.id} never reported ready; "
+                        f"notifying after timeout"
+                    )
+                BookingService._transition(booking, Status.RUNNING, Status.READY)
+                return 0
+
+            if booking.provisioning_status == Status.READY:
+                # Claim the notification first so concurrent steps can't send it twice
+                if not BookingService._transition(booking, Status.READY, Status.NOTIFIED):
+                    return None
+                try:
+                    EmailService.send_instance_details(
+                        booking.email,
+                        BookingService.get_instance_info(booking),
+                        booking=booking
+                    )
+                except Exception:
+                    BookingService._transition(booking, Status.NOTIFIED, Status.READY)
+                    raise
+                # The email has the admin passwords now; don't keep what derives them
+                booking.ec2_instances.update(admin_password_nonce='')
+                logger.info(f"Queued instance details for booking {booking.id}")
+                return None
+
+            logger.info(f"Nothing to advance for booking {booking.id} in status {booking.provisioning_status}")
+            return None
+
+        except Exception as e:
+            logger.error(f"Error advancing provisioning for booking {booking.id}: {str(e)}", exc_info=True)
+            return poll_interval
+
+    @staticmethod
+    def refresh_launched_instances() -> List[int]:
+        """
+        Refreshes every instance of every LAUNCHED booking in one batched
+        sweep, writes state and DNS back in bulk and moves bookings whose
+        instances are all running and pass their EC2 status checks to
+        RUNNING.
+
+        Returns:
+            List[int]: IDs of the bookings that moved to RUNNING
+        """
+        Status = Booking.ProvisioningStatus
+        instances = list(
+            EC2Instance.objects
+            .filter(booking__provisioning_status=Status.LAUNCHED)
+            .select_related('booking')
+        )
+        if not instances:
+            return []
+
+        ec2_service = EC2ServiceManager(logger)
+        states = ec2_service.instance_manager.describe_instance_states(
+            [instance.instance_id for instance in instances],
+            include_status=True
+        )
+
+        changed = []
+        instances_by_booking = defaultdict(list)
+        for instance in instances:
+            instances_by_booking[instance.booking_id].append(instance)
+            info = states.get(instance.instance_id)
+            if not info:
+                continue
+            public_dns = info['public_dns'] or instance.public_dns
+            if (info['state'], public_dns) != (instance.state, instance.public_dns):
+                instance.state = info['state']
+                instance.public_dns = public_dns
+                changed.append(instance)
+        EC2Instance.objects.bulk_update(changed, ['state', 'public_dns'], batch_size=500)
+
+        running = []
+        now = timezone.now()
+        for booking_instances in instances_by_booking.values():
+            booking = booking_instances[0].booking
+
+            if any(instance.state in FAILED_INSTANCE_STATES for instance in booking_instances):
+                logger.error(f"Instances for booking {booking.id} stopped before becoming ready")
+                BookingService.mark_failed(booking)
+
+            elif all(
+                instance.state == 'running' and instance.public_dns
+                and states.get(instance.instance_id, {}).get('status_ok')
+                for instance in booking_instances
+            ):
+                if BookingService._transition(booking, Status.LAUNCHED, Status.RUNNING):
+                    logger.info(f"All {len(booking_instances)} instances running for booking {booking.id}")
+                    running.append(booking.id)
+
+            elif (now - booking.status_changed_at).total_seconds() > config.jupyter.RUNNING_TIMEOUT:
+                logger.error(f"Timed out waiting for instances of booking {booking.id} to run")
+                BookingService.mark_failed(booking)
+
+        logger.info(
+            f"Polled {len(instances)} instances across {len(instances_by_booking)} bookings: "
+            f"{len(changed)} changed, {len(running)} bookings running"
+        )
+        return running
+
+    @staticmethod
+    def ready_wait_time() -> int:
+        """
+        Seconds a RUNNING booking waits before it is treated as ready: the
+        callback timeout when instances phone home, otherwise the fixed
+        installation wait.
+        """
+        if settings.PUBLIC_BASE_URL:
+            return config.jupyter.READY_CALLBACK_TIMEOUT
+        return config.jupyter.INSTALLATION_WAIT_TIME
+
+    @staticmethod
+    def get_ready_callback_url(booking: Booking) -> Optional[str]:
+        """Builds the signed readiness URL for a booking's instances, if callbacks are enabled."""
+        if not settings.PUBLIC_BASE_URL:
+            return None
+        token = signing.dumps(booking.id, salt=READY_CALLBACK_SALT)
+        return settings.PUBLIC_BASE_URL.rstrip('/') + reverse('aws_ec2:instance_ready', args=[token])
+
+    @staticmethod
+    def booking_id_from_ready_token(token: str) -> Optional[int]:
+        """Returns the booking ID signed into a readiness token, or None if it is invalid."""
+        try:
+            return signing.loads(token, salt=READY_CALLBACK_SALT, max_age=READY_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return None
+
+    @staticmethod
+    def get_status_url(booking: Booking) -> str:
+        """Builds the signed (unguessable) path of a booking's status page."""
+        return reverse('aws_ec2:booking_status', args=[signing.dumps(booking.id, salt=BOOKING_STATUS_SALT)])
+
+    @staticmethod
+    def booking_id_from_status_token(token: str) -> Optional[int]:
+        """Returns the booking ID signed into a status page token, or None if it is invalid."""
+        try:
+            return signing.loads(token, salt=BOOKING_STATUS_SALT)
+        except signing.BadSignature:
+            return None
+
+    @staticmethod
+    def enqueue_registration_work(booking: Booking, credentials: List[UserCredential]) -> None:
+        """
+        Queues the confirmation email in the outbox, in the caller's
+        transaction, so the request never waits on the mail server.
+        Provisioning is picked up by ``dispatch_due_bookings`` once the
+        booking is due.
+        """
+        EmailService.send_initial_confirmation(
+            booking.email,
+            booking.booking_time,
+            [(cred.username, cred.plaintext_password) for cred in credentials],
+            booking=booking
+        )
+
+    @staticmethod
+    def mark_instance_ready(booking_id: int, instance_id: str, public_dns: str = '') -> Optional[bool]:
+        """
+        Records a readiness callback from one instance of a booking.
+
+        Returns:
+            Optional[bool]: True if this was the last instance and the booking
+            moved to READY, False if the instance is (or already was) recorded
+            as ready, None if there is no row for it (yet), e.g. a warm pool
+            instance whose row is written after the cold launches finish
+        """
+        fields = {'ready_at': timezone.now(), 'state': 'running'}
+        if public_dns:
+            fields['public_dns'] = public_dns
+        updated = EC2Instance.objects.filter(
+            booking_id=booking_id,
+            instance_id=instance_id,
+            ready_at__isnull=True
+        ).update(**fields)
+        if not updated:
+            if EC2Instance.objects.filter(booking_id=booking_id, instance_id=instance_id).exists():
+                logger.info(f"Instance {instance_id} of booking {booking_id} was already ready")
                 return False
-                
+            logger.warning(f"Readiness callback for unknown instance {instance_id}; it will retry")
+            return None
+
+        logger.info(f"Instance {instance_id} of booking {booking_id} reported ready")
+        if EC2Instance.objects.filter(booking_id=booking_id, ready_at__isnull=True).exists():
+            return False
+
+        booking = Booking.objects.get(pk=booking_id)
+        Status = Booking.ProvisioningStatus
+        # The callback can beat the state poller, so accept LAUNCHED as well
+        if not any(
+            BookingService._transition(booking, from_status, Status.READY)
+            for from_status in (Status.LAUNCHED, Status.RUNNING)
+        ):
+            return False
+
+        try:
+            LeadTimeService.record(booking)
         except Exception as e:
-            logger.error(f"Error scheduling instance creation: {str(e)}", exc_info=True)
-            return False
\ No newline at end of file
+            logger.error(f"Error recording provisioning time for booking {booking_id}: {str(e)}", exc_info=True)
+        return True
+
+    @staticmethod
+    def get_instance_info(booking: Booking) -> List[Tuple]:
+        """
+        Rebuilds the (instance, users, admin_credentials) tuples for a booking
+        from the database. The admin password is empty once the booking has
+        been notified.
+        """
+        instance_info = []
+        for instance in booking.ec2_instances.prefetch_related('user_credentials'):
+            users = [{"username": cred.username} for cred in instance.user_credentials.all()]
+            admin_credentials = {
+                'username': config.jupyter.ADMIN_USERNAME,
+                'password': (
+                    CredentialService.admin_password(instance.admin_password_nonce)
+                    if instance.admin_password_nonce else ''
+                )
+            }
+            instance_info.append((instance, users, admin_credentials))
+        return instance_info
+
+    @staticmethod
+    def mark_failed(booking: Booking) -> None:
+        """Marks a booking's provisioning as failed, frees its slot capacity and lets the user know."""
+        now = timezone.now()
+        Booking.objects.filter(pk=booking.pk).update(
+            provisioning_status=Booking.ProvisioningStatus.FAILED,
+            status_changed_at=now
+        )
+        booking.provisioning_status = Booking.ProvisioningStatus.FAILED
+        booking.status_changed_at = now
+        CapacityService.release(booking)
+        try:
+            EmailService.send_creation_failure(booking.email, booking=booking)
+        except Exception as e:
+            logger.error(f"Error sending failure email for booking {booking.id}: {str(e)}", exc_info=True)
+
+    @staticmethod
+    def _transition(booking: Booking, from_status: str, to_status: str) -> bool:
+        """
+        Moves a booking between provisioning states if it is still in
+        ``from_status``. Returns False if another worker got there first.
+        """
+        now = timezone.now()
+        updated = Booking.objects.filter(
+            pk=booking.pk,
+            provisioning_status=from_status
+        ).update(provisioning_status=to_status, status_changed_at=now)
+        if updated:
+            booking.provisioning_status = to_status
+            booking.status_changed_at = now
+        return bool(updated)
+
+    @staticmethod
+    def due_bookings(now=None):
+        """
+        Bookings the dispatcher should queue now: not launched, not failed,
+        within their provisioning lead time of the booking time (see
+        ``LeadTimeService``) and either never dispatched or dispatched so
+        long ago that the message must have been lost. Range scan on the
+        (booking_time, ec2_instances_created) index.
+        """
+        now = now or timezone.now()
+        redispatch_before = now - timedelta(seconds=settings.BOOKING_REDISPATCH_AFTER)
+
+        # One booking_time bound per size bucket, since larger bookings take longer.
+        # The planned instance count is the one reserved at registration.
+        ami_id, _ = BookingService.resolve_image()
+        lead_times = LeadTimeService.bucket_lead_times(ami_id)
+        due = Q()
+        for bucket, lead_time in enumerate(lead_times):
+            low, high = LeadTimeService.bucket_bounds(bucket)
+            # Bookings without a reservation count as the smallest size
+            instances = Q(reserved_instances__gte=low) if bucket else Q()
+            if high is not None:
+                instances &= Q(reserved_instances__lte=high)
+            due |= instances & Q(booking_time__lte=now + timedelta(seconds=lead_time))
+
+        return (
+            Booking.objects
+            .filter(
+                booking_time__gte=now - timedelta(seconds=settings.BOOKING_DISPATCH_MAX_DELAY),
+                booking_time__lte=now + timedelta(seconds=max(lead_times)),
+                ec2_instances_created=False,
+                provisioning_status=Booking.ProvisioningStatus.PENDING
+            )
+            .filter(due)
+            .filter(Q(dispatched_at__isnull=True) | Q(dispatched_at__lt=redispatch_before))
+        )
+
+    @staticmethod
+    def dispatch_due_bookings(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> int:
+        """
+        Queues instance creation for the bookings that are due.
+
+        Bookings are claimed in batches with ``SELECT ... FOR UPDATE SKIP
+        LOCKED``, so concurrent dispatchers never claim the same booking,
+        and the tasks are only sent once the claim has committed. Only IDs
+        are loaded, so memory stays flat however many bookings are waiting.
+
+        Nothing is dispatched while the AWS circuit breaker is open.
+
+        Args:
+            batch_size: Bookings per transaction, defaults to ``BOOKING_DISPATCH_BATCH_SIZE``
+            max_batches: Upper bound on batches per call, defaults to ``BOOKING_DISPATCH_MAX_BATCHES``
+
+        Returns:
+            int: Number of bookings dispatched
+        """
+        from ..tasks import create_scheduled_instances
+
+        if AWSThrottle.breaker_open():
+            logger.warning("AWS circuit breaker is open; not dispatching bookings")
+            return 0
+
+        batch_size = batch_size or settings.BOOKING_DISPATCH_BATCH_SIZE
+        max_batches = max_batches or settings.BOOKING_DISPATCH_MAX_BATCHES
+        dispatched = 0
+
+        for _ in range(max_batches):
+            now = timezone.now()
+            with transaction.atomic():
+                booking_ids = list(
+                    BookingService.due_bookings(now)
+                    .order_by('booking_time')
+                    .select_for_update(skip_locked=True)
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not booking_ids:
+                    break
+                Booking.objects.filter(id__in=booking_ids).update(dispatched_at=now)
+
+                def send_tasks(ids=booking_ids):
+                    # A booking whose task can't be sent is retried after BOOKING_REDISPATCH_AFTER
+                    for booking_id in ids:
+                        create_scheduled_instances.delay(booking_id)
+
+                transaction.on_commit(send_tasks, robust=True)
+
+            dispatched += len(booking_ids)
+            if len(booking_ids) < batch_size:
+                break
+
+        if dispatched:
+            logger.info(f"Dispatched instance creation for {dispatched} due bookings")
+        return dispatched
+
+    @staticmethod
+    def defer_dispatch(booking: Booking) -> None:
+        """Hands a dispatched booking back to the dispatcher, e.g. while AWS is failing."""
+        Booking.objects.filter(pk=booking.pk, ec2_instances_created=False).update(dispatched_at=None)
+        booking.dispatched_at = None
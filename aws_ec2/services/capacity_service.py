@@ -0,0 +1,330 @@
+# aws_ec2/services/capacity_service.py
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from ..models import Booking, SlotCapacity
+from ..ec2_utils.aws_clients import AWSClientRegistry
+from ..ec2_utils.config import config
+from ..ec2_utils.placement import InstancePlanner
+from .logging_service import LoggingService
+
+logger = LoggingService.get_logger("capacity_service")
+
+QUOTA_CACHE_KEY = 'aws_ec2.capacity.vcpu_quota'
+VCPUS_CACHE_KEY = 'aws_ec2.capacity.vcpus.{instance_type}'
+
+# Seconds to keep a fallback value before asking AWS again
+FALLBACK_CACHE_TTL = 300
+
+# Used when DescribeInstanceTypes is not available
+DEFAULT_VCPUS_PER_INSTANCE = 2
+
+class CapacityError(Exception):
+    """Raised when a booking doesn't fit in its time slot."""
+
+class CapacityService:
+    """
+    Admission control for bookings.
+
+    Time is split into ``SLOT_MINUTES`` slots and ``SlotCapacity`` keeps the
+    instances and vCPUs reserved in each one. A booking occupies the
+    ``SLOTS_PER_BOOKING`` slots from its start, so checking it reads that
+    many rows by their unique key, however many bookings exist. The limit is
+    the account's EC2 vCPU quota (cached) times ``QUOTA_HEADROOM``.
+    """
+
+    @staticmethod
+    def slot_start(moment: datetime) -> datetime:
+        """Rounds a time down to the start of its slot."""
+        slot_seconds = config.capacity.SLOT_MINUTES * 60
+        timestamp = moment.timestamp()
+        return datetime.fromtimestamp(timestamp - timestamp % slot_seconds, moment.tzinfo)
+
+    @staticmethod
+    def booking_slots(booking_time: datetime) -> List[datetime]:
+        """Returns the starts of the slots a booking at ``booking_time`` occupies."""
+        first = CapacityService.slot_start(booking_time)
+        step = timedelta(minutes=config.capacity.SLOT_MINUTES)
+        return [first + step * index for index in range(config.capacity.SLOTS_PER_BOOKING)]
+
+    @staticmethod
+    def booking_demand(number_of_users: int) -> Tuple[int, int]:
+        """
+        Projects what a booking will launch, from its placement plan.
+
+        Returns:
+            Tuple[int, int]: (instances, vCPUs)
+        """
+        plan = InstancePlanner.plan(number_of_users)
+        vcpus = plan.vcpus
+        if vcpus is None:
+            vcpus = sum(CapacityService.vcpus_per_instance(spec.instance_type) for spec, _ in plan.instances)
+        return plan.instance_count, vcpus
+
+    @staticmethod
+    def vcpu_limit() -> int:
+        """vCPUs bookings may reserve per slot."""
+        return int(CapacityService.vcpu_quota() * config.capacity.QUOTA_HEADROOM)
+
+    @staticmethod
+    def vcpu_quota() -> int:
+        """
+        Returns the account's EC2 vCPU quota, read from Service Quotas at
+        most once per ``QUOTA_CACHE_TTL``. Falls back to
+        ``DEFAULT_VCPU_QUOTA`` if the quota can't be read.
+        """
+        quota = cache.get(QUOTA_CACHE_KEY)
+        if quota is not None:
+            return quota
+
+        try:
+            response = AWSClientRegistry.get_client('service-quotas').get_service_quota(
+                ServiceCode='ec2',
+                QuotaCode=config.capacity.VCPU_QUOTA_CODE
+            )
+            quota = int(response['Quota']['Value'])
+            cache.set(QUOTA_CACHE_KEY, quota, config.capacity.QUOTA_CACHE_TTL)
+            logger.info(f"EC2 vCPU quota is {quota}")
+        except Exception as e:
+            quota = config.capacity.DEFAULT_VCPU_QUOTA
+            cache.set(QUOTA_CACHE_KEY, quota, FALLBACK_CACHE_TTL)
+            logger.warning(f"Could not read the EC2 vCPU quota ({str(e)}), assuming {quota}")
+        return quota
+
+    @staticmethod
+    def vcpus_per_instance(instance_type: Optional[str] = None) -> int:
+        """Returns the default vCPU count of an instance type (the configured one by default)."""
+        instance_type = instance_type or config.aws.INSTANCE_TYPE
+        key = VCPUS_CACHE_KEY.format(instance_type=instance_type)
+        vcpus = cache.get(key)
+        if vcpus is not None:
+            return vcpus
+
+        try:
+            response = AWSClientRegistry.get_client('ec2').describe_instance_types(InstanceTypes=[instance_type])
+            vcpus = response['InstanceTypes'][0]['VCpuInfo']['DefaultVCpus']
+            cache.set(key, vcpus, None)  # fixed for an instance type
+        except Exception as e:
+            vcpus = DEFAULT_VCPUS_PER_INSTANCE
+            cache.set(key, vcpus, FALLBACK_CACHE_TTL)
+            logger.warning(f"Could not describe instance type {instance_type} ({str(e)}), assuming {vcpus} vCPUs")
+        return vcpus
+
+    @staticmethod
+    def has_capacity(booking_time: datetime, number_of_users: int) -> bool:
+        """Checks whether a booking fits in the slots starting at ``booking_time``."""
+        _, vcpus = CapacityService.booking_demand(number_of_users)
+        limit = CapacityService.vcpu_limit()
+        if vcpus > limit:
+            return False
+
+        slots = CapacityService.booking_slots(booking_time)
+        reserved = SlotCapacity.objects.filter(slot_start__in=slots).values_list('vcpus', flat=True)
+        return all(used + vcpus <= limit for used in reserved)
+
+    @staticmethod
+    def suggest_slot(booking_time: datetime, number_of_users: int) -> Optional[datetime]:
+        """
+        Finds the first slot after ``booking_time`` the booking fits in,
+        looking at most ``SUGGESTION_SLOTS`` slots ahead with a single query.
+
+        Returns:
+            Optional[datetime]: Start of the suggested slot, or None if there is none
+        """
+        _, vcpus = CapacityService.booking_demand(number_of_users)
+        limit = CapacityService.vcpu_limit()
+        if vcpus > limit:
+            return None
+
+        step = timedelta(minutes=config.capacity.SLOT_MINUTES)
+        span = config.capacity.SLOTS_PER_BOOKING
+        first = CapacityService.slot_start(booking_time) + step
+        last = first + step * (config.capacity.SUGGESTION_SLOTS + span - 1)
+        used = dict(
+            SlotCapacity.objects
+            .filter(slot_start__gte=first, slot_start__lt=last)
+            .values_list('slot_start', 'vcpus')
+        )
+
+        for index in range(config.capacity.SUGGESTION_SLOTS):
+            start = first + step * index
+            if all(used.get(start + step * offset, 0) + vcpus <= limit for offset in range(span)):
+                return start
+        return None
+
+    @staticmethod
+    def max_users() -> int:
+        """Largest booking that fits in an empty slot."""
+        return CapacityService.users_for_vcpus(CapacityService.vcpu_limit())
+
+    @staticmethod
+    def users_for_vcpus(vcpus: int) -> int:
+        """
+        Largest booking whose placement plan fits in ``vcpus``. A plan's
+        vCPUs grow with its users, so this doubles and then bisects the user
+        count, planning O(log n) bookings instead of every size up to n.
+        """
+        def fits(users: int) -> bool:
+            return CapacityService.booking_demand(users)[1] <= vcpus
+
+        if not fits(1):
+            return 0
+        # fits(low) and not fits(high)
+        low, high = 1, 2
+        while fits(high):
+            low, high = high, high * 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def reserve(booking: Booking) -> None:
+        """
+        Reserves a booking's projected instances and vCPUs in its slots.
+
+        The slot rows are locked while checking, so concurrent registrations
+        can't both take the last vCPUs. Runs in the caller's transaction
+        when there is one.
+
+        Raises:
+            CapacityError: If the booking no longer fits
+        """
+        instances, vcpus = CapacityService.booking_demand(booking.number_of_users)
+        slots = CapacityService.booking_slots(booking.booking_time)
+        limit = CapacityService.vcpu_limit()
+
+        with transaction.atomic():
+            SlotCapacity.objects.bulk_create(
+                [SlotCapacity(slot_start=slot) for slot in slots],
+                ignore_conflicts=True
+            )
+            locked = SlotCapacity.objects.select_for_update().filter(slot_start__in=slots).order_by('slot_start')
+            if vcpus > limit or any(row.vcpus + vcpus > limit for row in locked):
+                raise CapacityError(
+                    CapacityService.rejection_message(booking.booking_time, booking.number_of_users)
+                )
+
+            SlotCapacity.objects.filter(slot_start__in=slots).update(
+                instances=F('instances') + instances,
+                vcpus=F('vcpus') + vcpus
+            )
+            Booking.objects.filter(pk=booking.pk).update(reserved_instances=instances, reserved_vcpus=vcpus)
+            booking.reserved_instances = instances
+            booking.reserved_vcpus = vcpus
+
+        logger.info(f"Reserved {instances} instances ({vcpus} vCPUs) for booking {booking.id}")
+
+    @staticmethod
+    def release(booking: Booking) -> None:
+        """Gives a booking's reservation back to its slots. Safe to call more than once."""
+        slots = CapacityService.booking_slots(booking.booking_time)
+        with transaction.atomic():
+            reserved = (
+                Booking.objects.select_for_update()
+                .filter(pk=booking.pk)
+                .values('reserved_instances', 'reserved_vcpus')
+                .first()
+            )
+            if not reserved or not (reserved['reserved_instances'] or reserved['reserved_vcpus']):
+                return
+
+            SlotCapacity.objects.filter(slot_start__in=slots).update(
+                instances=F('instances') - reserved['reserved_instances'],
+                vcpus=F('vcpus') - reserved['reserved_vcpus']
+            )
+            Booking.objects.filter(pk=booking.pk).update(reserved_instances=0, reserved_vcpus=0)
+            booking.reserved_instances = 0
+            booking.reserved_vcpus = 0
+
+        logger.info(f"Released the capacity reserved for booking {booking.id}")
+
+    @staticmethod
+    def rejection_message(booking_time: datetime, number_of_users: int) -> str:
+        """Explains why a booking was turned down, suggesting another slot when there is one."""
+        max_users = CapacityService.max_users()
+        if number_of_users > max_users:
+            return f"Bookings are limited to {max_users} users at the moment."
+
+        suggestion = CapacityService.suggest_slot(booking_time, number_of_users)
+        if suggestion is None:
+            return "This time slot is fully booked and there is no free slot in the following hours."
+        return (
+            f"This time slot is fully booked. The next slot with room for {number_of_users} users "
+            f"starts at {timezone.localtime(suggestion):%Y-%m-%d %H:%M}."
+        )
+
+    @staticmethod
+    def availability(start: datetime, end: datetime) -> List[Dict]:
+        """
+        Lists every slot between ``start`` and ``end`` with the vCPUs and
+        users still free, from one range query over ``SlotCapacity``.
+        """
+        step = timedelta(minutes=config.capacity.SLOT_MINUTES)
+        limit = CapacityService.vcpu_limit()
+        used = dict(
+            SlotCapacity.objects
+            .filter(slot_start__gte=CapacityService.slot_start(start), slot_start__lt=end)
+            .values_list('slot_start', 'vcpus')
+        )
+
+        free_users = {}
+        slots = []
+        slot = CapacityService.slot_start(start)
+        while slot < end:
+            free_vcpus = max(limit - used.get(slot, 0), 0)
+            if free_vcpus not in free_users:
+                free_users[free_vcpus] = CapacityService.users_for_vcpus(free_vcpus)
+            slots.append({
+                'start': timezone.localtime(slot).isoformat(),
+                'reserved_vcpus': used.get(slot, 0),
+                'free_vcpus': free_vcpus,
+                'free_users': free_users[free_vcpus],
+            })
+            slot += step
+        return slots
+
+    @staticmethod
+    def rebuild() -> int:
+        """
+        Recomputes the reservations of all upcoming bookings and the slot
+        totals from scratch, e.g. after changing the capacity settings.
+
+        Returns:
+            int: Number of bookings counted
+        """
+        cutoff = CapacityService.slot_start(timezone.now() - timedelta(
+            minutes=config.capacity.SLOT_MINUTES * config.capacity.SLOTS_PER_BOOKING
+        ))
+        totals = defaultdict(lambda: [0, 0])
+
+        with transaction.atomic():
+            bookings = list(
+                Booking.objects.select_for_update()
+                .filter(booking_time__gte=cutoff)
+                .exclude(provisioning_status=Booking.ProvisioningStatus.FAILED)
+            )
+            for booking in bookings:
+                booking.reserved_instances, booking.reserved_vcpus = CapacityService.booking_demand(
+                    booking.number_of_users
+                )
+                for slot in CapacityService.booking_slots(booking.booking_time):
+                    totals[slot][0] += booking.reserved_instances
+                    totals[slot][1] += booking.reserved_vcpus
+            Booking.objects.bulk_update(bookings, ['reserved_instances', 'reserved_vcpus'], batch_size=500)
+
+            SlotCapacity.objects.filter(slot_start__gte=cutoff).delete()
+            SlotCapacity.objects.bulk_create([
+                SlotCapacity(slot_start=slot, instances=instances, vcpus=vcpus)
+                for slot, (instances, vcpus) in totals.items()
+            ])
+
+        logger.info(f"Rebuilt slot capacity from {len(bookings)} bookings over {len(totals)} slots")
+        return len(bookings)
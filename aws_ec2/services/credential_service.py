@@ -0,0 +1,120 @@
+# aws_ec2/services/credential_service.py
+import atexit
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+from ..hashers import SHA512CryptPasswordHasher, hash_credential_password
+from .logging_service import LoggingService
+
+logger = LoggingService.get_logger("credential_service")
+
+# Below this many passwords the pool's overhead outweighs the parallelism
+PARALLEL_HASH_MIN_PASSWORDS = 4
+
+ADMIN_PASSWORD_SALT = 'aws_ec2.admin_password'
+
+class CredentialService:
+    """
+    Hashes booking credentials, in parallel for large batches.
+
+    Registration runs in gevent gunicorn workers, where a CPU-bound hash
+    never yields: hashing a large booking inline would stall every other
+    request on the worker for seconds. The pool moves that work to other
+    processes while the waiting greenlet yields (gevent patches the
+    executor's manager thread and pipe waits). Workers are spawned, not
+    forked, so they don't inherit the monkey-patched interpreter, and the
+    pool is shut down at exit so recycled gunicorn workers (``max_requests``)
+    don't leave them behind.
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _executor_pid: Optional[int] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def hash_passwords(passwords: List[str], parallel: bool = True) -> List[str]:
+        """
+        Hashes a batch of plaintext passwords with the SHA-512 crypt hasher.
+
+        Args:
+            passwords: Plaintext passwords
+            parallel: Spread large batches over a process pool
+
+        Returns:
+            List[str]: Encoded hashes, in the same order
+        """
+        if parallel and len(passwords) >= PARALLEL_HASH_MIN_PASSWORDS:
+            executor = CredentialService._get_executor()
+            if executor is not None:
+                workers = executor._max_workers
+                try:
+                    return list(executor.map(
+                        hash_credential_password,
+                        passwords,
+                        chunksize=max(1, len(passwords) // (workers * 4))
+                    ))
+                except BrokenProcessPool as e:
+                    logger.warning(f"Credential hashing pool failed ({e}), hashing inline")
+                    CredentialService.shutdown()
+
+        return [hash_credential_password(password) for password in passwords]
+
+    @staticmethod
+    def shadow_hash(stored_password: str) -> str:
+        """
+        Returns the /etc/shadow hash for a stored credential password, for
+        ``chpasswd -e`` on the instance. Rows created before hashing was
+        introduced still hold plaintext and are hashed on the fly.
+        """
+        if not SHA512CryptPasswordHasher.is_encoded(stored_password):
+            stored_password = hash_credential_password(stored_password)
+        return SHA512CryptPasswordHasher.to_shadow(stored_password)
+
+    @staticmethod
+    def new_admin_nonce() -> str:
+        """Returns a fresh nonce to derive an instance's admin password from."""
+        return secrets.token_hex(16)
+
+    @staticmethod
+    def admin_password(nonce: str) -> str:
+        """
+        Derives the admin password for a nonce, keyed with ``SECRET_KEY``.
+        Only the nonce is stored, and it is cleared once the password is no
+        longer needed, so the database never holds a usable admin password.
+        """
+        return salted_hmac(ADMIN_PASSWORD_SALT, nonce, algorithm='sha256').hexdigest()[:32]
+
+    @staticmethod
+    def _get_executor() -> Optional[ProcessPoolExecutor]:
+        """Returns this process's hashing pool, or None if one can't be started here."""
+        with CredentialService._lock:
+            if CredentialService._executor_pid != os.getpid():
+                CredentialService._executor = None
+            if CredentialService._executor is None:
+                if multiprocessing.current_process().daemon:
+                    # Daemonic processes (e.g. Celery prefork workers) can't have children
+                    return None
+                workers = settings.CREDENTIAL_HASH_WORKERS or os.cpu_count() or 1
+                # Spawned rather than forked: the web workers are monkey-patched by gevent
+                CredentialService._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                CredentialService._executor_pid = os.getpid()
+                atexit.unregister(CredentialService.shutdown)
+                atexit.register(CredentialService.shutdown)
+            return CredentialService._executor
+
+    @staticmethod
+    def shutdown() -> None:
+        """Stops the hashing pool; the next batch starts a new one."""
+        with CredentialService._lock:
+            if CredentialService._executor is not None and CredentialService._executor_pid == os.getpid():
+                CredentialService._executor.shutdown(wait=False, cancel_futures=True)
+            CredentialService._executor = None
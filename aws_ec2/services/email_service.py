@@ -1,17 +1,32 @@
 #aws_ec2/services/email_service.py
-from django.core.mail import send_mail
+import statistics
+from datetime import timedelta
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
-from typing import List, Tuple
-from ..models import UserCredential, EC2Instance
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from typing import Dict, List, Optional, Tuple
+from ..models import Booking, EmailOutbox, EC2Instance
+from .logging_service import LoggingService
+
+logger = LoggingService.get_logger("email_service")
 
 class EmailService:
-    """Handles email composition and sending"""
+    """
+    Handles email composition and sending.
+
+    Messages are written to the ``EmailOutbox`` (in the caller's
+    transaction) and delivered in batches over one SMTP connection by
+    ``deliver_outbox``, which runs in the ``deliver_email_outbox`` task.
+    """
     
     @staticmethod
-    def send_initial_confirmation(email: str, booking_time, credentials: List[UserCredential]) -> None:
+    def send_initial_confirmation(email: str, booking_time, credentials: List[Tuple[str, str]],
+                                  booking: Optional[Booking] = None) -> None:
         credentials_list = [
-            f"Username: {cred.username}, Password: {cred.password}"
-            for cred in credentials
+            f"Username: {username}, Password: {password}"
+            for username, password in credentials
         ]
         
         message = (
@@ -25,18 +40,13 @@ class EmailService:
             f"Thank you for booking with us!"
         )
         
-        send_mail(
-            "Booking Confirmation",
-            message,
-            settings.EMAIL_HOST_USER,
-            [email],
-            fail_silently=False
-        )
+        EmailService.enqueue(email, "Booking Confirmation", message, booking)
 
     @staticmethod
     def send_instance_details(
         email: str,
-        instance_info: List[Tuple[EC2Instance, List[dict], dict]]
+        instance_info: List[Tuple[EC2Instance, List[dict], dict]],
+        booking: Optional[Booking] = None
     ) -> None:
         instance_details = []
         for instance, users, pawsey_credentials in instance_info:
@@ -63,10 +73,160 @@ class EmailService:
             f"Your JupyterHub Team"
         )
         
-        send_mail(
-            "JupyterHub Access Information",
-            message,
-            settings.EMAIL_HOST_USER,
-            [email],
-            fail_silently=False
+        EmailService.enqueue(email, "JupyterHub Access Information", message, booking)
+
+    @staticmethod
+    def send_creation_failure(email: str, booking: Optional[Booking] = None) -> None:
+        message = (
+            "Dear User,\n\n"
+            "Unfortunately we were unable to create the JupyterHub instances for your booking.\n\n"
+            "Our team has been notified. Please reply to this email or make a new booking "
+            "if you still need the service.\n\n"
+            "We apologise for the inconvenience.\n\n"
+            "Best regards,\n"
+            "Your JupyterHub Team"
+        )
+
+        EmailService.enqueue(email, "JupyterHub Provisioning Failed", message, booking)
+
+    @staticmethod
+    def enqueue(email: str, subject: str, body: str, booking: Optional[Booking] = None) -> EmailOutbox:
+        """
+        Adds a message to the outbox and kicks off delivery once the
+        current transaction commits (straight away outside a transaction).
+        """
+        from ..tasks import deliver_email_outbox
+
+        outbox_email = EmailOutbox.objects.create(
+            booking=booking,
+            to_email=email,
+            subject=subject,
+            body=body
         )
+        transaction.on_commit(deliver_email_outbox.delay, robust=True)
+        return outbox_email
+
+    @staticmethod
+    def deliver_outbox(batch_size: Optional[int] = None) -> Dict:
+        """
+        Sends one batch of due outbox messages over a single SMTP connection.
+
+        Rows are claimed in a short transaction with ``SELECT ... FOR UPDATE
+        SKIP LOCKED`` and leased for ``EMAIL_SEND_LEASE`` seconds, so
+        concurrent workers never send the same message and no transaction
+        or row lock is held while talking to SMTP. A worker that dies
+        mid-batch leaves its rows to be retried once the lease expires. The
+        batch is capped by the provider quota (``EMAIL_RATE_LIMIT_PER_MINUTE``).
+        Failed messages are retried with exponential backoff until
+        ``EMAIL_MAX_ATTEMPTS``.
+
+        Returns:
+            Dict: Counts of sent/retried/failed messages, the number still
+            due, and delivery latency (queued to sent) in seconds
+        """
+        now = timezone.now()
+        batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+        minute_ago = now - timedelta(minutes=1)
+        # Messages another worker has claimed but not sent yet count against the quota too
+        sent_last_minute = EmailOutbox.objects.filter(
+            Q(sent_at__gte=minute_ago) | Q(status=EmailOutbox.Status.PENDING, claimed_at__gte=minute_ago)
+        ).count()
+        quota = max(settings.EMAIL_RATE_LIMIT_PER_MINUTE - sent_last_minute, 0)
+
+        stats = {'sent': 0, 'retried': 0, 'failed': 0, 'latency_p50': None, 'latency_max': None}
+        if quota == 0:
+            stats['remaining'] = EmailService._due_count(now)
+            return stats
+
+        with transaction.atomic():
+            batch = list(
+                EmailOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=EmailOutbox.Status.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:min(batch_size, quota)]
+            )
+            for outbox_email in batch:
+                outbox_email.claimed_at = now
+                outbox_email.next_attempt_at = now + timedelta(seconds=settings.EMAIL_SEND_LEASE)
+            EmailOutbox.objects.bulk_update(batch, ['claimed_at', 'next_attempt_at'])
+
+        latencies = []
+        if batch:
+            connection = get_connection(fail_silently=False)
+            try:
+                connection.open()
+            except Exception as e:
+                # No connection at all: the whole batch is retried
+                for outbox_email in batch:
+                    EmailService._record_failure(outbox_email, e, stats)
+            else:
+                with connection:
+                    for outbox_email in batch:
+                        message = EmailMessage(
+                            outbox_email.subject,
+                            outbox_email.body,
+                            settings.EMAIL_HOST_USER,
+                            [outbox_email.to_email],
+                            connection=connection
+                        )
+                        try:
+                            connection.send_messages([message])
+                        except Exception as e:
+                            EmailService._record_failure(outbox_email, e, stats)
+                            continue
+                        outbox_email.status = EmailOutbox.Status.SENT
+                        outbox_email.sent_at = timezone.now()
+                        outbox_email.attempts += 1
+                        outbox_email.body = ''
+                        outbox_email.last_error = ''
+                        latencies.append((outbox_email.sent_at - outbox_email.created_at).total_seconds())
+                        stats['sent'] += 1
+
+            with transaction.atomic():
+                EmailOutbox.objects.bulk_update(
+                    batch,
+                    ['status', 'sent_at', 'attempts', 'body', 'last_error', 'next_attempt_at']
+                )
+
+        if latencies:
+            stats['latency_p50'] = round(statistics.median(latencies), 3)
+            stats['latency_max'] = round(max(latencies), 3)
+        stats['remaining'] = EmailService._due_count(timezone.now())
+        return stats
+
+    @staticmethod
+    def _record_failure(outbox_email: EmailOutbox, error: Exception, stats: Dict) -> None:
+        outbox_email.attempts += 1
+        outbox_email.last_error = str(error)[:1000]
+        if outbox_email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            outbox_email.status = EmailOutbox.Status.FAILED
+            outbox_email.body = ''  # may hold credentials and will never be sent
+            stats['failed'] += 1
+            logger.error(f"Giving up on email {outbox_email.id} to {outbox_email.to_email}: {error}")
+        else:
+            backoff = settings.EMAIL_RETRY_BACKOFF * 2 ** (outbox_email.attempts - 1)
+            outbox_email.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+            stats['retried'] += 1
+            logger.warning(f"Email {outbox_email.id} failed ({error}), retrying in {backoff}s")
+
+    @staticmethod
+    def purge_outbox(retention_days: Optional[int] = None) -> int:
+        """
+        Deletes sent and failed messages older than ``EMAIL_OUTBOX_RETENTION_DAYS``.
+
+        Returns:
+            int: Number of messages deleted
+        """
+        retention_days = settings.EMAIL_OUTBOX_RETENTION_DAYS if retention_days is None else retention_days
+        deleted, _ = EmailOutbox.objects.filter(
+            status__in=[EmailOutbox.Status.SENT, EmailOutbox.Status.FAILED],
+            created_at__lt=timezone.now() - timedelta(days=retention_days)
+        ).delete()
+        return deleted
+
+    @staticmethod
+    def _due_count(now) -> int:
+        return EmailOutbox.objects.filter(
+            status=EmailOutbox.Status.PENDING,
+            next_attempt_at__lte=now
+        ).count()
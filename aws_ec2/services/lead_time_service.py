@@ -0,0 +1,159 @@
+# aws_ec2/services/lead_time_service.py
+import math
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+from ..models import Booking, ProvisioningDuration
+from ..ec2_utils.placement import InstancePlanner
+from .logging_service import LoggingService
+
+logger = LoggingService.get_logger("lead_time_service")
+
+LEAD_TIMES_CACHE_KEY = 'aws_ec2.lead_times.{ami_id}.{instance_type}'
+LEAD_TIMES_CACHE_TTL = 300  # seconds
+ALL_INSTANCE_TYPES = '*'
+
+# Instance-count buckets are powers of two: 1, 2-3, 4-7, ... The last one is open-ended.
+INSTANCE_COUNT_BUCKETS = 6
+
+class LeadTimeService:
+    """
+    Estimates how long before ``booking_time`` provisioning must start.
+
+    Every booking whose instances all report ready records its launch-to-
+    ready time in ``ProvisioningDuration``, keyed by AMI, instance type and
+    size. The lead time for a booking is a rolling percentile
+    (``LEAD_TIME_PERCENTILE`` over the last ``LEAD_TIME_WINDOW`` samples)
+    for its AMI and planned instance-count bucket, plus ``LEAD_TIME_MARGIN``.
+    Samples of all instance types are pooled unless one is asked for, as
+    bookings mix types (see ``InstancePlanner``) and boot-to-ready time is
+    dominated by the install. Buckets with too few samples fall back to all
+    sizes, then to ``LEAD_TIME_DEFAULT``.
+    """
+
+    @staticmethod
+    def instance_count(number_of_users: int) -> int:
+        return max(1, InstancePlanner.plan(number_of_users).instance_count)
+
+    @staticmethod
+    def bucket(instance_count: int) -> int:
+        """Index of the instance-count bucket (0 for 1 instance, 1 for 2-3, ...)."""
+        return min(instance_count.bit_length(), INSTANCE_COUNT_BUCKETS) - 1
+
+    @staticmethod
+    def bucket_bounds(bucket: int) -> Tuple[int, Optional[int]]:
+        """Instance counts covered by a bucket, as (min, max); max is None for the last one."""
+        if bucket == INSTANCE_COUNT_BUCKETS - 1:
+            return 2 ** bucket, None
+        return 2 ** bucket, 2 ** (bucket + 1) - 1
+
+    @staticmethod
+    def percentile(values: List[float], percent: float) -> float:
+        """Nearest-rank percentile of unsorted values."""
+        ordered = sorted(values)
+        rank = max(1, math.ceil(len(ordered) * percent / 100))
+        return ordered[rank - 1]
+
+    @staticmethod
+    def record(booking: Booking) -> Optional[ProvisioningDuration]:
+        """
+        Records how long a booking took from its first launch to its last
+        readiness callback. Skipped if any instance never reported ready,
+        and for bookings served from the warm pool, which would make cold
+        launches look faster than they are.
+        """
+        instances = booking.ec2_instances.all()
+        if instances.filter(from_warm_pool=True).exists():
+            return None
+        times = instances.aggregate(launched=Min('launched_at'), ready=Max('ready_at'))
+        first = instances.exclude(ami_id='').first()
+        if not (times['launched'] and times['ready'] and first) or instances.filter(ready_at__isnull=True).exists():
+            return None
+
+        duration = ProvisioningDuration.objects.create(
+            booking=booking,
+            ami_id=first.ami_id,
+            instance_type=first.instance_type,
+            number_of_users=booking.number_of_users,
+            instance_count=instances.count(),
+            seconds=(times['ready'] - times['launched']).total_seconds()
+        )
+        cache.delete_many([
+            LEAD_TIMES_CACHE_KEY.format(ami_id=first.ami_id, instance_type=instance_type)
+            for instance_type in (first.instance_type, ALL_INSTANCE_TYPES)
+        ])
+        logger.info(
+            f"Booking {booking.id} took {duration.seconds:.0f}s from launch to ready "
+            f"({duration.instance_count} x {duration.instance_type}, {duration.ami_id})"
+        )
+        return duration
+
+    @staticmethod
+    def bucket_lead_times(ami_id: str, instance_type: Optional[str] = None) -> List[int]:
+        """
+        Returns the lead time in seconds of every instance-count bucket for
+        an AMI and instance type (all types by default), cached for
+        ``LEAD_TIMES_CACHE_TTL``.
+        """
+        key = LEAD_TIMES_CACHE_KEY.format(ami_id=ami_id, instance_type=instance_type or ALL_INSTANCE_TYPES)
+        lead_times = cache.get(key)
+        if lead_times is None:
+            lead_times = [
+                stats['lead_time']
+                for stats in LeadTimeService.bucket_stats(ami_id, instance_type)
+            ]
+            cache.set(key, lead_times, LEAD_TIMES_CACHE_TTL)
+        return lead_times
+
+    @staticmethod
+    def lead_time(number_of_users: int, ami_id: str, instance_type: Optional[str] = None) -> int:
+        """Seconds before its booking time provisioning should start for a booking of this size."""
+        bucket = LeadTimeService.bucket(LeadTimeService.instance_count(number_of_users))
+        return LeadTimeService.bucket_lead_times(ami_id, instance_type)[bucket]
+
+    @staticmethod
+    def bucket_stats(ami_id: str, instance_type: Optional[str] = None) -> List[Dict]:
+        """
+        Rolling statistics and the resulting lead time per instance-count
+        bucket, from the last ``LEAD_TIME_WINDOW`` samples of each.
+        """
+        samples = ProvisioningDuration.objects.filter(ami_id=ami_id)
+        if instance_type:
+            samples = samples.filter(instance_type=instance_type)
+        window = settings.LEAD_TIME_WINDOW
+        overall = list(samples.order_by('-recorded_at').values_list('seconds', flat=True)[:window])
+
+        stats = []
+        for bucket in range(INSTANCE_COUNT_BUCKETS):
+            low, high = LeadTimeService.bucket_bounds(bucket)
+            in_bucket = samples.filter(instance_count__gte=low)
+            if high is not None:
+                in_bucket = in_bucket.filter(instance_count__lte=high)
+            durations = list(in_bucket.order_by('-recorded_at').values_list('seconds', flat=True)[:window])
+
+            if len(durations) >= settings.LEAD_TIME_MIN_SAMPLES:
+                basis, source = durations, 'bucket'
+            elif len(overall) >= settings.LEAD_TIME_MIN_SAMPLES:
+                basis, source = overall, 'all sizes'
+            else:
+                basis, source = None, 'default'
+
+            if basis:
+                estimate = LeadTimeService.percentile(basis, settings.LEAD_TIME_PERCENTILE)
+                lead_time = min(math.ceil(estimate) + settings.LEAD_TIME_MARGIN, settings.LEAD_TIME_MAX)
+            else:
+                lead_time = settings.LEAD_TIME_DEFAULT
+
+            stats.append({
+                'instances': f"{low}+" if high is None else (f"{low}" if low == high else f"{low}-{high}"),
+                'samples': len(durations),
+                'p50': LeadTimeService.percentile(durations, 50) if durations else None,
+                'percentile': (
+                    LeadTimeService.percentile(durations, settings.LEAD_TIME_PERCENTILE) if durations else None
+                ),
+                'max': max(durations) if durations else None,
+                'source': source,
+                'lead_time': lead_time,
+            })
+        return stats
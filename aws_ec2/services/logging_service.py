@@ -1,12 +1,17 @@
-from ..ec2_utils.logging_config import LoggerSetup
+from ..ec2_utils.logging_config import LoggerSetup, log_context
 
 class LoggingService:
     """Centralized logging service"""
     
     @staticmethod
     def get_logger(name: str):
-        return LoggerSetup.setup_logger(
-            name=name,
-            log_dir="logs/booking",
-            file_prefix=name
-        )
+        """Returns a logger writing through the process-wide queue pipeline."""
+        return LoggerSetup.setup_logger(name=name)
+
+    @staticmethod
+    def context(booking_id=None, task_id=None):
+        """
+        Tags every record logged inside the ``with`` block with the booking
+        and/or Celery task id.
+        """
+        return log_context(booking_id=booking_id, task_id=task_id)
@@ -0,0 +1,267 @@
+# aws_ec2/services/reconcile_service.py
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import Booking, CleanupCandidate, EC2Instance, ProvisioningRecord, WarmPoolInstance
+from ..ec2_utils.main import EC2ServiceManager
+from ..ec2_utils.config import config
+from .logging_service import LoggingService
+
+logger = LoggingService.get_logger("reconcile_service")
+
+# Instance states in which an instance still costs money or may come back
+ALIVE_STATES = ('pending', 'running', 'stopping', 'stopped')
+# ... and in which it is actually running
+RUNNING_STATES = ('pending', 'running')
+# EC2Instance state of an instance EC2 no longer knows about
+GONE_STATE = 'terminated'
+
+class ReconcileService:
+    """
+    Keeps ``EC2Instance`` rows in line with what EC2 actually runs.
+
+    Every instance we launch carries ``config.tagging.DEFAULT_TAGS`` (and
+    its ``BookingId``), so one tag-filtered, paginated DescribeInstances
+    sweep per region finds all of them at a cost of one request per 1000
+    instances, rather than one per booking or instance. The sweep is
+    diffed against the database:
+
+    - state and DNS of known instances are written back in bulk;
+    - rows EC2 no longer returns become ``terminated`` (rows of legacy,
+      untagged instances are looked up by ID once and get their tags);
+    - instances no row accounts for are flagged as orphans, and instances
+      still running after their booking ended (or failed) as zombies, in
+      ``CleanupCandidate``.
+
+    Instances younger than ``RECONCILE_GRACE`` are never judged, so launches
+    that haven't been recorded yet aren't taken for orphans.
+    """
+
+    @staticmethod
+    def regions() -> List[str]:
+        regions = config.aws.RECONCILE_REGIONS or config.aws.REGION
+        return [region.strip() for region in regions.split(',') if region.strip()]
+
+    @staticmethod
+    def reconcile() -> Dict[str, int]:
+        """
+        Runs one sweep and diff.
+
+        Returns:
+            Dict[str, int]: Counts of swept instances, updated and gone
+            rows, tagged legacy instances, open orphans and zombies, and
+            resolved candidates
+        """
+        now = timezone.now()
+        judged_before = now - timedelta(seconds=settings.RECONCILE_GRACE)
+        ec2_service = EC2ServiceManager(logger)
+        manager = ec2_service.instance_manager
+
+        swept = {}
+        for region in ReconcileService.regions():
+            for info in manager.describe_tagged_instances(config.tagging.DEFAULT_TAGS, region):
+                swept[info['instance_id']] = dict(info, region=region)
+
+        stats = {'swept': len(swept), 'updated': 0, 'gone': 0, 'tagged': 0}
+
+        rows = list(
+            EC2Instance.objects
+            .exclude(state=GONE_STATE)
+            .select_related('booking')
+            .only(
+                'instance_id', 'state', 'public_dns', 'launched_at', 'booking__id',
+                'booking__booking_time', 'booking__provisioning_status', 'booking__status_changed_at'
+            )
+        )
+        live_ids = {row.instance_id for row in rows}
+
+        # Rows the tagged sweep didn't return: untagged legacy instances, or gone
+        unswept = [row for row in rows if row.instance_id not in swept]
+        if unswept:
+            states = manager.describe_instance_states([row.instance_id for row in unswept])
+            untagged = defaultdict(list)
+            for row in unswept:
+                info = states.get(row.instance_id)
+                if info:
+                    swept[row.instance_id] = dict(info, region=config.aws.REGION, launch_time=row.launched_at)
+                    untagged[row.booking.id].append(row.instance_id)
+            for booking_id, instance_ids in untagged.items():
+                manager.tag_instances(instance_ids, {**config.tagging.DEFAULT_TAGS, 'BookingId': str(booking_id)})
+                stats['tagged'] += len(instance_ids)
+
+        changed = []
+        flagged = {}
+        for row in rows:
+            info = swept.get(row.instance_id)
+            if not info:
+                if row.launched_at is None or row.launched_at < judged_before:
+                    row.state = GONE_STATE
+                    changed.append(row)
+                    stats['gone'] += 1
+                continue
+
+            public_dns = info['public_dns'] or row.public_dns
+            if (info['state'], public_dns) != (row.state, row.public_dns):
+                row.state = info['state']
+                row.public_dns = public_dns
+                changed.append(row)
+
+            if info['state'] in RUNNING_STATES and ReconcileService._booking_over(row.booking, judged_before):
+                flagged[row.instance_id] = (CleanupCandidate.Reason.ZOMBIE, info, row.booking.id)
+
+        EC2Instance.objects.bulk_update(changed, ['state', 'public_dns'], batch_size=500)
+        stats['updated'] = len(changed) - stats['gone']
+
+        unknown = [instance_id for instance_id in swept if instance_id not in live_ids]
+        # Rows already marked terminated (EC2 keeps listing terminated instances for a while)
+        unknown = list(set(unknown) - set(
+            EC2Instance.objects.filter(instance_id__in=unknown).values_list('instance_id', flat=True)
+        ))
+        accounted = set(
+            WarmPoolInstance.objects
+            .filter(instance_id__in=unknown)
+            .exclude(state=WarmPoolInstance.State.RETIRED)
+            .values_list('instance_id', flat=True)
+        )
+        pending_tokens = set(
+            ProvisioningRecord.objects
+            .filter(state=ProvisioningRecord.State.PENDING, client_token__in=[swept[i]['client_token'] for i in unknown])
+            .values_list('client_token', flat=True)
+        )
+        for instance_id in unknown:
+            info = swept[instance_id]
+            if (
+                instance_id in accounted
+                or info['client_token'] in pending_tokens  # launched, to be adopted by a provisioning retry
+                or info.get('tags', {}).get('Purpose') == 'ami-bake'  # GoldenImageBuilder cleans up after itself
+                or info['state'] not in ALIVE_STATES
+                or (info['launch_time'] and info['launch_time'] > judged_before)
+            ):
+                continue
+            booking_id = info.get('tags', {}).get('BookingId')
+            flagged[instance_id] = (
+                CleanupCandidate.Reason.ORPHAN,
+                info,
+                int(booking_id) if booking_id and booking_id.isdigit() else None
+            )
+
+        stats.update(ReconcileService._record_candidates(flagged, swept, now))
+        logger.info(
+            f"Reconciled {stats['swept']} instances: {stats['updated']} updated, {stats['gone']} gone, "
+            f"{stats['tagged']} tagged, {stats['orphans']} orphans, {stats['zombies']} zombies"
+        )
+        return stats
+
+    @staticmethod
+    def _booking_over(booking: Booking, judged_before) -> bool:
+        """Whether a booking's instances should have been shut down by ``judged_before``."""
+        if booking.provisioning_status == Booking.ProvisioningStatus.FAILED:
+            return bool(booking.status_changed_at and booking.status_changed_at < judged_before)
+        return booking.booking_time + timedelta(minutes=config.aws.SHUTDOWN_DELAY_MINUTES) < judged_before
+
+    @staticmethod
+    def _record_candidates(flagged: Dict, swept: Dict, now) -> Dict[str, int]:
+        """Opens, refreshes and resolves cleanup candidates in bulk."""
+        with transaction.atomic():
+            open_candidates = {
+                candidate.instance_id: candidate
+                for candidate in CleanupCandidate.objects.select_for_update().filter(resolved_at__isnull=True)
+            }
+            # Orphans name their booking by tag only; it may have been deleted
+            bookings = set(Booking.objects.filter(
+                pk__in={booking_id for _, _, booking_id in flagged.values() if booking_id}
+            ).values_list('pk', flat=True))
+
+            created = []
+            refreshed = []
+            for instance_id, (reason, info, booking_id) in flagged.items():
+                candidate = open_candidates.get(instance_id)
+                if candidate is None:
+                    created.append(CleanupCandidate(
+                        instance_id=instance_id,
+                        region=info['region'],
+                        reason=reason,
+                        booking_id=booking_id if booking_id in bookings else None,
+                        instance_type=info.get('instance_type', ''),
+                        state=info['state'],
+                        launched_at=info.get('launch_time'),
+                        first_seen_at=now,
+                        last_seen_at=now
+                    ))
+                else:
+                    candidate.reason = reason
+                    candidate.state = info['state']
+                    candidate.last_seen_at = now
+                    refreshed.append(candidate)
+
+            resolved = []
+            for instance_id, candidate in open_candidates.items():
+                if instance_id in flagged:
+                    continue
+                info = swept.get(instance_id)
+                candidate.resolved_at = now
+                candidate.resolution = 'cleared' if info and info['state'] in ALIVE_STATES else 'gone'
+                if info:
+                    candidate.state = info['state']
+                resolved.append(candidate)
+
+            CleanupCandidate.objects.bulk_create(created, batch_size=500)
+            CleanupCandidate.objects.bulk_update(
+                refreshed + resolved, ['reason', 'state', 'last_seen_at', 'resolved_at', 'resolution'], batch_size=500
+            )
+
+        for candidate in created:
+            logger.warning(
+                f"Flagged {candidate.reason} instance {candidate.instance_id} in {candidate.region} "
+                f"({candidate.state}, booking {candidate.booking_id})"
+            )
+
+        reasons = [reason for reason, _, _ in flagged.values()]
+        return {
+            'orphans': reasons.count(CleanupCandidate.Reason.ORPHAN),
+            'zombies': reasons.count(CleanupCandidate.Reason.ZOMBIE),
+            'resolved': len(resolved),
+        }
+
+    @staticmethod
+    def terminate_candidates(reason: Optional[str] = None) -> int:
+        """
+        Terminates the instances of open cleanup candidates (all, or of one
+        ``CleanupCandidate.Reason``) and resolves them.
+
+        Returns:
+            int: Number of instances terminated
+        """
+        candidates = CleanupCandidate.objects.filter(resolved_at__isnull=True)
+        if reason:
+            candidates = candidates.filter(reason=reason)
+        candidates = list(candidates)
+        if not candidates:
+            return 0
+
+        ec2_service = EC2ServiceManager(logger)
+        by_region = defaultdict(list)
+        for candidate in candidates:
+            by_region[candidate.region].append(candidate)
+
+        terminated = []
+        now = timezone.now()
+        for region, region_candidates in by_region.items():
+            try:
+                ec2_service.instance_manager.terminate_instances(
+                    [candidate.instance_id for candidate in region_candidates], region
+                )
+            except Exception as e:
+                logger.error(f"Error terminating cleanup candidates in {region}: {str(e)}", exc_info=True)
+                continue
+            for candidate in region_candidates:
+                candidate.resolved_at = now
+                candidate.resolution = 'terminated'
+                candidate.state = 'shutting-down'
+            terminated.extend(region_candidates)
+
+        CleanupCandidate.objects.bulk_update(terminated, ['resolved_at', 'resolution', 'state'], batch_size=500)
+        return len(terminated)
@@ -0,0 +1,196 @@
+# aws_ec2/services/warm_pool_service.py
+import hashlib
+from datetime import timedelta
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import Booking, WarmPoolInstance
+from ..ec2_utils.main import EC2ServiceManager
+from ..ec2_utils.config import config
+from .logging_service import LoggingService
+
+logger = LoggingService.get_logger("warm_pool_service")
+
+# EC2 states in which a pool instance is gone for good
+GONE_STATES = ('shutting-down', 'terminated')
+
+class WarmPoolService:
+    """
+    Keeps ``config.warm_pool.SIZE`` installed, stopped instances per
+    AWSConfig/JupyterConfig fingerprint, so bookings can skip the cold
+    launch and TLJH install.
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        return config.warm_pool.SIZE > 0
+
+    @staticmethod
+    def fingerprint() -> str:
+        """Pool key: instances are only claimed while the launch and TLJH settings still match."""
+        return hashlib.sha256(
+            f"{config.aws.fingerprint()}:{config.jupyter.fingerprint()}".encode()
+        ).hexdigest()
+
+    @staticmethod
+    def claim(booking: Booking, count: int) -> List[WarmPoolInstance]:
+        """
+        Claims up to ``count`` available pool instances for a booking. Rows
+        are locked with ``SKIP LOCKED`` so concurrent bookings never get the
+        same instance.
+
+        Returns:
+            List[WarmPoolInstance]: Claimed instances, possibly fewer than asked for
+        """
+        if count <= 0 or not WarmPoolService.enabled():
+            return []
+
+        with transaction.atomic():
+            claimed = list(
+                WarmPoolInstance.objects
+                .select_for_update(skip_locked=True)
+                .filter(fingerprint=WarmPoolService.fingerprint(), state=WarmPoolInstance.State.AVAILABLE)
+                .order_by('ready_at')[:count]
+            )
+            now = timezone.now()
+            for instance in claimed:
+                instance.state = WarmPoolInstance.State.CLAIMED
+                instance.booking = booking
+                instance.claimed_at = now
+            WarmPoolInstance.objects.bulk_update(claimed, ['state', 'booking', 'claimed_at'])
+
+        if claimed:
+            logger.info(f"Claimed {len(claimed)} of {count} instances from the warm pool for booking {booking.id}")
+            # Refill in the background once the claim is committed
+            from ..tasks import refill_warm_pool
+            transaction.on_commit(refill_warm_pool.delay, robust=True)
+        return claimed
+
+    @staticmethod
+    def retire(instances: List[WarmPoolInstance], reason: str,
+               ec2_service: Optional[EC2ServiceManager] = None, terminate: bool = True) -> None:
+        """Terminates pool instances and takes them out of the pool."""
+        if not instances:
+            return
+        if terminate:
+            ec2_service = ec2_service or EC2ServiceManager(logger)
+            ec2_service.warm_pool_manager.terminate([instance.instance_id for instance in instances])
+
+        WarmPoolInstance.objects.filter(id__in=[instance.id for instance in instances]).update(
+            state=WarmPoolInstance.State.RETIRED,
+            retired_reason=reason
+        )
+        logger.info(f"Retired {len(instances)} warm pool instances ({reason})")
+
+    @staticmethod
+    def refill(ami_id: str, prebaked: bool = False) -> Dict[str, int]:
+        """
+        Health-checks the pool and launches instances to bring it back to
+        ``config.warm_pool.SIZE``.
+
+        - Installing instances that have stopped become available; those
+          still running after ``INSTALL_TIMEOUT`` are replaced.
+        - Available instances that are no longer stopped, are older than
+          ``MAX_AGE_HOURS`` or belong to an outdated fingerprint are replaced.
+        - Instances beyond the pool size (e.g. from concurrent refills) are
+          terminated.
+        - Instances EC2 doesn't return are only given up on after
+          ``RECONCILE_GRACE``: DescribeInstances is eventually consistent, so
+          one launched seconds ago may not be listed yet.
+
+        Args:
+            ami_id: AMI new pool instances are launched from
+            prebaked: The AMI is a golden image with TLJH pre-installed
+
+        Returns:
+            Dict[str, int]: Pool counts after the refill and what was done
+        """
+        State = WarmPoolInstance.State
+        fingerprint = WarmPoolService.fingerprint()
+        ec2_service = EC2ServiceManager(logger)
+        now = timezone.now()
+
+        pooled = list(WarmPoolInstance.objects.filter(state__in=[State.PROVISIONING, State.AVAILABLE]))
+        states = ec2_service.instance_manager.describe_instance_states(
+            [instance.instance_id for instance in pooled]
+        ) if pooled else {}
+
+        judged_before = now - timedelta(seconds=settings.RECONCILE_GRACE)
+        to_retire = {}
+        gone = []
+        healthy = []
+        for instance in pooled:
+            ec2_state = states.get(instance.instance_id, {}).get('state')
+            instance.last_checked_at = now
+            if ec2_state is None and instance.created_at > judged_before:
+                # Not listed yet; retiring it would leak a running instance
+                healthy.append(instance)
+            elif ec2_state is None or ec2_state in GONE_STATES:
+                gone.append(instance)
+            elif instance.fingerprint != fingerprint:
+                to_retire.setdefault('outdated', []).append(instance)
+            elif instance.state == State.PROVISIONING:
+                if ec2_state == 'stopped':
+                    instance.state = State.AVAILABLE
+                    instance.ready_at = now
+                    healthy.append(instance)
+                elif (now - instance.created_at).total_seconds() > config.warm_pool.INSTALL_TIMEOUT:
+                    to_retire.setdefault('install timeout', []).append(instance)
+                else:
+                    healthy.append(instance)
+            elif ec2_state != 'stopped':
+                to_retire.setdefault('not stopped', []).append(instance)
+            elif instance.ready_at < now - timedelta(hours=config.warm_pool.MAX_AGE_HOURS):
+                to_retire.setdefault('expired', []).append(instance)
+            else:
+                healthy.append(instance)
+
+        WarmPoolInstance.objects.bulk_update(pooled, ['state', 'ready_at', 'last_checked_at'], batch_size=500)
+
+        # Keep the newest available instances if the pool overshot its size
+        surplus = len(healthy) - config.warm_pool.SIZE
+        if surplus > 0:
+            available = sorted(
+                (instance for instance in healthy if instance.state == State.AVAILABLE),
+                key=lambda instance: instance.ready_at
+            )
+            to_retire['surplus'] = available[:surplus]
+            healthy = [instance for instance in healthy if instance not in to_retire['surplus']]
+
+        WarmPoolService.retire(gone, 'gone', terminate=False)
+        for reason, instances in to_retire.items():
+            WarmPoolService.retire(instances, reason, ec2_service)
+
+        launched = []
+        deficit = config.warm_pool.SIZE - len(healthy)
+        if deficit > 0:
+            descriptions = ec2_service.launch_warm_pool_instances(
+                deficit,
+                tags={'Name': 'TLJH-WarmPool', 'Purpose': 'warm-pool', 'WarmPool': fingerprint[:16]},
+                ami_id=ami_id,
+                prebaked=prebaked
+            ) or []
+            launched = WarmPoolInstance.objects.bulk_create([
+                WarmPoolInstance(
+                    instance_id=description['InstanceId'],
+                    fingerprint=fingerprint,
+                    ami_id=description['ImageId'],
+                    instance_type=description['InstanceType'],
+                    created_at=now
+                )
+                for description in descriptions
+            ])
+
+        stats = {
+            'available': sum(1 for instance in healthy if instance.state == State.AVAILABLE),
+            'provisioning': sum(1 for instance in healthy if instance.state == State.PROVISIONING) + len(launched),
+            'launched': len(launched),
+            'retired': len(gone) + sum(len(instances) for instances in to_retire.values()),
+        }
+        if stats['launched'] or stats['retired']:
+            logger.info(
+                f"Warm pool: {stats['available']} available, {stats['provisioning']} installing, "
+                f"launched {stats['launched']}, retired {stats['retired']}"
+            )
+        return stats
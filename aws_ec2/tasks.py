@@ -1,42 +1,207 @@
 # tasks.py
 from celery import shared_task
+from celery.signals import task_prerun, task_postrun
 from django.utils import timezone
-from .models import Booking
+from .models import Booking, WarmPoolInstance
 from .services.booking_service import BookingService
 from .services.email_service import EmailService
 from .services.logging_service import LoggingService
+from .services.reconcile_service import ReconcileService
+from .services.warm_pool_service import WarmPoolService
+from .ec2_utils.logging_config import bind_log_context, reset_log_context
+from .ec2_utils.main import EC2ServiceManager
+from .ec2_utils.throttling import AWSThrottle
 
 logger = LoggingService.get_logger("booking_tasks")
 
+# Log context tokens of the tasks running in this worker, by task id
+_task_log_contexts = {}
+
+@task_prerun.connect
+def bind_task_log_context(task_id=None, **kwargs):
+    """Tags every record logged while a task runs with its task id."""
+    _task_log_contexts[task_id] = bind_log_context(task_id=task_id)
+
+@task_postrun.connect
+def reset_task_log_context(task_id=None, **kwargs):
+    tokens = _task_log_contexts.pop(task_id, None)
+    if tokens:
+        reset_log_context(tokens)
+
 @shared_task
 def create_scheduled_instances(booking_id: int):
     """
-    Celery task to create EC2 instances for a scheduled booking
+    Celery task to launch EC2 instances for a scheduled booking.
+
+    Only launches; readiness is tracked by ``poll_instance_states`` and
+    ``advance_booking_provisioning`` so the worker is freed straight away.
+    While the AWS circuit breaker is open the booking goes back to the
+    dispatcher instead of failing. Instances that failed to launch are
+    retried by queueing this task again; each run only launches the
+    instances still missing (see ``BookingService.create_instances``).
     """
-    try:
-        booking = Booking.objects.get(id=booking_id)
+    with LoggingService.context(booking_id=booking_id):
+        try:
+            booking = Booking.objects.get(id=booking_id)
         
-        if booking.ec2_instances_created:
-            logger.warning(f"Instances already created for booking {booking_id}")
-            return
+            if booking.ec2_instances_created:
+                logger.warning(f"Instances already created for booking {booking_id}")
+                return
             
-        credentials = booking.user_credentials.all()
+            credentials = booking.user_credentials.all()
         
-        if not credentials:
-            logger.error(f"No credentials found for booking {booking_id}")
-            return
+            if not credentials:
+                logger.error(f"No credentials found for booking {booking_id}")
+                return
+
+            if not AWSThrottle.provisioning_allowed():
+                logger.warning(f"AWS circuit breaker is open; deferring booking {booking_id}")
+                BookingService.defer_dispatch(booking)
+                return
             
-        instance_info = BookingService.create_instances(booking, list(credentials))
-        
-        if instance_info:
-            EmailService.send_instance_details(booking.email, instance_info)
-            logger.info(f"Successfully created instances for booking {booking_id}")
-        else:
-            logger.error(f"Failed to create instances for booking {booking_id}")
-            EmailService.send_creation_failure(booking.email)
+            instance_info = BookingService.create_instances(
+                booking,
+                list(credentials),
+                wait_until_ready=False
+            )
+
+            # None means the attempt itself broke, so there is nothing to resume
+            retry_in = BookingService.schedule_provisioning_retry(booking) if instance_info is not None else None
+            if retry_in is not None:
+                logger.info(f"Retrying the remaining instances of booking {booking_id} in {retry_in}s")
+            elif instance_info:
+                logger.info(f"Launched {len(instance_info)} instances for booking {booking_id}")
+            else:
+                logger.error(f"Failed to create instances for booking {booking_id}")
+                BookingService.mark_failed(booking)
             
+        except Exception as e:
+            logger.error(f"Error processing scheduled booking {booking_id}: {str(e)}", exc_info=True)
+
+@shared_task
+def dispatch_due_bookings():
+    """
+    Periodic task that queues ``create_scheduled_instances`` for bookings
+    that are due. Replaces long-ETA tasks, which the Redis broker keeps in
+    worker memory and re-delivers after its visibility timeout.
+    """
+    try:
+        BookingService.dispatch_due_bookings()
+    except Exception as e:
+        logger.error(f"Error dispatching due bookings: {str(e)}", exc_info=True)
+
+@shared_task
+def deliver_email_outbox():
+    """
+    Sends a batch of queued emails over one SMTP connection. Queued by
+    ``EmailService.enqueue`` and run periodically by beat to pick up
+    retries; re-queues itself while due messages remain and the provider
+    quota allows.
+    """
+    try:
+        stats = EmailService.deliver_outbox()
+        if stats['sent'] or stats['retried'] or stats['failed']:
+            logger.info(
+                f"Email outbox: sent {stats['sent']}, retried {stats['retried']}, failed {stats['failed']}, "
+                f"remaining {stats['remaining']}, latency p50 {stats['latency_p50']}s max {stats['latency_max']}s"
+            )
+        if stats['sent'] and stats['remaining']:
+            deliver_email_outbox.delay()
+        return stats
+    except Exception as e:
+        logger.error(f"Error delivering email outbox: {str(e)}", exc_info=True)
+
+@shared_task
+def purge_email_outbox():
+    """Periodic task that deletes delivered and failed outbox messages past their retention."""
+    try:
+        deleted = EmailService.purge_outbox()
+        if deleted:
+            logger.info(f"Purged {deleted} old outbox emails")
+        return deleted
+    except Exception as e:
+        logger.error(f"Error purging the email outbox: {str(e)}", exc_info=True)
+
+@shared_task
+def poll_instance_states():
+    """
+    Periodic task that refreshes all launched instances across all bookings
+    in one batched sweep and wakes the bookings that are now running.
+    """
+    try:
+        for booking_id in BookingService.refresh_launched_instances():
+            # Wakes up again at the ready timeout unless a readiness callback comes first
+            advance_booking_provisioning.apply_async(
+                args=[booking_id],
+                countdown=BookingService.ready_wait_time()
+            )
+    except Exception as e:
+        logger.error(f"Error polling instance states: {str(e)}", exc_info=True)
+
+@shared_task
+def advance_booking_provisioning(booking_id: int):
+    """
+    Celery task that runs one step of a booking's provisioning and
+    re-schedules itself until the booking is notified or has failed.
+    """
+    with LoggingService.context(booking_id=booking_id):
+        try:
+            booking = Booking.objects.get(id=booking_id)
+            countdown = BookingService.advance_provisioning(booking)
+
+            if countdown is not None:
+                advance_booking_provisioning.apply_async(args=[booking_id], countdown=countdown)
+                logger.debug(f"Booking {booking_id} is {booking.provisioning_status}; next check in {countdown}s")
+
+        except Booking.DoesNotExist:
+            logger.error(f"Booking {booking_id} no longer exists")
+        except Exception as e:
+            logger.error(f"Error advancing provisioning for booking {booking_id}: {str(e)}", exc_info=True)
+
+@shared_task
+def refill_warm_pool():
+    """
+    Health-checks the warm pool and launches instances to bring it back to
+    size. Runs periodically and after every claim.
+    """
+    try:
+        if not WarmPoolService.enabled() and not WarmPoolInstance.objects.filter(
+            state__in=[WarmPoolInstance.State.PROVISIONING, WarmPoolInstance.State.AVAILABLE]
+        ).exists():
+            return None
+        if AWSThrottle.breaker_open():
+            logger.warning("AWS circuit breaker is open; not refilling the warm pool")
+            return None
+        ami_id, prebaked = BookingService.resolve_image()
+        return WarmPoolService.refill(ami_id, prebaked)
+    except Exception as e:
+        logger.error(f"Error refilling the warm pool: {str(e)}", exc_info=True)
+
+@shared_task
+def reconcile_instances():
+    """
+    Periodic task that syncs ``EC2Instance`` rows with a tag-filtered sweep
+    of EC2 and flags orphans and zombies for cleanup (see ``ReconcileService``).
+    """
+    try:
+        if AWSThrottle.breaker_open():
+            logger.warning("AWS circuit breaker is open; not reconciling instances")
+            return None
+        return ReconcileService.reconcile()
+    except Exception as e:
+        logger.error(f"Error reconciling instances: {str(e)}", exc_info=True)
+
+@shared_task
+def sweep_shutdown_schedules():
+    """
+    Periodic task that deletes expired shutdown rules, their targets and
+    stale Lambda permission statements.
+    """
+    try:
+        ec2_service = EC2ServiceManager(logger)
+        ec2_service.instance_manager.cleanup_expired_shutdown_rules()
     except Exception as e:
-        logger.error(f"Error processing scheduled booking {booking_id}: {str(e)}", exc_info=True)
+        logger.error(f"Error sweeping shutdown schedules: {str(e)}", exc_info=True)
 
 # @shared_task
 # def test_task(x, y):
@@ -1,3 +1,1484 @@
-from django.test import TestCase
+import email
+import gzip
+import importlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Booking, CleanupCandidate, EC2Instance, EmailOutbox, ProvisioningDuration, ProvisioningRecord, SlotCapacity, UserCredential, WarmPoolInstance
+from .services.booking_service import READY_CALLBACK_SALT, BookingService
+from .services.capacity_service import CapacityError, CapacityService
+from .services.credential_service import CredentialService
+from .services.email_service import EmailService
+from .services.lead_time_service import LeadTimeService
+from .services.reconcile_service import ReconcileService
+from .services.warm_pool_service import WarmPoolService
+from .tasks import advance_booking_provisioning
+from .ec2_utils import security, throttling
+from .ec2_utils.aws_clients import AWSClientRegistry, _thread_local
+from .ec2_utils.config import config
+from .ec2_utils.instance_manager import EC2InstanceManager, InstanceLaunchError
+from .ec2_utils.logging_config import CompressingRotatingFileHandler, JsonFormatter, LoggerSetup, log_context
+from .ec2_utils.main import EC2ServiceManager
+from .ec2_utils.placement import InstancePlanner
+from .ec2_utils.user_data import BOOKING_USERS_FILE, UserDataGenerator
+from .ec2_utils.throttling import AWSThrottle, CircuitBreaker, ThrottleTimeout, TokenBucket, api_family
+
+
+class FakeClock:
+    """Stands in for the ``time`` module so buckets and the breaker can be driven without sleeping."""
+
+    def __init__(self, start: float = 1_000_000.0):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def make_booking(**fields) -> Booking:
+    """Creates a booking with defaults for the fields a test doesn't care about."""
+    fields.setdefault('email', f"user{Booking.objects.count()}@example.com")
+    fields.setdefault('booking_time', timezone.now())
+    fields.setdefault('number_of_users', 2)
+    return Booking.objects.create(**fields)
+
+
+class AWSClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        AWSClientRegistry.reset()
+        self.addCleanup(AWSClientRegistry.reset)
+        patchers = [mock.patch('boto3.session.Session'), mock.patch.object(AWSThrottle, 'attach')]
+        self.session_class = patchers[0].start()
+        patchers[1].start()
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        self.session = self.session_class.return_value
+        self.session.client.side_effect = lambda service, **kwargs: mock.Mock(name=f"{service}-{kwargs['region_name']}")
+        self.session.resource.side_effect = lambda service, **kwargs: mock.Mock(name=service)
+
+    def test_clients_are_shared(self):
+        client = AWSClientRegistry.get_client('ec2', 'ap-southeast-2')
+        self.assertIs(AWSClientRegistry.get_client('ec2', 'ap-southeast-2'), client)
+        self.assertIsNot(AWSClientRegistry.get_client('ec2', 'us-east-1'), client)
+        self.assertEqual(self.session.client.call_count, 2)
+        self.session_class.assert_called_once()
+
+    def test_clients_are_rebuilt_after_a_fork(self):
+        client = AWSClientRegistry.get_client('ec2')
+        with mock.patch('aws_ec2.ec2_utils.aws_clients.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(AWSClientRegistry.get_client('ec2'), client)
+
+    def test_account_id_is_fetched_once(self):
+        sts = mock.Mock()
+        sts.get_caller_identity.return_value = {'Account': '123456789012'}
+        self.session.client.side_effect = None
+        self.session.client.return_value = sts
+        self.assertEqual(AWSClientRegistry.get_account_id(), '123456789012')
+        self.assertEqual(AWSClientRegistry.get_account_id(), '123456789012')
+        sts.get_caller_identity.assert_called_once()
+
+    def test_resources_are_per_thread(self):
+        resource = AWSClientRegistry.get_resource('ec2')
+        self.assertIs(AWSClientRegistry.get_resource('ec2'), resource)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(AWSClientRegistry.get_resource('ec2')))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], resource)
+
+    def test_greenlets_share_their_threads_resources(self):
+        monkey = mock.Mock()
+        monkey.is_module_patched.return_value = True
+        monkey.get_original.return_value = threading.local
+        with mock.patch.dict(sys.modules, {'gevent': mock.Mock(monkey=monkey), 'gevent.monkey': monkey}):
+            local = _thread_local()
+        monkey.get_original.assert_called_once_with('threading', 'local')
+        self.assertIsInstance(local, threading.local)
+
+
+class ThrottlingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        AWSThrottle.use_redis(self.redis)
+        self.clock = FakeClock()
+        patcher = mock.patch.object(throttling, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        throttling._probe_token.set(None)
+
+
+class TokenBucketTests(ThrottlingTestCase):
+    def test_burst_then_waits_for_refill(self):
+        bucket = TokenBucket(self.redis, 'ec2-run', 2.0)
+        burst = int(2.0 * config.throttling.BURST_SECONDS)
+        for _ in range(burst):
+            self.assertEqual(bucket.acquire(), 0)
+        self.assertGreater(bucket.acquire(), 0)
+
+    def test_times_out_when_no_token_in_time(self):
+        bucket = TokenBucket(self.redis, 'ec2-run', 0.5)
+        bucket.acquire()
+        with self.assertRaises(ThrottleTimeout):
+            bucket.acquire(max_wait=0.1)
+
+    def test_penalize_cuts_rate_and_recovers_linearly(self):
+        bucket = TokenBucket(self.redis, 'ec2-describe', 20.0)
+        self.assertEqual(bucket.penalize(), 20.0 * config.throttling.DECREASE_FACTOR)
+        # A second throttling error right after doesn't cut the rate again
+        self.assertEqual(bucket.penalize(), 10.0)
+
+        self.clock.sleep(config.throttling.RECOVERY_SECONDS / 4)
+        self.assertAlmostEqual(bucket.rate(), 15.0)
+        self.clock.sleep(config.throttling.RECOVERY_SECONDS)
+        self.assertEqual(bucket.rate(), 20.0)
+
+    def test_penalize_never_goes_below_min_rate(self):
+        bucket = TokenBucket(self.redis, 'ec2-run', 2.0)
+        for _ in range(10):
+            bucket.penalize()
+            self.clock.sleep(throttling.PENALTY_INTERVAL)
+        self.assertGreaterEqual(bucket.rate(), config.throttling.MIN_RATE)
+
+    def test_families(self):
+        self.assertEqual(api_family('ec2', 'RunInstances'), 'ec2-run')
+        self.assertEqual(api_family('ec2', 'DescribeInstances'), 'ec2-describe')
+        self.assertEqual(api_family('ec2', 'CreateTags'), 'ec2-mutating')
+        self.assertEqual(AWSThrottle._family('before-send.eventbridge.PutRule'), 'eventbridge')
+        self.assertEqual(AWSThrottle.bucket('eventbridge').max_rate, config.throttling.RATES['eventbridge'])
+
+
+class CircuitBreakerTests(ThrottlingTestCase):
+    def open_breaker(self, breaker: CircuitBreaker) -> None:
+        for _ in range(config.throttling.BREAKER_FAILURE_THRESHOLD):
+            breaker.record_failure()
+
+    def test_opens_after_threshold_failures(self):
+        breaker = AWSThrottle.breaker()
+        for _ in range(config.throttling.BREAKER_FAILURE_THRESHOLD - 1):
+            breaker.record_failure()
+        self.assertEqual(breaker.state(), CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+    def test_successes_do_not_reset_the_failure_count(self):
+        breaker = AWSThrottle.breaker()
+        for _ in range(config.throttling.BREAKER_FAILURE_THRESHOLD - 1):
+            breaker.record_failure()
+            breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), CircuitBreaker.OPEN)
+
+    def test_failures_outside_the_window_expire(self):
+        breaker = AWSThrottle.breaker()
+        for _ in range(config.throttling.BREAKER_FAILURE_THRESHOLD - 1):
+            breaker.record_failure()
+        self.clock.sleep(config.throttling.BREAKER_FAILURE_WINDOW + 1)
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), CircuitBreaker.CLOSED)
+
+    def test_unrelated_success_does_not_close(self):
+        breaker = AWSThrottle.breaker()
+        self.open_breaker(breaker)
+        breaker.record_success()
+        self.assertEqual(breaker.state(), CircuitBreaker.OPEN)
+
+        self.clock.sleep(config.throttling.BREAKER_COOLDOWN + 1)
+        self.assertEqual(breaker.state(), CircuitBreaker.HALF_OPEN)
+        # e.g. the state poll's DescribeInstances, made without the probe
+        breaker.record_success()
+        self.assertEqual(breaker.state(), CircuitBreaker.HALF_OPEN)
+
+    def test_single_probe_closes_on_success(self):
+        breaker = AWSThrottle.breaker()
+        self.open_breaker(breaker)
+        self.clock.sleep(config.throttling.BREAKER_COOLDOWN + 1)
+
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state(), CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    def test_failure_while_half_open_reopens(self):
+        breaker = AWSThrottle.breaker()
+        self.open_breaker(breaker)
+        self.clock.sleep(config.throttling.BREAKER_COOLDOWN + 1)
+
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), CircuitBreaker.OPEN)
+        self.assertAlmostEqual(breaker.retry_after(), config.throttling.BREAKER_COOLDOWN)
+
+    def test_after_call_handlers(self):
+        response = mock.Mock(status_code=503)
+        for _ in range(config.throttling.BREAKER_FAILURE_THRESHOLD):
+            AWSThrottle._after_call(http_response=response, parsed={})
+        self.assertTrue(AWSThrottle.breaker_open())
+        AWSThrottle._after_call(http_response=mock.Mock(status_code=200), parsed={})
+        self.assertTrue(AWSThrottle.breaker_open())
+
+
+class InstanceReadyViewTests(TestCase):
+    def setUp(self):
+        self.booking = make_booking(provisioning_status=Booking.ProvisioningStatus.RUNNING)
+        self.url = reverse('aws_ec2:instance_ready', args=[signing.dumps(self.booking.id, salt=READY_CALLBACK_SALT)])
+        for instance_id in ('i-1', 'i-2'):
+            EC2Instance.objects.create(booking=self.booking, instance_id=instance_id, public_dns='', state='pending')
+
+    def post(self, instance_id):
+        with mock.patch('aws_ec2.tasks.advance_booking_provisioning.delay') as advance:
+            response = self.client.post(self.url, {'instance_id': instance_id, 'public_dns': 'ec2.example'})
+        return response, advance
+
+    def test_unknown_instance_asks_for_a_retry(self):
+        response, advance = self.post('i-not-yet-recorded')
+        self.assertEqual(response.status_code, 409)
+        advance.assert_not_called()
+
+    def test_ready_and_repeated_callbacks_succeed(self):
+        response, advance = self.post('i-1')
+        self.assertEqual(response.status_code, 200)
+        advance.assert_not_called()
+        self.assertIsNotNone(EC2Instance.objects.get(instance_id='i-1').ready_at)
+
+        response, advance = self.post('i-1')
+        self.assertEqual(response.status_code, 200)
+
+        response, advance = self.post('i-2')
+        self.assertEqual(response.status_code, 200)
+        advance.assert_called_once_with(self.booking.id)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.provisioning_status, Booking.ProvisioningStatus.READY)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.post(reverse('aws_ec2:instance_ready', args=['bad']), {'instance_id': 'i-1'})
+        self.assertEqual(response.status_code, 403)
+
+
+class ProvisioningRecordTests(TestCase):
+    def setUp(self):
+        self.booking = make_booking()
+
+    def make_record(self, **fields) -> ProvisioningRecord:
+        fields.setdefault('position', self.booking.provisioning_records.count() + 1)
+        fields.setdefault('client_token', BookingService._client_token(self.booking.id, fields['position']))
+        fields.setdefault('instance_type', 't3.medium')
+        fields.setdefault('admin_password_nonce', CredentialService.new_admin_nonce())
+        return ProvisioningRecord.objects.create(booking=self.booking, **fields)
+
+    def test_admin_password_is_derived_from_the_nonce(self):
+        record = self.make_record()
+        password = CredentialService.admin_password(record.admin_password_nonce)
+        self.assertEqual(password, CredentialService.admin_password(record.admin_password_nonce))
+        self.assertNotEqual(password, CredentialService.admin_password(CredentialService.new_admin_nonce()))
+        self.assertNotIn(password, record.admin_password_nonce)
+
+    def test_giving_up_clears_the_nonce(self):
+        record = self.make_record(attempts=settings.PROVISIONING_MAX_ATTEMPTS)
+        BookingService._record_launch_failure(record, Exception('InsufficientInstanceCapacity'))
+        self.assertEqual(record.state, ProvisioningRecord.State.FAILED)
+        self.assertEqual(record.admin_password_nonce, '')
+
+
+class AdminPasswordTests(TestCase):
+    def test_password_is_emailed_then_forgotten(self):
+        booking = make_booking(provisioning_status=Booking.ProvisioningStatus.READY)
+        nonce = CredentialService.new_admin_nonce()
+        EC2Instance.objects.create(booking=booking, instance_id='i-1', public_dns='', admin_password_nonce=nonce)
+
+        with mock.patch('aws_ec2.services.booking_service.EmailService.send_instance_details') as send:
+            self.assertIsNone(BookingService.advance_provisioning(booking))
+        (_, _, admin_credentials), = send.call_args.args[1]
+        self.assertEqual(admin_credentials['password'], CredentialService.admin_password(nonce))
+
+        self.assertEqual(EC2Instance.objects.get(instance_id='i-1').admin_password_nonce, '')
+        booking.refresh_from_db()
+        self.assertEqual(booking.provisioning_status, Booking.ProvisioningStatus.NOTIFIED)
+
+    def test_password_is_kept_if_the_email_fails(self):
+        booking = make_booking(provisioning_status=Booking.ProvisioningStatus.READY)
+        nonce = CredentialService.new_admin_nonce()
+        EC2Instance.objects.create(booking=booking, instance_id='i-1', public_dns='', admin_password_nonce=nonce)
+
+        with mock.patch(
+            'aws_ec2.services.booking_service.EmailService.send_instance_details', side_effect=Exception('SMTP')
+        ):
+            self.assertEqual(BookingService.advance_provisioning(booking), config.jupyter.PROVISIONING_POLL_INTERVAL)
+        self.assertEqual(EC2Instance.objects.get(instance_id='i-1').admin_password_nonce, nonce)
+
+
+@override_settings(CREDENTIAL_HASH_WORKERS=2)
+class CredentialHashingTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(CredentialService.shutdown)
+
+    def test_pool_hashes_verify(self):
+        passwords = [f"secret-{n}" for n in range(4)]
+        hashes = CredentialService.hash_passwords(passwords)
+
+        self.assertIsNotNone(CredentialService._executor)
+        self.assertEqual(len(set(hashes)), len(passwords))
+        for password, encoded in zip(passwords, hashes):
+            self.assertTrue(check_password(password, encoded))
+        self.assertFalse(check_password('secret-1', hashes[0]))
+
+    def test_small_batches_are_hashed_inline(self):
+        with mock.patch.object(CredentialService, '_get_executor') as get_executor:
+            hashes = CredentialService.hash_passwords(['a', 'b'])
+        get_executor.assert_not_called()
+        self.assertTrue(check_password('b', hashes[1]))
+
+    def test_broken_pool_falls_back_to_inline_hashing(self):
+        executor = mock.Mock(_max_workers=2)
+        executor.map.side_effect = BrokenProcessPool('worker died')
+        with mock.patch.object(CredentialService, '_get_executor', return_value=executor), \
+                mock.patch.object(CredentialService, 'shutdown') as shutdown:
+            hashes = CredentialService.hash_passwords(['a', 'b', 'c', 'd'])
+        shutdown.assert_called_once()
+        self.assertTrue(check_password('d', hashes[3]))
+
+
+class WarmPoolRefillTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('aws_ec2.services.warm_pool_service.EC2ServiceManager')
+        self.ec2_service = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.ec2_service.launch_warm_pool_instances.return_value = []
+        size = mock.patch.object(config.warm_pool, 'SIZE', 2)
+        size.start()
+        self.addCleanup(size.stop)
+
+    def pool_instance(self, instance_id, age) -> WarmPoolInstance:
+        return WarmPoolInstance.objects.create(
+            instance_id=instance_id,
+            fingerprint=WarmPoolService.fingerprint(),
+            ami_id='ami-1',
+            instance_type='t3.medium',
+            created_at=timezone.now() - age
+        )
+
+    def test_unlisted_instances_are_only_retired_after_the_grace_period(self):
+        young = self.pool_instance('i-young', timedelta(seconds=10))
+        old = self.pool_instance('i-old', timedelta(seconds=settings.RECONCILE_GRACE + 60))
+        # Neither is returned by DescribeInstances
+        self.ec2_service.instance_manager.describe_instance_states.return_value = {}
+
+        stats = WarmPoolService.refill('ami-1')
+
+        young.refresh_from_db()
+        old.refresh_from_db()
+        self.assertEqual(young.state, WarmPoolInstance.State.PROVISIONING)
+        self.assertEqual((old.state, old.retired_reason), (WarmPoolInstance.State.RETIRED, 'gone'))
+        self.ec2_service.warm_pool_manager.terminate.assert_not_called()
+        self.assertEqual((stats['provisioning'], stats['retired']), (1, 1))
+
+
+class LogArchivingTests(SimpleTestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+        with mock.patch.object(CompressingRotatingFileHandler, '_start_archiving'):
+            self.handler = CompressingRotatingFileHandler(self.log_dir, 'app', 1024, 3600, max_files=2)
+
+    def write(self, name, content=b'{}\n'):
+        with open(os.path.join(self.log_dir, name), 'wb') as f:
+            f.write(content)
+
+    def test_files_of_exited_processes_are_compressed_and_pruned(self):
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        self.write(f"app_{exited.pid}.jsonl", b'current\n')
+        self.write(f"app_{exited.pid}_20260101000000000000.jsonl", b'rotated\n')
+        self.write(f"app_{os.getpid()}.jsonl")
+        self.write(f"app_{os.getppid()}.jsonl")
+
+        self.handler._compress_and_prune()
+
+        files = sorted(os.listdir(self.log_dir))
+        self.assertIn(f"app_{os.getpid()}.jsonl", files)
+        self.assertIn(f"app_{os.getppid()}.jsonl", files)
+        archives = [name for name in files if name.endswith('.jsonl.gz')]
+        self.assertEqual(len(archives), 2)
+        contents = set()
+        for name in archives:
+            with gzip.open(os.path.join(self.log_dir, name)) as f:
+                contents.add(f.read())
+        self.assertEqual(contents, {b'current\n', b'rotated\n'})
+
+        self.write(f"app_{exited.pid}_20260101000000000001.jsonl", b'older\n')
+        self.handler._compress_and_prune()
+        self.assertEqual(len([name for name in os.listdir(self.log_dir) if name.endswith('.gz')]), 2)
+
+
+class LoggingPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+
+    def wait_for_archiving(self):
+        for thread in threading.enumerate():
+            if thread.name == 'log-compress':
+                thread.join(5)
+
+    def read_log(self, path):
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_booking_id_reaches_the_json_file(self):
+        # A pipeline of its own, writing to the temporary directory only
+        for name, value in {'LOG_DIR': self.log_dir, 'FILE_LOG_ENABLED': True, 'CONSOLE_LOG_ENABLED': False}.items():
+            patcher = mock.patch.object(config.logging, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ('_queue_handler', '_listener', '_handlers'):
+            patcher = mock.patch.object(LoggerSetup, name, None if name != '_handlers' else [])
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        logger = LoggerSetup.setup_logger('aws_ec2.tests.pipeline', 'INFO')
+        self.addCleanup(logger.removeHandler, LoggerSetup._queue_handler)
+        with log_context(booking_id=42, task_id='task-1'):
+            logger.info("Inside the booking")
+        logger.info("Outside the booking")
+        LoggerSetup.stop()
+        for handler in LoggerSetup._handlers:
+            handler.close()
+
+        inside, outside = self.read_log(os.path.join(self.log_dir, f"{config.logging.LOG_FILE_PREFIX}_{os.getpid()}.jsonl"))
+        self.assertEqual(inside['message'], "Inside the booking")
+        self.assertEqual((inside['booking_id'], inside['task_id']), ('42', 'task-1'))
+        self.assertEqual(inside['logger'], 'aws_ec2.tests.pipeline')
+        self.assertIsNone(outside['booking_id'])
+
+    def test_rollover_produces_a_gzip_archive(self):
+        handler = CompressingRotatingFileHandler(self.log_dir, 'app', max_bytes=200, rotate_interval=3600, max_files=5)
+        self.addCleanup(handler.close)
+        handler.setFormatter(JsonFormatter())
+        self.wait_for_archiving()
+
+        records = [
+            logging.LogRecord('aws_ec2', logging.INFO, __file__, 1, f"record {n}", None, None)
+            for n in range(3)
+        ]
+        for record in records:
+            handler.handle(record)
+        self.wait_for_archiving()
+
+        archives = [name for name in os.listdir(self.log_dir) if name.endswith('.jsonl.gz')]
+        self.assertTrue(archives)
+        archived = []
+        for name in archives:
+            with gzip.open(os.path.join(self.log_dir, name), 'rt') as f:
+                archived.extend(json.loads(line)['message'] for line in f)
+        current = [entry['message'] for entry in self.read_log(handler.baseFilename)]
+        self.assertEqual(sorted(archived + current), [f"record {n}" for n in range(3)])
+
+
+class SecurityGroupTests(SimpleTestCase):
+    RULES = [
+        {'protocol': 'tcp', 'from_port': 22, 'to_port': 22, 'cidr_ip': '0.0.0.0/0', 'description': 'SSH'},
+        {'protocol': 'tcp', 'from_port': 80, 'to_port': 80, 'cidr_ip': '0.0.0.0/0'},
+        {'protocol': 'tcp', 'from_port': 443, 'to_port': 443, 'cidr_ip': '0.0.0.0/0'},
+    ]
+
+    def setUp(self):
+        patchers = [
+            mock.patch.dict(security._security_group_cache, clear=True),
+            mock.patch.object(config.security_group, 'INGRESS_RULES', self.RULES),
+            mock.patch.object(config.security_group, 'CACHE_TTL', 300),
+            mock.patch.object(security, 'time', mock.Mock(**{'monotonic.return_value': 1000.0})),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.ec2 = mock.Mock()
+        self.ec2.meta.client.meta.region_name = 'ap-southeast-2'
+        self.manager = security.SecurityGroupManager(self.ec2, mock.Mock())
+
+    def security_group(self, ip_permissions):
+        group = mock.Mock(id='sg-1')
+        group.ip_permissions_reads = mock.PropertyMock(return_value=ip_permissions)
+        type(group).ip_permissions = group.ip_permissions_reads
+        return group
+
+    def test_group_id_is_cached_until_the_ttl(self):
+        self.ec2.security_groups.filter.return_value = [mock.Mock(id='sg-1')]
+        self.assertEqual(self.manager.create_or_get_security_group(config.security_group.NAME, 'TLJH'), 'sg-1')
+        self.assertEqual(self.manager.create_or_get_security_group(config.security_group.NAME, 'TLJH'), 'sg-1')
+        self.ec2.security_groups.filter.assert_called_once()
+
+        security.time.monotonic.return_value = 1301.0
+        self.manager.create_or_get_security_group(config.security_group.NAME, 'TLJH')
+        self.assertEqual(self.ec2.security_groups.filter.call_count, 2)
+        self.ec2.create_security_group.assert_not_called()
+
+    def test_missing_group_is_created(self):
+        self.ec2.security_groups.filter.return_value = []
+        self.ec2.create_security_group.return_value = mock.Mock(id='sg-2')
+        self.assertEqual(self.manager.create_or_get_security_group('other', 'Other'), 'sg-2')
+        self.ec2.create_security_group.assert_called_once_with(GroupName='other', Description='Other')
+
+    def test_missing_rules_are_authorized_in_one_call(self):
+        group = self.security_group([
+            {'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
+        ])
+        self.assertTrue(self.manager.setup_jupyter_security_rules(group))
+        group.authorize_ingress.assert_called_once_with(IpPermissions=[
+            {'IpProtocol': 'tcp', 'FromPort': 22, 'ToPort': 22, 'IpRanges': [{'CidrIp': '0.0.0.0/0', 'Description': 'SSH'}]},
+            {'IpProtocol': 'tcp', 'FromPort': 443, 'ToPort': 443, 'IpRanges': [{'CidrIp': '0.0.0.0/0', 'Description': ''}]},
+        ])
+
+        # Cached: no further API calls until the rules change or the TTL passes
+        self.assertTrue(self.manager.setup_jupyter_security_rules(group))
+        group.ip_permissions_reads.assert_called_once()
+        group.authorize_ingress.assert_called_once()
+
+        with mock.patch.object(config.security_group, 'INGRESS_RULES', self.RULES[:2]):
+            self.assertTrue(self.manager.setup_jupyter_security_rules(group))
+        self.assertEqual(group.ip_permissions_reads.call_count, 2)
+
+    def test_duplicate_rules_count_as_authorized(self):
+        group = self.security_group([])
+        group.authorize_ingress.side_effect = ClientError(
+            {'Error': {'Code': 'InvalidPermission.Duplicate', 'Message': 'already exists'}}, 'AuthorizeSecurityGroupIngress'
+        )
+        self.assertTrue(self.manager.setup_jupyter_security_rules(group))
+
+    def test_failed_authorization_is_not_cached(self):
+        group = self.security_group([])
+        group.authorize_ingress.side_effect = ClientError(
+            {'Error': {'Code': 'UnauthorizedOperation', 'Message': 'denied'}}, 'AuthorizeSecurityGroupIngress'
+        )
+        self.assertFalse(self.manager.setup_jupyter_security_rules(group))
+        self.assertFalse(self.manager.setup_jupyter_security_rules(group))
+        self.assertEqual(group.authorize_ingress.call_count, 2)
+
+
+class CreateInstancesTests(SimpleTestCase):
+    def setUp(self):
+        with mock.patch('aws_ec2.ec2_utils.main.AWSClientRegistry'), \
+                mock.patch('aws_ec2.ec2_utils.main.EC2InstanceManager'), \
+                mock.patch('aws_ec2.ec2_utils.main.WarmPoolManager'):
+            self.ec2_service = EC2ServiceManager(mock.Mock())
+        self.ec2_service._jupyter_security_group = mock.Mock(return_value='sg-1')
+        self.users = [{'username': f"u{i}", 'password_hash': '$6$x'} for i in range(4)]
+
+    def test_partial_launch_keeps_the_launched_instances(self):
+        launched = [(mock.Mock(id='i-1'), self.users[:2], {'username': 'pawsey', 'password': 'p'})]
+        error = Exception('InsufficientInstanceCapacity')
+        self.ec2_service.instance_manager.create_instances.side_effect = InstanceLaunchError(launched, {2: error})
+
+        instances, failures = self.ec2_service.create_ec2_instances(self.users, wait_until_ready=False)
+
+        self.assertEqual(instances, launched)
+        self.assertEqual(failures, {2: error})
+
+    def test_setup_failure_returns_none(self):
+        self.ec2_service._jupyter_security_group.side_effect = Exception('Failed to create/get security group')
+        self.assertIsNone(self.ec2_service.create_ec2_instances(self.users))
+        self.ec2_service.instance_manager.create_instances.assert_not_called()
+
+
+class LambdaHandlerTests(SimpleTestCase):
+    """The Lambda handlers are deployed on their own, so they're imported from their directory."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        lambda_dir = os.path.join(os.path.dirname(__file__), 'lamdba_functions')
+        with mock.patch.object(sys, 'path', [lambda_dir, *sys.path]), mock.patch('boto3.client'):
+            cls.actions = importlib.import_module('instance_actions')
+            cls.stop = importlib.import_module('stop_instance')
+            cls.terminate = importlib.import_module('terminate_instance')
+
+    def fake_ec2(self, states):
+        ec2 = mock.Mock()
+        pages = [{'Reservations': [{'Instances': [
+            {'InstanceId': instance_id, 'State': {'Name': state}} for instance_id, state in states.items()
+        ]}]}]
+        ec2.get_paginator.return_value.paginate.return_value = pages
+        ec2.stop_instances.side_effect = lambda InstanceIds: {
+            'StoppingInstances': [{'InstanceId': instance_id} for instance_id in InstanceIds]
+        }
+        ec2.terminate_instances.side_effect = lambda InstanceIds: {
+            'TerminatingInstances': [{'InstanceId': instance_id} for instance_id in InstanceIds]
+        }
+        return ec2
+
+    def results(self, response):
+        return json.loads(response['body'])['results']
+
+    def test_build_filters(self):
+        build_filters = self.actions.build_filters
+        self.assertEqual(build_filters({'instance_id': 'i-1'}), ([], ['i-1']))
+        self.assertEqual(build_filters({'instance_ids': ['i-1', 'i-2', 'i-1']}), ([], ['i-1', 'i-2']))
+        self.assertEqual(
+            build_filters({'booking_id': 7, 'tags': {'Project': 'jupyter'}}),
+            ([{'Name': 'tag:Project', 'Values': ['jupyter']}, {'Name': 'tag:BookingId', 'Values': ['7']}], None)
+        )
+        with self.assertRaises(ValueError):
+            build_filters({})
+
+    def test_requested_ids_are_described_in_chunks(self):
+        instance_ids = [f"i-{n}" for n in range(450)]
+        ec2 = self.fake_ec2({})
+        self.actions.describe_states(ec2, [], instance_ids)
+        chunks = [call.kwargs['Filters'][0]['Values'] for call in ec2.get_paginator.return_value.paginate.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [200, 200, 50])
+        self.assertEqual(sum(chunks, []), instance_ids)
+
+    def test_stop_acts_on_running_instances_in_batches(self):
+        states = {f"i-{n}": 'running' for n in range(250)}
+        states['i-stopped'] = 'stopped'
+        ec2 = self.fake_ec2(states)
+        with mock.patch.object(self.stop, 'ec2', ec2):
+            results = self.results(self.stop.lambda_handler({'booking_id': 7}, None))
+
+        batches = [call.kwargs['InstanceIds'] for call in ec2.stop_instances.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [100, 100, 50])
+        self.assertEqual(results['i-0'], {'previous_state': 'running', 'action': 'stopping'})
+        self.assertEqual(results['i-stopped'], {'previous_state': 'stopped', 'action': 'skipped'})
+        ec2.terminate_instances.assert_not_called()
+
+    def test_terminate_skips_finished_instances_and_reports_missing_ones(self):
+        ec2 = self.fake_ec2({'i-1': 'stopped', 'i-2': 'terminated', 'i-3': 'running'})
+        with mock.patch.object(self.terminate, 'ec2', ec2):
+            results = self.results(self.terminate.lambda_handler({'instance_ids': ['i-1', 'i-2', 'i-3', 'i-4']}, None))
+
+        ec2.terminate_instances.assert_called_once_with(InstanceIds=['i-1', 'i-3'])
+        self.assertEqual(results['i-1']['action'], 'terminating')
+        self.assertEqual(results['i-2']['action'], 'skipped')
+        self.assertEqual(results['i-4'], {'previous_state': None, 'action': 'not_found'})
+
+    def test_rejected_batch_is_retried_one_by_one(self):
+        ec2 = self.fake_ec2({'i-1': 'running', 'i-2': 'running'})
+
+        def stop_instances(InstanceIds):
+            if 'i-2' in InstanceIds:
+                raise Exception('IncorrectInstanceState')
+            return {'StoppingInstances': [{'InstanceId': instance_id} for instance_id in InstanceIds]}
+
+        ec2.stop_instances.side_effect = stop_instances
+        with mock.patch.object(self.stop, 'ec2', ec2):
+            results = self.results(self.stop.lambda_handler({'instance_ids': ['i-1', 'i-2']}, None))
+
+        self.assertEqual(ec2.stop_instances.call_count, 3)
+        self.assertEqual(results['i-1']['action'], 'stopping')
+        self.assertEqual(results['i-2'], {
+            'previous_state': 'running', 'action': 'error', 'error': 'IncorrectInstanceState'
+        })
+
+
+class UserDataTests(SimpleTestCase):
+    def generate(self, users=None, **options):
+        return UserDataGenerator(mock.Mock()).generate_user_data(
+            admin_password='secret',
+            users=users or [{'username': 'u1', 'password_hash': '$6$salt$hash'}],
+            requirements_url='https://example.com/requirements.txt',
+            callback_url='https://example.com/ready/token/',
+            **options
+        )
+
+    def test_identical_input_gives_identical_bytes(self):
+        for bulk in (False, True):
+            self.assertEqual(self.generate(bulk=bulk), self.generate(bulk=bulk))
+        self.assertNotEqual(self.generate(), self.generate(prebaked=True))
+
+    def test_parts_are_split_on_the_boundary(self):
+        message = email.message_from_bytes(gzip.decompress(self.generate(bulk=True)))
+        self.assertEqual(
+            [part.get_content_type() for part in message.get_payload()],
+            ['text/cloud-config', 'text/x-shellscript']
+        )
+
+    def script(self, users, **options):
+        return UserDataGenerator(mock.Mock()).generate_full_script(
+            admin_password='secret',
+            users=users,
+            requirements_url='https://example.com/requirements.txt',
+            **options
+        )
+
+    def users(self, count=12):
+        # Zero-padded so no username is a prefix of another
+        return [{'username': f"user{n:02d}", 'password_hash': f"$6$salt{n}$hash{n}"} for n in range(count)]
+
+    def test_each_user_is_created_once(self):
+        users = self.users()
+        for prebaked in (False, True):
+            script = self.script(users, prebaked=prebaked)
+            for user in users:
+                self.assertEqual(script.count(f"sudo useradd -m -s /bin/bash {user['username']}\n"), 1)
+                self.assertEqual(script.count(f"echo '{user['username']}:{user['password_hash']}' | sudo chpasswd -e"), 1)
+                self.assertEqual(script.count(f'if id "{user["username"]}"'), 1)
+
+    def test_bulk_script_lists_each_user_once(self):
+        users = self.users()
+        lines = self.script(users, bulk=True).splitlines()
+        for user in users:
+            self.assertEqual(lines.count(f"{user['username']}:{user['password_hash']}::::/home/{user['username']}:/bin/bash"), 1)
+        self.assertEqual(lines.count(f"sudo newusers {BOOKING_USERS_FILE}"), 1)
+        self.assertEqual(lines.count(f"sudo cut -d: -f1,2 {BOOKING_USERS_FILE} | sudo chpasswd -e"), 1)
+
+    def test_bulk_user_data_writes_each_user_once(self):
+        users = self.users()
+        message = email.message_from_bytes(gzip.decompress(self.generate(users=users, bulk=True)))
+        cloud_config, script = (part.get_payload(decode=True).decode() for part in message.get_payload())
+        content = json.loads(cloud_config.split('\n', 1)[1])['write_files'][0]['content']
+        self.assertEqual(content.splitlines(), UserDataGenerator().generate_newusers_lines(users).splitlines())
+        # The script reads the users from the file cloud-init wrote
+        for user in users:
+            self.assertNotIn(user['username'], script)
+        self.assertIn(f"sudo newusers {BOOKING_USERS_FILE}", script)
+
+    def test_slim_script_skips_the_install(self):
+        full = self.script(self.users(2))
+        slim = self.script(self.users(2), prebaked=True)
+        for install in ('apt-get', 'bootstrap.py', 'python3-pip'):
+            self.assertIn(install, full)
+            self.assertNotIn(install, slim)
+        self.assertIn('sudo tljh-config reload', slim)
+
+    def test_bake_and_warm_scripts_have_no_users(self):
+        generator = UserDataGenerator(mock.Mock())
+        bake = generator.generate_bake_script('https://example.com/requirements.txt', admin_username='admin')
+        warm = generator.generate_warm_pool_script('https://example.com/requirements.txt', prebaked=True)
+        self.assertIn('--admin admin --user-requirements-txt-url https://example.com/requirements.txt', bake)
+        self.assertNotIn('apt-get', warm)
+        for script in (bake, warm):
+            self.assertNotIn('useradd', script)
+            self.assertNotIn('newusers', script)
+            self.assertTrue(script.rstrip().endswith('sudo shutdown -h now'))
+        self.assertEqual(
+            generator.generate_warm_pool_script('https://example.com/requirements.txt', admin_username='admin'), bake
+        )
+
+
+class UsersForVcpusTests(SimpleTestCase):
+    def test_matches_a_linear_search(self):
+        def linear(vcpus):
+            users = 0
+            while CapacityService.booking_demand(users + 1)[1] <= vcpus:
+                users += 1
+            return users
+
+        for vcpus in range(0, 130):
+            self.assertEqual(CapacityService.users_for_vcpus(vcpus), linear(vcpus), vcpus)
+
+
+class InstancePlannerTests(SimpleTestCase):
+    TYPES = ['t3.micro', 't3.small', 't3.xlarge']
+
+    def plan(self, users):
+        return InstancePlanner.plan(users, user_vcpus=0.5, user_memory_gib=0.4, instance_types=self.TYPES)
+
+    def test_capacity_is_bound_by_vcpus_and_memory(self):
+        self.assertEqual(InstancePlanner.capacity('t3.micro', 0.5, 0.4), 2)  # memory bound
+        self.assertEqual(InstancePlanner.capacity('t3.small', 0.5, 0.4), 4)  # vCPU bound
+        self.assertEqual(InstancePlanner.capacity('t3.unknown', 0.5, 0.4), 0)
+
+    def test_picks_the_cheapest_mix_and_spreads_users(self):
+        plan = self.plan(5)
+        self.assertEqual(
+            [(spec.instance_type, users) for spec, users in plan.instances],
+            [('t3.small', 3), ('t3.micro', 2)]
+        )
+        self.assertEqual(plan.users, 5)
+        self.assertEqual(plan.vcpus, 4)
+        self.assertEqual(self.plan(0).instances, [])
+
+    def test_plans_cost_no_more_than_any_other_mix(self):
+        specs = InstancePlanner.candidates(0.5, 0.4, self.TYPES)
+        overhead = config.placement.INSTANCE_OVERHEAD
+
+        def cheapest(users):
+            # Brute force over instance counts per type
+            best = None
+            for micro in range(users // 2 + 2):
+                for small in range(users // 4 + 2):
+                    for xlarge in range(users // 8 + 2):
+                        counts = (micro, small, xlarge)
+                        if sum(count * spec.capacity for count, spec in zip(counts, specs)) < users:
+                            continue
+                        cost = sum(count * (spec.hourly_price + overhead) for count, spec in zip(counts, specs))
+                        best = cost if best is None else min(best, cost)
+            return best
+
+        for users in range(1, 30):
+            plan = self.plan(users)
+            self.assertEqual(plan.users, users)
+            self.assertAlmostEqual(plan.hourly_cost + overhead * plan.instance_count, cheapest(users), places=6)
+            self.assertTrue(all(0 < count <= spec.capacity for spec, count in plan.instances))
+
+    def test_spread_takes_users_from_the_fullest_instance(self):
+        self.assertEqual(InstancePlanner._spread(8, [4, 4]), [4, 4])
+        self.assertEqual(InstancePlanner._spread(7, [4, 4]), [4, 3])
+        self.assertEqual(InstancePlanner._spread(5, [4, 4]), [3, 2])
+        self.assertEqual(InstancePlanner._spread(9, [8, 2]), [7, 2])
+
+    def test_falls_back_to_fixed_chunks_when_nothing_fits(self):
+        plan = InstancePlanner.plan(5, instance_types=['t3.unknown'])
+        per_instance = config.jupyter.DEFAULT_USERS_PER_INSTANCE
+        self.assertTrue(plan.fallback)
+        self.assertEqual(plan.users, 5)
+        self.assertEqual(plan.instance_count, -(-5 // per_instance))
+        self.assertEqual({spec.instance_type for spec, _ in plan.instances}, {config.aws.INSTANCE_TYPE})
+
+
+class CapacityServiceTests(TestCase):
+    def setUp(self):
+        limit = mock.patch.object(CapacityService, 'vcpu_limit', return_value=4)
+        limit.start()
+        self.addCleanup(limit.stop)
+        span = mock.patch.object(config.capacity, 'SLOTS_PER_BOOKING', 2)
+        span.start()
+        self.addCleanup(span.stop)
+        self.booking_time = CapacityService.slot_start(timezone.now() + timedelta(days=1))
+        # Four users fit on one 2-vCPU instance with the default limits
+        self.assertEqual(CapacityService.booking_demand(4), (1, 2))
+
+    def slot_vcpus(self):
+        return list(
+            SlotCapacity.objects
+            .filter(slot_start__in=CapacityService.booking_slots(self.booking_time))
+            .order_by('slot_start')
+            .values_list('vcpus', flat=True)
+        )
+
+    def test_reserve_until_the_slot_is_full_then_release(self):
+        first = make_booking(booking_time=self.booking_time, number_of_users=4)
+        second = make_booking(booking_time=self.booking_time, number_of_users=4)
+        third = make_booking(booking_time=self.booking_time, number_of_users=4)
+
+        CapacityService.reserve(first)
+        CapacityService.reserve(second)
+        self.assertEqual(self.slot_vcpus(), [4, 4])
+        self.assertEqual((second.reserved_instances, second.reserved_vcpus), (1, 2))
+
+        with self.assertRaises(CapacityError):
+            CapacityService.reserve(third)
+        self.assertEqual(self.slot_vcpus(), [4, 4])
+
+        CapacityService.release(first)
+        CapacityService.release(first)
+        self.assertEqual(self.slot_vcpus(), [2, 2])
+        first.refresh_from_db()
+        self.assertEqual((first.reserved_instances, first.reserved_vcpus), (0, 0))
+
+        CapacityService.reserve(third)
+        self.assertEqual(self.slot_vcpus(), [4, 4])
+
+    def test_overlapping_slots_count_against_each_other(self):
+        step = timedelta(minutes=config.capacity.SLOT_MINUTES)
+        CapacityService.reserve(make_booking(booking_time=self.booking_time, number_of_users=8))
+        later = make_booking(booking_time=self.booking_time + step, number_of_users=4)
+        # Its first slot is the earlier booking's second, which is full
+        with self.assertRaises(CapacityError):
+            CapacityService.reserve(later)
+
+    def test_booking_larger_than_the_limit_is_rejected(self):
+        booking = make_booking(booking_time=self.booking_time, number_of_users=20)
+        with self.assertRaisesMessage(CapacityError, f"limited to {CapacityService.max_users()} users"):
+            CapacityService.reserve(booking)
+
+
+@override_settings(PROVISIONING_MAX_ATTEMPTS=3, PROVISIONING_RETRY_BACKOFF=30)
+class ResumableProvisioningTests(TestCase):
+    def setUp(self):
+        self.booking = make_booking(number_of_users=6)
+        UserCredential.objects.bulk_create([
+            UserCredential(booking=self.booking, username=f"u{i}", password='$6$salt$hash') for i in range(6)
+        ])
+        patcher = mock.patch('aws_ec2.services.booking_service.EC2ServiceManager')
+        self.ec2_service = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        image = mock.patch.object(BookingService, 'resolve_image', return_value=('ami-1', True))
+        image.start()
+        self.addCleanup(image.stop)
+        self.failing = set()
+        self.ec2_service.launch_planned_instances.side_effect = self.launch
+
+    def launch(self, launches, adopt_tokens=None, **options):
+        results, failures = {}, {}
+        for launch in launches:
+            token = launch['client_token']
+            if launch['instance_type'] in self.failing:
+                failures[token] = Exception('InsufficientInstanceCapacity')
+                continue
+            instance = mock.Mock(
+                id=f"i-{token[-8:]}", public_dns_name='', state={'Name': 'pending'},
+                launch_time=timezone.now(), image_id='ami-1', instance_type=launch['instance_type']
+            )
+            results[token] = (instance, launch['users'], {'username': 'pawsey', 'password': launch['admin_password']})
+        return results, failures
+
+    def provision(self):
+        return BookingService.create_instances(
+            self.booking, list(self.booking.user_credentials.all()), wait_until_ready=False
+        )
+
+    def records(self):
+        return {record.instance_type: record for record in self.booking.provisioning_records.all()}
+
+    def test_failed_instance_is_retried_with_backoff_then_given_up(self):
+        # Six users are planned as a t3.small (4 users) and a t3.micro (2 users)
+        self.failing = {'t3.micro'}
+        started = timezone.now()
+        self.assertIsNotNone(self.provision())
+
+        records = self.records()
+        self.assertEqual(set(records), {'t3.small', 't3.micro'})
+        launched, failed = records['t3.small'], records['t3.micro']
+        self.assertEqual((launched.state, launched.admin_password_nonce), (ProvisioningRecord.State.LAUNCHED, ''))
+        self.assertEqual((failed.state, failed.attempts), (ProvisioningRecord.State.PENDING, 1))
+        self.assertAlmostEqual((failed.next_attempt_at - started).total_seconds(), 30, delta=5)
+        self.assertEqual(self.booking.ec2_instances.count(), 1)
+        self.assertFalse(Booking.objects.get(pk=self.booking.pk).ec2_instances_created)
+
+        with mock.patch('aws_ec2.tasks.create_scheduled_instances.apply_async') as requeue:
+            delay = BookingService.schedule_provisioning_retry(self.booking)
+        self.assertAlmostEqual(delay, 30, delta=5)
+        requeue.assert_called_once_with((self.booking.id,), countdown=delay)
+
+        # Not due yet: nothing is launched
+        self.ec2_service.launch_planned_instances.reset_mock()
+        self.provision()
+        self.ec2_service.launch_planned_instances.assert_not_called()
+
+        ProvisioningRecord.objects.filter(pk=failed.pk).update(next_attempt_at=timezone.now())
+        started = timezone.now()
+        self.provision()
+        failed.refresh_from_db()
+        self.assertEqual(failed.attempts, 2)
+        self.assertAlmostEqual((failed.next_attempt_at - started).total_seconds(), 60, delta=5)
+        # The retry first looks for an instance launched under the same token
+        self.assertEqual(self.ec2_service.launch_planned_instances.call_args.kwargs['adopt_tokens'], [failed.client_token])
+
+        ProvisioningRecord.objects.filter(pk=failed.pk).update(next_attempt_at=timezone.now())
+        self.provision()
+        failed.refresh_from_db()
+        self.assertEqual((failed.state, failed.attempts), (ProvisioningRecord.State.FAILED, 3))
+        self.assertIsNone(BookingService.schedule_provisioning_retry(self.booking))
+
+        # The booking goes ahead without the two users of the failed instance
+        self.booking.refresh_from_db()
+        self.assertTrue(self.booking.ec2_instances_created)
+        self.assertEqual(self.booking.provisioning_status, Booking.ProvisioningStatus.LAUNCHED)
+        self.assertEqual(self.booking.user_credentials.filter(ec2_instance__isnull=True).count(), 2)
+
+    def test_retry_launches_only_the_missing_instances(self):
+        self.failing = {'t3.micro'}
+        self.provision()
+        self.failing = set()
+        ProvisioningRecord.objects.filter(state=ProvisioningRecord.State.PENDING).update(next_attempt_at=timezone.now())
+        self.provision()
+
+        launches = self.ec2_service.launch_planned_instances.call_args.args[0]
+        self.assertEqual([launch['instance_type'] for launch in launches], ['t3.micro'])
+        self.assertEqual(self.booking.ec2_instances.count(), 2)
+        self.assertFalse(self.booking.user_credentials.filter(ec2_instance__isnull=True).exists())
+
+
+class InstancePollingTests(TestCase):
+    def manager(self, pages):
+        """An instance manager whose paginators return (or raise) ``pages[operation]`` call by call."""
+        paginators = {operation: mock.Mock(**{'paginate.side_effect': calls}) for operation, calls in pages.items()}
+        ec2 = mock.Mock()
+        ec2.meta.client.get_paginator.side_effect = paginators.get
+        with mock.patch('aws_ec2.ec2_utils.instance_manager.AWSClientRegistry'):
+            manager = EC2InstanceManager(ec2, mock.Mock(), mock.Mock())
+        return manager, paginators
+
+    @staticmethod
+    def reservations(*instances):
+        return [{'Reservations': [{'Instances': [
+            {'InstanceId': instance_id, 'State': {'Name': state}, 'PublicDnsName': f"{instance_id}.example.com"}
+            for instance_id, state in instances
+        ]}]}]
+
+    @staticmethod
+    def not_found(*instance_ids):
+        return ClientError({'Error': {
+            'Code': 'InvalidInstanceID.NotFound',
+            'Message': f"The instance IDs '{', '.join(instance_ids)}' do not exist"
+        }}, 'DescribeInstances')
+
+    def test_unknown_ids_are_pruned_and_the_rest_retried(self):
+        manager, paginators = self.manager({'describe_instances': [
+            self.not_found('i-0bb'),
+            self.not_found('i-0dd'),
+            self.reservations(('i-0aa', 'running'), ('i-0cc', 'pending')),
+        ]})
+        states = manager.describe_instance_states(['i-0aa', 'i-0bb', 'i-0cc', 'i-0dd', 'i-0aa'])
+
+        self.assertEqual(
+            [call.kwargs['InstanceIds'] for call in paginators['describe_instances'].paginate.call_args_list],
+            [['i-0aa', 'i-0bb', 'i-0cc', 'i-0dd'], ['i-0aa', 'i-0cc', 'i-0dd'], ['i-0aa', 'i-0cc']]
+        )
+        self.assertEqual(states, {
+            'i-0aa': {'state': 'running', 'public_dns': 'i-0aa.example.com'},
+            'i-0cc': {'state': 'pending', 'public_dns': 'i-0cc.example.com'},
+        })
+
+    def test_not_found_for_other_ids_is_raised(self):
+        manager, _ = self.manager({'describe_instances': [self.not_found('i-0ff')]})
+        with self.assertRaises(ClientError):
+            manager.describe_instance_states(['i-0aa'])
+
+    def test_status_checks_of_running_instances(self):
+        manager, paginators = self.manager({
+            'describe_instances': [self.reservations(('i-0aa', 'running'), ('i-0bb', 'running'), ('i-0cc', 'pending'))],
+            'describe_instance_status': [[{'InstanceStatuses': [
+                {'InstanceId': 'i-0aa', 'InstanceStatus': {'Status': 'ok'}, 'SystemStatus': {'Status': 'ok'}},
+                {'InstanceId': 'i-0bb', 'InstanceStatus': {'Status': 'initializing'}, 'SystemStatus': {'Status': 'ok'}},
+            ]}]],
+        })
+        states = manager.describe_instance_states(['i-0aa', 'i-0bb', 'i-0cc'], include_status=True)
+
+        paginators['describe_instance_status'].paginate.assert_called_once_with(InstanceIds=['i-0aa', 'i-0bb'])
+        self.assertEqual({instance_id: info['status_ok'] for instance_id, info in states.items()},
+                         {'i-0aa': True, 'i-0bb': False, 'i-0cc': False})
+
+    def test_booking_runs_once_every_instance_passes_its_status_checks(self):
+        booking = make_booking(provisioning_status=Booking.ProvisioningStatus.LAUNCHED, status_changed_at=timezone.now())
+        for instance_id in ('i-0aa', 'i-0bb'):
+            EC2Instance.objects.create(booking=booking, instance_id=instance_id, public_dns='', state='pending')
+        states = {
+            instance_id: {'state': 'running', 'public_dns': f"{instance_id}.example.com", 'status_ok': True}
+            for instance_id in ('i-0aa', 'i-0bb')
+        }
+        states['i-0bb']['status_ok'] = False
+
+        with mock.patch('aws_ec2.services.booking_service.EC2ServiceManager') as service:
+            describe = service.return_value.instance_manager.describe_instance_states
+            describe.return_value = states
+            self.assertEqual(BookingService.refresh_launched_instances(), [])
+            describe.assert_called_once_with(['i-0aa', 'i-0bb'], include_status=True)
+            self.assertEqual(
+                set(booking.ec2_instances.values_list('state', 'public_dns')),
+                {('running', 'i-0aa.example.com'), ('running', 'i-0bb.example.com')}
+            )
+            booking.refresh_from_db()
+            self.assertEqual(booking.provisioning_status, Booking.ProvisioningStatus.LAUNCHED)
+
+            states['i-0bb']['status_ok'] = True
+            self.assertEqual(BookingService.refresh_launched_instances(), [booking.id])
+        booking.refresh_from_db()
+        self.assertEqual(booking.provisioning_status, Booking.ProvisioningStatus.RUNNING)
+
+
+class AdvanceProvisioningTests(TestCase):
+    def setUp(self):
+        wait = mock.patch.object(BookingService, 'ready_wait_time', return_value=100)
+        wait.start()
+        self.addCleanup(wait.stop)
+
+    def running_booking(self, seconds_ago):
+        return make_booking(
+            provisioning_status=Booking.ProvisioningStatus.RUNNING,
+            status_changed_at=timezone.now() - timedelta(seconds=seconds_ago)
+        )
+
+    def test_running_booking_waits_out_the_ready_time(self):
+        booking = self.running_booking(10)
+        self.assertAlmostEqual(BookingService.advance_provisioning(booking), 90, delta=2)
+        self.assertEqual(booking.provisioning_status, Booking.ProvisioningStatus.RUNNING)
+
+    def test_running_booking_becomes_ready_after_the_wait(self):
+        booking = self.running_booking(101)
+        self.assertEqual(BookingService.advance_provisioning(booking), 0)
+        booking.refresh_from_db()
+        self.assertEqual(booking.provisioning_status, Booking.ProvisioningStatus.READY)
+
+    def test_notification_is_only_sent_once(self):
+        booking = make_booking(provisioning_status=Booking.ProvisioningStatus.READY)
+        stale = Booking.objects.get(pk=booking.pk)
+        with mock.patch('aws_ec2.services.booking_service.EmailService.send_instance_details') as send:
+            self.assertIsNone(BookingService.advance_provisioning(booking))
+            # A second worker still holding the READY booking
+            self.assertIsNone(BookingService.advance_provisioning(stale))
+        send.assert_called_once()
+
+    def test_task_reschedules_itself_until_done(self):
+        booking = self.running_booking(10)
+        with mock.patch('aws_ec2.tasks.advance_booking_provisioning.apply_async') as reschedule:
+            advance_booking_provisioning(booking.id)
+            countdown = reschedule.call_args.kwargs['countdown']
+            self.assertAlmostEqual(countdown, 90, delta=2)
+
+            Booking.objects.filter(pk=booking.pk).update(provisioning_status=Booking.ProvisioningStatus.NOTIFIED)
+            reschedule.reset_mock()
+            advance_booking_provisioning(booking.id)
+            reschedule.assert_not_called()
+
+
+@override_settings(
+    LEAD_TIME_PERCENTILE=90, LEAD_TIME_WINDOW=50, LEAD_TIME_MIN_SAMPLES=5,
+    LEAD_TIME_MARGIN=60, LEAD_TIME_DEFAULT=600, LEAD_TIME_MAX=1800
+)
+class LeadTimeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def add_samples(self, seconds, instance_count=1, ami_id='ami-1'):
+        ProvisioningDuration.objects.bulk_create([
+            ProvisioningDuration(
+                ami_id=ami_id, instance_type='t3.large', number_of_users=instance_count,
+                instance_count=instance_count, seconds=value
+            )
+            for value in seconds
+        ])
+
+    def test_default_without_samples(self):
+        self.assertEqual(LeadTimeService.bucket_lead_times('ami-1'), [600] * 6)
+
+    def test_default_with_too_few_samples(self):
+        self.add_samples([900] * 4)
+        self.add_samples([900] * 10, ami_id='ami-other')
+        stats = LeadTimeService.bucket_stats('ami-1')
+        self.assertEqual([bucket['lead_time'] for bucket in stats], [600] * 6)
+        self.assertEqual(stats[0]['source'], 'default')
+        self.assertEqual(stats[0]['samples'], 4)
+
+    def test_percentile_plus_margin(self):
+        self.add_samples(range(100, 1001, 100))
+        stats = LeadTimeService.bucket_stats('ami-1')
+        self.assertEqual(stats[0]['source'], 'bucket')
+        self.assertEqual(stats[0]['percentile'], 900)
+        self.assertEqual(stats[0]['lead_time'], 960)
+        # Larger buckets without samples of their own use all sizes
+        self.assertEqual(stats[1]['source'], 'all sizes')
+        self.assertEqual(stats[1]['lead_time'], 960)
+
+    def test_larger_bookings_use_their_own_bucket(self):
+        self.add_samples([300] * 5)
+        self.add_samples([1200] * 5, instance_count=5)
+        self.assertEqual(LeadTimeService.bucket_lead_times('ami-1')[:3], [360, 1260, 1260])
+
+    def test_lead_time_is_clamped(self):
+        self.add_samples([5000] * 5)
+        self.assertEqual(LeadTimeService.bucket_lead_times('ami-1'), [1800] * 6)
+
+    def test_lead_times_are_cached(self):
+        self.assertEqual(LeadTimeService.bucket_lead_times('ami-1')[0], 600)
+        self.add_samples([300] * 5)
+        self.assertEqual(LeadTimeService.bucket_lead_times('ami-1')[0], 600)
+        cache.clear()
+        self.assertEqual(LeadTimeService.bucket_lead_times('ami-1')[0], 360)
+
+
+@override_settings(BOOKING_DISPATCH_MAX_DELAY=3600, BOOKING_REDISPATCH_AFTER=600)
+class DispatchTests(TestCase):
+    LEAD_TIMES = [600, 600, 1200, 1200, 1800, 1800]
+
+    def setUp(self):
+        patchers = [
+            mock.patch.object(BookingService, 'resolve_image', return_value=('ami-1', False)),
+            mock.patch.object(LeadTimeService, 'bucket_lead_times', return_value=self.LEAD_TIMES),
+            mock.patch.object(AWSThrottle, 'breaker_open', return_value=False),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        delay = mock.patch('aws_ec2.tasks.create_scheduled_instances.delay')
+        self.delay = delay.start()
+        self.addCleanup(delay.stop)
+
+    def booking_in(self, seconds, **fields):
+        return make_booking(booking_time=timezone.now() + timedelta(seconds=seconds), **fields)
+
+    def dispatch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatched = BookingService.dispatch_due_bookings()
+        return dispatched
+
+    def dispatched_ids(self):
+        return sorted(call.args[0] for call in self.delay.call_args_list)
+
+    def test_bookings_within_their_lead_time_are_dispatched(self):
+        due = self.booking_in(300)
+        late = self.booking_in(-1800)
+        large = self.booking_in(1000, reserved_instances=4)
+        self.assertEqual(self.dispatch(), 3)
+        self.assertEqual(self.dispatched_ids(), sorted([due.id, late.id, large.id]))
+        due.refresh_from_db()
+        self.assertIsNotNone(due.dispatched_at)
+
+    def test_future_bookings_are_left_alone(self):
+        small = self.booking_in(1000)
+        later = self.booking_in(7200, reserved_instances=32)
+        expired = self.booking_in(-7200)
+        self.assertEqual(self.dispatch(), 0)
+        self.delay.assert_not_called()
+        for booking in (small, later, expired):
+            booking.refresh_from_db()
+            self.assertIsNone(booking.dispatched_at)
+
+    def test_bookings_are_dispatched_once(self):
+        booking = self.booking_in(300)
+        launched = self.booking_in(300, ec2_instances_created=True)
+        failed = self.booking_in(300, provisioning_status=Booking.ProvisioningStatus.FAILED)
+        self.assertEqual(self.dispatch(), 1)
+        self.assertEqual(self.dispatch(), 0)
+        self.assertEqual(self.dispatched_ids(), [booking.id])
+        for booking in (launched, failed):
+            booking.refresh_from_db()
+            self.assertIsNone(booking.dispatched_at)
+
+    def test_lost_dispatch_is_retried(self):
+        booking = self.booking_in(300, dispatched_at=timezone.now() - timedelta(seconds=601))
+        recent = self.booking_in(300, dispatched_at=timezone.now() - timedelta(seconds=60))
+        self.assertEqual(self.dispatch(), 1)
+        self.assertEqual(self.dispatched_ids(), [booking.id])
+        recent.refresh_from_db()
+        self.assertLess(timezone.now() - recent.dispatched_at, timedelta(seconds=61))
+
+    def test_deferred_booking_is_dispatched_again(self):
+        booking = self.booking_in(300)
+        self.dispatch()
+        booking.refresh_from_db()
+        BookingService.defer_dispatch(booking)
+        self.assertIsNone(booking.dispatched_at)
+        self.assertEqual(self.dispatch(), 1)
+        self.assertEqual(self.dispatched_ids(), [booking.id, booking.id])
+
+    def test_defer_leaves_launched_bookings_alone(self):
+        booking = self.booking_in(300)
+        self.dispatch()
+        Booking.objects.filter(pk=booking.pk).update(ec2_instances_created=True)
+        BookingService.defer_dispatch(booking)
+        booking.refresh_from_db()
+        self.assertIsNotNone(booking.dispatched_at)
+
+    def test_claims_are_batched(self):
+        bookings = [self.booking_in(300) for _ in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(BookingService.dispatch_due_bookings(batch_size=2, max_batches=2), 4)
+        self.assertEqual(Booking.objects.filter(dispatched_at__isnull=True).count(), 1)
+        self.assertEqual(self.dispatch(), 1)
+        self.assertEqual(len(self.dispatched_ids()), len(bookings))
+
+    def test_nothing_is_dispatched_while_the_breaker_is_open(self):
+        self.booking_in(300)
+        with mock.patch.object(AWSThrottle, 'breaker_open', return_value=True):
+            self.assertEqual(self.dispatch(), 0)
+        self.delay.assert_not_called()
+
+
+@override_settings(RECONCILE_GRACE=900)
+class ReconcileTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('aws_ec2.services.reconcile_service.EC2ServiceManager')
+        self.manager = patcher.start().return_value.instance_manager
+        self.addCleanup(patcher.stop)
+        regions = mock.patch.object(config.aws, 'RECONCILE_REGIONS', 'ap-southeast-2')
+        regions.start()
+        self.addCleanup(regions.stop)
+
+        self.now = timezone.now()
+        self.old = self.now - timedelta(hours=1)
+        self.active = make_booking(booking_time=self.now)
+        self.ended = make_booking(booking_time=self.now - timedelta(days=2))
+        self.swept = []
+        self.manager.describe_tagged_instances.side_effect = lambda tags, region: list(self.swept)
+        self.manager.describe_instance_states.return_value = {}
+
+    def row(self, instance_id, booking, launched_at, state='running'):
+        return EC2Instance.objects.create(
+            booking=booking, instance_id=instance_id, public_dns='', state=state, launched_at=launched_at
+        )
+
+    def ec2(self, instance_id, state='running', launch_time=None, client_token='', **tags):
+        info = {
+            'instance_id': instance_id, 'state': state, 'public_dns': f"{instance_id}.example",
+            'instance_type': 't3.small', 'launch_time': launch_time or self.old,
+            'client_token': client_token, 'tags': tags
+        }
+        self.swept.append(info)
+        return info
+
+    def candidates(self):
+        return {
+            candidate.instance_id: candidate.reason
+            for candidate in CleanupCandidate.objects.filter(resolved_at__isnull=True)
+        }
+
+    def test_classifies_orphans_zombies_and_gone_rows(self):
+        self.row('i-live', self.active, self.old, state='pending')
+        self.ec2('i-live')
+        self.row('i-zombie', self.ended, self.old)
+        self.ec2('i-zombie')
+        self.row('i-gone', self.active, self.old)
+        self.row('i-just-launched', self.active, self.now)
+
+        self.ec2('i-orphan', BookingId=str(self.active.id))
+        self.ec2('i-young', launch_time=self.now)
+        self.ec2('i-stopped-dead', state='terminated')
+        self.ec2('i-bake', Purpose='ami-bake')
+        WarmPoolInstance.objects.create(instance_id='i-pool', fingerprint='f', ami_id='ami-1', instance_type='t3.small')
+        self.ec2('i-pool')
+        ProvisioningRecord.objects.create(
+            booking=self.active, position=1, client_token='token-1', instance_type='t3.small'
+        )
+        self.ec2('i-adoptable', client_token='token-1')
+
+        stats = ReconcileService.reconcile()
+
+        self.assertEqual(self.candidates(), {
+            'i-orphan': CleanupCandidate.Reason.ORPHAN,
+            'i-zombie': CleanupCandidate.Reason.ZOMBIE,
+        })
+        self.assertEqual(CleanupCandidate.objects.get(instance_id='i-orphan').booking_id, self.active.id)
+        # i-live's state and i-zombie's DNS name changed
+        self.assertEqual((stats['orphans'], stats['zombies'], stats['gone'], stats['updated']), (1, 1, 1, 2))
+
+        states = dict(EC2Instance.objects.values_list('instance_id', 'state'))
+        self.assertEqual(states['i-live'], 'running')
+        self.assertEqual(states['i-gone'], 'terminated')
+        self.assertEqual(states['i-just-launched'], 'running')
+        self.assertEqual(EC2Instance.objects.get(instance_id='i-live').public_dns, 'i-live.example')
+
+    def test_untagged_rows_are_tagged_not_judged_gone(self):
+        self.row('i-legacy', self.active, self.old)
+        self.manager.describe_instance_states.return_value = {
+            'i-legacy': {'instance_id': 'i-legacy', 'state': 'running', 'public_dns': 'legacy.example'}
+        }
+
+        stats = ReconcileService.reconcile()
+
+        self.assertEqual((stats['tagged'], stats['gone']), (1, 0))
+        self.manager.tag_instances.assert_called_once_with(
+            ['i-legacy'], {**config.tagging.DEFAULT_TAGS, 'BookingId': str(self.active.id)}
+        )
+        self.assertEqual(EC2Instance.objects.get(instance_id='i-legacy').public_dns, 'legacy.example')
+
+    def test_candidates_are_resolved_once_gone(self):
+        self.ec2('i-orphan')
+        self.row('i-zombie', self.ended, self.old)
+        self.ec2('i-zombie')
+        ReconcileService.reconcile()
+
+        self.swept = [info for info in self.swept if info['instance_id'] != 'i-orphan']
+        stats = ReconcileService.reconcile()
+
+        self.assertEqual(stats['resolved'], 1)
+        self.assertEqual(self.candidates(), {'i-zombie': CleanupCandidate.Reason.ZOMBIE})
+        self.assertEqual(CleanupCandidate.objects.get(instance_id='i-orphan').resolution, 'gone')
+        self.assertEqual(CleanupCandidate.objects.filter(instance_id='i-zombie').count(), 1)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_OUTBOX_BATCH_SIZE=50,
+    EMAIL_RATE_LIMIT_PER_MINUTE=60,
+    EMAIL_MAX_ATTEMPTS=3,
+    EMAIL_RETRY_BACKOFF=60
+)
+class EmailOutboxTests(TestCase):
+    def queue(self, count, **fields):
+        with mock.patch('aws_ec2.tasks.deliver_email_outbox.delay'):
+            return [
+                EmailService.enqueue(f"user{i}@example.com", 'Subject', f"Password: secret{i}", **fields)
+                for i in range(count)
+            ]
+
+    def test_batch_is_sent_over_one_connection(self):
+        queued = self.queue(3)
+        with mock.patch(
+            'aws_ec2.services.email_service.get_connection', wraps=mail.get_connection
+        ) as get_connection:
+            stats = EmailService.deliver_outbox()
+
+        get_connection.assert_called_once()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [outbox_email.to_email for outbox_email in queued])
+        self.assertEqual((stats['sent'], stats['remaining']), (3, 0))
+        self.assertIsNotNone(stats['latency_p50'])
+        for outbox_email in EmailOutbox.objects.all():
+            self.assertEqual((outbox_email.status, outbox_email.body, outbox_email.attempts), (EmailOutbox.Status.SENT, '', 1))
+
+    def test_failed_send_is_retried_with_backoff(self):
+        failing, sent = self.queue(2)
+        real_send = LocmemBackend.send_messages
+
+        def send_messages(backend, messages):
+            if messages[0].to == [failing.to_email]:
+                raise ConnectionResetError('connection reset')
+            return real_send(backend, messages)
+
+        for attempt, backoff in ((1, 60), (2, 120)):
+            EmailOutbox.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+            started = timezone.now()
+            with mock.patch.object(LocmemBackend, 'send_messages', send_messages):
+                EmailService.deliver_outbox()
+            failing.refresh_from_db()
+            self.assertEqual((failing.status, failing.attempts), (EmailOutbox.Status.PENDING, attempt))
+            self.assertAlmostEqual((failing.next_attempt_at - started).total_seconds(), backoff, delta=5)
+            self.assertIn('connection reset', failing.last_error)
+        self.assertEqual(EmailOutbox.objects.get(pk=sent.pk).status, EmailOutbox.Status.SENT)
+
+        # The third attempt is the last one
+        EmailOutbox.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+        with mock.patch.object(LocmemBackend, 'send_messages', send_messages):
+            stats = EmailService.deliver_outbox()
+        failing.refresh_from_db()
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual((failing.status, failing.attempts, failing.body), (EmailOutbox.Status.FAILED, 3, ''))
+
+    def test_quota_returns_early(self):
+        self.queue(2)
+        EmailOutbox.objects.create(
+            to_email='earlier@example.com', subject='Subject', body='',
+            status=EmailOutbox.Status.SENT, sent_at=timezone.now()
+        )
+        with override_settings(EMAIL_RATE_LIMIT_PER_MINUTE=2):
+            stats = EmailService.deliver_outbox()
+            self.assertEqual((stats['sent'], stats['remaining']), (1, 1))
+            stats = EmailService.deliver_outbox()
+        self.assertEqual((stats['sent'], stats['remaining']), (0, 1))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_connection_failure_retries_the_whole_batch(self):
+        queued = self.queue(2)
+        with mock.patch.object(LocmemBackend, 'open', side_effect=OSError('SMTP down')):
+            stats = EmailService.deliver_outbox()
+        self.assertEqual((stats['sent'], stats['retried']), (0, 2))
+        for outbox_email in EmailOutbox.objects.filter(pk__in=[queued_email.pk for queued_email in queued]):
+            self.assertEqual((outbox_email.status, outbox_email.attempts), (EmailOutbox.Status.PENDING, 1))
+            self.assertIsNotNone(outbox_email.claimed_at)
+            self.assertGreater(outbox_email.next_attempt_at, timezone.now())
+
+    def test_purge_keeps_recent_and_pending_rows(self):
+        old = timezone.now() - timedelta(days=31)
+        for status in (EmailOutbox.Status.SENT, EmailOutbox.Status.FAILED, EmailOutbox.Status.PENDING):
+            EmailOutbox.objects.create(to_email='a@example.com', subject='s', body='', status=status, created_at=old)
+        EmailOutbox.objects.create(to_email='a@example.com', subject='s', body='', status=EmailOutbox.Status.SENT)
+
+        self.assertEqual(EmailService.purge_outbox(retention_days=30), 2)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
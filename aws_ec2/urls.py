@@ -6,5 +6,8 @@ app_name = 'aws_ec2'  # Namespace for the booking app
 
 urlpatterns = [
     path('register/', views.register, name='register'),  # Path for the registration form
+    path('availability/', views.availability, name='availability'),  # Free capacity per slot, as JSON
+    path('bookings/<str:token>/', views.booking_status, name='booking_status'),  # Booking status page
+    path('instances/ready/<str:token>/', views.instance_ready, name='instance_ready'),  # Instance readiness callback
 ]
 
@@ -1,15 +1,21 @@
 # aws_ec2/views.py
-from django.shortcuts import render
+from datetime import datetime, time, timedelta
+from django.shortcuts import get_object_or_404, render
 from django.db import transaction
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET, require_POST
 from .models import Booking
+from .ec2_utils.config import config
 from .forms import BookingForm
-from .services.email_service import EmailService
 from .services.booking_service import BookingService
+from .services.capacity_service import CapacityError, CapacityService
 from .services.logging_service import LoggingService
 
 logger = LoggingService.get_logger("booking_views")
 
-@transaction.atomic
 def register(request):
     if request.method == 'POST':
         form = BookingForm(request.POST)
@@ -21,33 +27,118 @@ def register(request):
                 
                 logger.info(f"Processing registration for email: {email}, users: {number_of_users}")
                 
-                booking = Booking.objects.create(
-                    email=email,
-                    booking_time=booking_time,
-                    number_of_users=number_of_users
-                )
-                
-                credentials = BookingService.create_user_credentials(booking, number_of_users)
-                EmailService.send_initial_confirmation(email, booking_time, credentials)
-                
-                # Schedule instance creation instead of immediate creation
-                if BookingService.schedule_instance_creation(booking):
-                    logger.info(f"Successfully scheduled instance creation for booking {booking.id}")
-                else:
-                    logger.error(f"Failed to schedule instance creation for booking {booking.id}")
-                    form.add_error(None, "Failed to schedule instance creation. Please try again later.")
-                    return render(request, 'aws_ec2/register.html', {'form': form})
+                # Only persist here; the confirmation email and the provisioning
+                # dispatch are queued to run once the booking is committed
+                with transaction.atomic():
+                    booking = Booking.objects.create(
+                        email=email,
+                        booking_time=booking_time,
+                        number_of_users=number_of_users
+                    )
+                    # Re-checked under lock, the slot may have filled up since validation
+                    CapacityService.reserve(booking)
+                    credentials = BookingService.create_user_credentials(booking, number_of_users)
+                    BookingService.enqueue_registration_work(booking, credentials)
+
+                logger.info(f"Registered booking {booking.id}")
                 
                 return render(request, 'aws_ec2/registration_success.html', {
                     'email': email,
                     'booking_time': booking_time,
                     'credentials': credentials,
+                    'booking': booking,
+                    'status_url': BookingService.get_status_url(booking),
                 })
                 
+            except CapacityError as e:
+                logger.info(f"Turned away booking for {email}: {str(e)}")
+                form.add_error(None, str(e))
             except Exception as e:
                 logger.error(f"Error processing booking: {str(e)}", exc_info=True)
                 form.add_error(None, f"There was an error processing your booking: {str(e)}")
     else:
         form = BookingForm()
     
-    return render(request, 'aws_ec2/register.html', {'form': form})
\ No newline at end of file
+    return render(request, 'aws_ec2/register.html', {'form': form})
+
+
+def booking_status(request, token):
+    """
+    Shows a booking's provisioning status. The signed token in the URL is
+    the only way to reach it, so credentials are never shown here.
+    """
+    booking_id = BookingService.booking_id_from_status_token(token)
+    if booking_id is None:
+        raise Http404("Unknown booking")
+
+    booking = get_object_or_404(Booking, id=booking_id)
+    finished = booking.provisioning_status in (
+        Booking.ProvisioningStatus.NOTIFIED,
+        Booking.ProvisioningStatus.FAILED
+    )
+    return render(request, 'aws_ec2/booking_status.html', {
+        'booking': booking,
+        'instances': booking.ec2_instances.all() if finished else [],
+        'finished': finished,
+    })
+
+@require_GET
+def availability(request):
+    """
+    Free capacity per booking slot for one day, as JSON.
+
+    Query parameters:
+        date: Day to list (YYYY-MM-DD, local time), defaults to today
+        users: If given, each slot also says whether that many users fit
+    """
+    try:
+        day = parse_date(request.GET['date']) if 'date' in request.GET else timezone.localdate()
+        users = int(request.GET['users']) if 'users' in request.GET else None
+    except ValueError:
+        day = None
+    if day is None or (users is not None and users < 1):
+        return HttpResponseBadRequest("date must be YYYY-MM-DD and users a positive number")
+
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    slots = CapacityService.availability(start, start + timedelta(days=1))
+    if users is not None:
+        for slot in slots:
+            slot['available'] = slot['free_users'] >= users
+
+    return JsonResponse({
+        'date': day.isoformat(),
+        'slot_minutes': config.capacity.SLOT_MINUTES,
+        'vcpu_limit': CapacityService.vcpu_limit(),
+        'max_users': CapacityService.max_users(),
+        'slots': slots,
+    })
+
+@csrf_exempt
+@require_POST
+def instance_ready(request, token):
+    """
+    Readiness callback called by each instance at the end of its user data
+    script. Sends the access email as soon as the last instance reports in.
+
+    Answers 409 while the instance has no row yet, so the script's
+    ``curl -sf`` retries instead of taking the callback as delivered.
+    """
+    from .tasks import advance_booking_provisioning
+
+    booking_id = BookingService.booking_id_from_ready_token(token)
+    if booking_id is None:
+        logger.warning("Rejected readiness callback with an invalid token")
+        return HttpResponseForbidden()
+
+    instance_id = request.POST.get('instance_id', '')
+    if not instance_id:
+        return HttpResponseBadRequest("instance_id is required")
+
+    with LoggingService.context(booking_id=booking_id):
+        booking_ready = BookingService.mark_instance_ready(booking_id, instance_id, request.POST.get('public_dns', ''))
+    if booking_ready is None:
+        return JsonResponse({'status': 'unknown instance'}, status=409)
+    if booking_ready:
+        advance_booking_provisioning.delay(booking_id)
+
+    return JsonResponse({'status': 'ok'})
@@ -63,6 +63,16 @@ DATABASES = {
     }
 }
 
+# Django's defaults, plus the SHA-512 crypt hasher used for booking credentials
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'aws_ec2.hashers.SHA512CryptPasswordHasher',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -86,6 +96,13 @@ AUTHENTICATION_BACKENDS = (
     'allauth.account.auth_backends.AuthenticationBackend',
 )
 
+# Externally reachable base URL (e.g. https://booking.example.org) used by
+# instances to report readiness. Leave empty to fall back to a fixed wait.
+PUBLIC_BASE_URL = config('PUBLIC_BASE_URL', default='')
+
+# Processes used to hash credential passwords for large bookings (0 = one per CPU)
+CREDENTIAL_HASH_WORKERS = config('CREDENTIAL_HASH_WORKERS', default=0, cast=int)
+
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY')
 AWS_DEFAULT_REGION = config('AWS_DEFAULT_REGION')
@@ -105,10 +122,73 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 # DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Email outbox delivery (see EmailService.deliver_outbox)
+EMAIL_OUTBOX_BATCH_SIZE = config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+EMAIL_RATE_LIMIT_PER_MINUTE = config('EMAIL_RATE_LIMIT_PER_MINUTE', default=60, cast=int)  # provider quota
+EMAIL_MAX_ATTEMPTS = config('EMAIL_MAX_ATTEMPTS', default=6, cast=int)
+EMAIL_RETRY_BACKOFF = config('EMAIL_RETRY_BACKOFF', default=60, cast=int)  # seconds, doubled per attempt
+EMAIL_SEND_LEASE = config('EMAIL_SEND_LEASE', default=300, cast=int)  # seconds a claimed batch has to be sent
+EMAIL_OUTBOX_RETENTION_DAYS = config('EMAIL_OUTBOX_RETENTION_DAYS', default=30, cast=int)  # sent and failed rows
+
+# Booking dispatcher: due bookings are claimed from the database and queued in batches
+BOOKING_DISPATCH_INTERVAL = config('BOOKING_DISPATCH_INTERVAL', default=30, cast=float)  # seconds
+BOOKING_DISPATCH_BATCH_SIZE = config('BOOKING_DISPATCH_BATCH_SIZE', default=100, cast=int)
+BOOKING_DISPATCH_MAX_BATCHES = config('BOOKING_DISPATCH_MAX_BATCHES', default=20, cast=int)  # per run
+BOOKING_REDISPATCH_AFTER = config('BOOKING_REDISPATCH_AFTER', default=600, cast=int)  # seconds without a launch
+BOOKING_DISPATCH_MAX_DELAY = config('BOOKING_DISPATCH_MAX_DELAY', default=3600, cast=int)  # give up on older bookings
+
+# Provisioning lead time: bookings are dispatched this long before their start,
+# from a rolling percentile of measured launch-to-ready times (see LeadTimeService)
+LEAD_TIME_PERCENTILE = config('LEAD_TIME_PERCENTILE', default=90, cast=float)
+LEAD_TIME_WINDOW = config('LEAD_TIME_WINDOW', default=50, cast=int)  # most recent samples per bucket
+LEAD_TIME_MIN_SAMPLES = config('LEAD_TIME_MIN_SAMPLES', default=5, cast=int)
+LEAD_TIME_MARGIN = config('LEAD_TIME_MARGIN', default=60, cast=int)  # seconds added to the percentile
+LEAD_TIME_DEFAULT = config('LEAD_TIME_DEFAULT', default=600, cast=int)  # seconds, until there are samples
+LEAD_TIME_MAX = config('LEAD_TIME_MAX', default=1800, cast=int)  # seconds
+
+# Per-instance provisioning retries (see ProvisioningRecord)
+PROVISIONING_MAX_ATTEMPTS = config('PROVISIONING_MAX_ATTEMPTS', default=3, cast=int)  # per instance
+PROVISIONING_RETRY_BACKOFF = config('PROVISIONING_RETRY_BACKOFF', default=30, cast=int)  # seconds, doubled per attempt
+PROVISIONING_LEASE = config('PROVISIONING_LEASE', default=900, cast=int)  # seconds before a stuck attempt is retried
+
+# Reconciler: tag-filtered sweep of EC2 synced into EC2Instance rows, flags orphans and zombies
+RECONCILE_INTERVAL = config('RECONCILE_INTERVAL', default=300, cast=int)  # seconds
+RECONCILE_GRACE = config('RECONCILE_GRACE', default=900, cast=int)  # seconds before an instance is judged
+
 #celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/0'  # Replace with your broker URL
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'  # Replace with your result backend
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = config('TIME_ZONE')
\ No newline at end of file
+CELERY_TIMEZONE = config('TIME_ZONE')
+CELERY_BEAT_SCHEDULE = {
+    'poll-instance-states': {
+        'task': 'aws_ec2.tasks.poll_instance_states',
+        'schedule': config('INSTANCE_STATE_POLL_INTERVAL', default=15, cast=float),
+    },
+    'sweep-shutdown-schedules': {
+        'task': 'aws_ec2.tasks.sweep_shutdown_schedules',
+        'schedule': 15 * 60,
+    },
+    'dispatch-due-bookings': {
+        'task': 'aws_ec2.tasks.dispatch_due_bookings',
+        'schedule': BOOKING_DISPATCH_INTERVAL,
+    },
+    'reconcile-instances': {
+        'task': 'aws_ec2.tasks.reconcile_instances',
+        'schedule': RECONCILE_INTERVAL,
+    },
+    'refill-warm-pool': {
+        'task': 'aws_ec2.tasks.refill_warm_pool',
+        'schedule': 5 * 60,
+    },
+    'deliver-email-outbox': {
+        'task': 'aws_ec2.tasks.deliver_email_outbox',
+        'schedule': 30,
+    },
+    'purge-email-outbox': {
+        'task': 'aws_ec2.tasks.purge_email_outbox',
+        'schedule': 24 * 60 * 60,
+    },
+}